@@ -0,0 +1,138 @@
+"""
+Асинхронная запись перевалов для ASGI: psycopg 3 и AsyncConnectionPool.
+
+Запрос тот же, что и у PerevalDataProcessor (SUBMIT_PEREVAL_QUERY, один
+атомарный оператор в автокоммите), поэтому транзакционное поведение
+совпадает; отличается только то, что ожидание БД не занимает поток.
+Сохранение изображений в BlobStore - файловый ввод-вывод - выполняется в
+пуле потоков. psycopg и psycopg_pool - необязательные зависимости:
+без них асинхронный путь отвечает ошибкой, остальное приложение работает.
+"""
+import asyncio
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .data_processor import (
+    SUBMIT_PEREVAL_QUERY, WARM_LEVELS_QUERY, PerevalDataProcessor, level_id_cache, level_key, user_id_cache,
+)
+from .db_pool import libpq_params
+from .metrics import span
+from .thumbnails import schedule_renditions
+
+try:
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    psycopg = None
+    AsyncConnectionPool = None
+
+logger = logging.getLogger(__name__)
+
+# Пул привязан к циклу событий, поэтому у каждого цикла свой
+_pools = weakref.WeakKeyDictionary()
+
+
+def _conninfo(alias):
+    from django.db import connections
+    return psycopg.conninfo.make_conninfo(**libpq_params(connections[alias].get_connection_params()))
+
+
+async def get_async_pool(alias='default'):
+    """Открытый асинхронный пул соединений БД alias для текущего цикла событий"""
+    if AsyncConnectionPool is None:
+        raise ImproperlyConfigured("Async submit path requires the psycopg and psycopg_pool packages")
+
+    loop = asyncio.get_running_loop()
+    pools = _pools.setdefault(loop, {})
+    pool = pools.get(alias)
+    if pool is None:
+        options = getattr(settings, 'DB_POOL', {})
+        pool = AsyncConnectionPool(
+            _conninfo(alias),
+            min_size=1,
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 30.0),
+            kwargs={'autocommit': True},
+            open=False,
+        )
+        pools[alias] = pool
+        await pool.open()
+    return pool
+
+
+class AsyncPerevalDataProcessor:
+    """Асинхронный вариант PerevalDataProcessor.submit_data"""
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.sync = PerevalDataProcessor()
+
+    async def _warm_level_cache(self, cursor):
+        await cursor.execute(WARM_LEVELS_QUERY, (level_id_cache.max_size,))
+        for level_id, *seasons in await cursor.fetchall():
+            level_id_cache.set(tuple(seasons), level_id)
+        level_id_cache.warmed = True
+
+    async def _execute_submit(self, cursor, params):
+        if not level_id_cache.warmed:
+            await self._warm_level_cache(cursor)
+            if params['level_id'] is None:
+                params = {**params, 'level_id': level_id_cache.get(level_key(params))}
+        try:
+            await cursor.execute(SUBMIT_PEREVAL_QUERY, params)
+        except psycopg.errors.ForeignKeyViolation:
+            if params['user_id'] is None and params['level_id'] is None:
+                raise
+            # Пользователь или уровень из кэша удален - повторяем с upsert
+            user_id_cache.discard(params['email'])
+            level_id_cache.discard(level_key(params))
+            params = {**params, 'user_id': None, 'level_id': None}
+            await cursor.execute(SUBMIT_PEREVAL_QUERY, params)
+        pereval_id, user_id, level_id = await cursor.fetchone()
+        user_id_cache.set(params['email'], user_id)
+        level_id_cache.set(level_key(params), level_id)
+        return pereval_id
+
+    async def submit_data(self, data):
+        """Добавление перевала; ответ в том же формате, что у PerevalDataProcessor"""
+        error = self.sync._check_required(data)
+        if error is not None:
+            return error
+
+        try:
+            params = await sync_to_async(self.sync._submit_params, thread_sensitive=False)(data, data['user'])
+        except ValueError as e:
+            return {
+                "status": 400,
+                "message": str(e),
+                "id": None
+            }
+
+        try:
+            pool = await get_async_pool(self.alias)
+            async with pool.connection() as conn:
+                async with conn.cursor() as cursor:
+                    with span('insert'):
+                        pereval_id = await self._execute_submit(cursor, params)
+
+            # Как и в синхронном пути - после фиксации записи; запуск пула
+            # процессов миниатюр не должен занимать цикл событий
+            await sync_to_async(schedule_renditions, thread_sensitive=False)(params['image_sha256'])
+
+            return {
+                "status": 200,
+                "message": "Отправлено успешно",
+                "id": pereval_id
+            }
+
+        except Exception as e:
+            logger.error(f"Error submitting data: {e}")
+            return {
+                "status": 500,
+                "message": f"Ошибка при выполнении операции: {str(e)}",
+                "id": None
+            }
@@ -0,0 +1,82 @@
+"""
+Бенчмарки производительности pereval_app.
+
+Запуск: python manage.py benchmark <имя> [<имя> ...]
+        [--output results.json] [--baseline previous.json]
+
+Результаты с --output сохраняются в JSON; с --baseline медианы сравниваются
+с прошлым запуском, и команда завершается ошибкой при замедлении больше
+допустимого (--tolerance).
+"""
+import statistics
+import time
+
+# Имя бенчмарка -> модуль с функцией run(options), возвращающей список результатов
+BENCHMARKS = {
+    'concurrent_submits': 'pereval_app.benchmarks.concurrent_submits',
+    'image_inserts': 'pereval_app.benchmarks.image_inserts',
+    'image_validation': 'pereval_app.benchmarks.image_validation',
+    'moderation_queue': 'pereval_app.benchmarks.moderation_queue',
+    'partitions': 'pereval_app.benchmarks.partitions',
+    'processor': 'pereval_app.benchmarks.processor',
+    'repository': 'pereval_app.benchmarks.repository',
+    'serializer_validation': 'pereval_app.benchmarks.serializer_validation',
+    'submit_load': 'pereval_app.benchmarks.submit_load',
+}
+
+# Поля результата, которые являются измерениями; остальные описывают случай
+MEASUREMENT_KEYS = frozenset({
+    'min_ms', 'median_ms', 'mean_ms', 'repeat', 'wall_ms', 'ok', 'failed', 'errors',
+    'users_created', 'passed', 'requests', 'seconds', 'rps', 'p50_ms', 'p95_ms', 'p99_ms',
+})
+
+# Сравниваемая при поиске регрессий задержка (первое найденное поле)
+LATENCY_KEYS = ('median_ms', 'p50_ms', 'wall_ms')
+
+
+def measure(func, repeat, setup=None):
+    """
+    Запускает func repeat раз и возвращает статистику времени в миллисекундах.
+
+    setup вызывается перед каждым запуском и в замер не входит
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'repeat': repeat,
+    }
+
+
+def case_key(result):
+    """Описание случая без измерений - по нему сопоставляются запуски"""
+    return tuple(sorted((key, value) for key, value in result.items() if key not in MEASUREMENT_KEYS))
+
+
+def compare(current, baseline, tolerance):
+    """
+    Сравнивает результаты двух запусков ({бенчмарк: [результаты]}).
+
+    Возвращает список замедлений больше чем в 1 + tolerance раз:
+    (бенчмарк, описание случая, поле, было, стало).
+    """
+    regressions = []
+    for name, results in current.items():
+        previous = {case_key(result): result for result in baseline.get(name, [])}
+        for result in results:
+            before = previous.get(case_key(result))
+            if before is None:
+                continue
+            for key in LATENCY_KEYS:
+                if result.get(key) is not None and before.get(key):
+                    if result[key] > before[key] * (1 + tolerance):
+                        regressions.append((name, dict(case_key(result)), key, before[key], result[key]))
+                    break
+    return regressions
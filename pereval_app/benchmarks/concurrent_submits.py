@@ -0,0 +1,101 @@
+"""
+Параллельные первые отправки от одного email и повторные отправки.
+
+concurrent - N потоков одновременно отправляют первый отчет нового
+пользователя через PerevalDataProcessor.submit_data. Все отправки должны
+пройти, а пользователь должен быть создан ровно один раз.
+
+repeat_cached / repeat_uncached - задержка повторной отправки с id
+пользователя из UserIdCache и с upsert в pereval_user.
+
+Бенчмарк пишет в рабочие таблицы и удаляет созданные строки в конце.
+"""
+import threading
+import time
+import uuid
+
+from . import measure
+from ..data_processor import PerevalDataProcessor, user_id_cache
+from ..models import Coords, Pereval, User
+
+THREAD_COUNTS = (8, 32)
+
+
+def make_report(email):
+    """Минимальный корректный отчет без изображений для пользователя email"""
+    return {
+        'beauty_title': 'пер.',
+        'title': 'Бенчмарк',
+        'user': {'email': email, 'fam': 'Тестов', 'name': 'Тест', 'otc': '', 'phone': '+70000000000'},
+        'coords': {'latitude': '45.3842', 'longitude': '7.1525', 'height': 1200},
+        'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+        'images': [],
+    }
+
+
+def _cleanup(email):
+    perevals = Pereval.objects.filter(user__email=email)
+    coords_ids = list(perevals.values_list('coords_id', flat=True))
+    # Уровни сложности общие для всех перевалов и не удаляются
+    User.objects.filter(email=email).delete()
+    Coords.objects.filter(id__in=coords_ids).delete()
+    user_id_cache.discard(email)
+
+
+def _concurrent(threads):
+    email = f'bench-{uuid.uuid4().hex}@example.com'
+    report = make_report(email)
+    barrier = threading.Barrier(threads)
+    results = []
+
+    def submit():
+        barrier.wait()
+        results.append(PerevalDataProcessor().submit_data(report))
+
+    workers = [threading.Thread(target=submit) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = (time.perf_counter() - started) * 1000
+
+    try:
+        ok = sum(1 for result in results if result['status'] == 200)
+        users = User.objects.filter(email=email).count()
+        return {
+            'variant': 'concurrent',
+            'threads': threads,
+            'ok': ok,
+            'failed': threads - ok,
+            'users_created': users,
+            'passed': ok == threads and users == 1,
+            'wall_ms': round(elapsed, 3),
+        }
+    finally:
+        _cleanup(email)
+
+
+def _repeat(cached, repeat):
+    email = f'bench-{uuid.uuid4().hex}@example.com'
+    report = make_report(email)
+    processor = PerevalDataProcessor()
+    processor.submit_data(report)
+
+    def submit():
+        if not cached:
+            user_id_cache.discard(email)
+        processor.submit_data(report)
+
+    try:
+        stats = measure(submit, repeat)
+    finally:
+        _cleanup(email)
+    return {'variant': 'repeat_cached' if cached else 'repeat_uncached', **stats}
+
+
+def run(options):
+    results = [_concurrent(threads) for threads in THREAD_COUNTS]
+    results.append(_repeat(True, options['repeat']))
+    results.append(_repeat(False, options['repeat']))
+    return results
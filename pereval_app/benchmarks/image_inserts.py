@@ -0,0 +1,88 @@
+"""
+Сравнение способов записи изображений перевала:
+
+* per_row - отдельный INSERT на каждое изображение (прежний _create_images);
+* execute_values - многострочный INSERT ... VALUES (pg_driver.execute_values);
+* unnest - INSERT ... SELECT FROM unnest(массивы), как в SUBMIT_PEREVAL_QUERY.
+
+Запись идет во временную таблицу с той же структурой, что и pereval_image,
+поэтому бенчмарк не оставляет данных в рабочих таблицах.
+"""
+import base64
+import os
+from datetime import datetime
+
+from . import measure
+from ..data_processor import DatabaseConnector
+from ..pg_driver import execute_values
+
+IMAGE_COUNTS = (1, 10, 50)
+
+
+def _make_images(count, image_size):
+    return [
+        {'data': base64.b64encode(os.urandom(image_size)).decode(), 'title': f'Фото {i}'}
+        for i in range(count)
+    ]
+
+
+def _per_row(cursor, images):
+    for img in images:
+        cursor.execute(
+            "INSERT INTO bench_image (pereval_id, data, title, date_added) VALUES (%s, %s, %s, %s)",
+            (1, img['data'], img['title'], datetime.now())
+        )
+
+
+def _execute_values(cursor, images):
+    date_added = datetime.now()
+    execute_values(
+        cursor,
+        "INSERT INTO bench_image (pereval_id, data, title, date_added) VALUES %s",
+        [(1, img['data'], img['title'], date_added) for img in images]
+    )
+
+
+def _unnest(cursor, images):
+    cursor.execute(
+        """
+        INSERT INTO bench_image (pereval_id, data, title, date_added)
+        SELECT 1, img.data, img.title, %(date_added)s
+        FROM unnest(%(image_data)s::text[], %(image_titles)s::text[]) AS img (data, title)
+        """,
+        {
+            'image_data': [img['data'] for img in images],
+            'image_titles': [img['title'] for img in images],
+            'date_added': datetime.now(),
+        }
+    )
+
+
+STRATEGIES = {
+    'per_row': _per_row,
+    'execute_values': _execute_values,
+    'unnest': _unnest,
+}
+
+
+def run(options):
+    db = DatabaseConnector()
+    if not db.connect():
+        raise RuntimeError("Database connection failed")
+
+    results = []
+    try:
+        db.cursor.execute("""
+            CREATE TEMP TABLE bench_image (LIKE pereval_image INCLUDING DEFAULTS)
+            ON COMMIT DROP
+        """)
+        for count in IMAGE_COUNTS:
+            images = _make_images(count, options['image_size'])
+            for name, strategy in STRATEGIES.items():
+                stats = measure(lambda: strategy(db.cursor, images), options['repeat'])
+                db.cursor.execute("TRUNCATE bench_image")
+                results.append({'strategy': name, 'images': count, **stats})
+    finally:
+        db.conn.rollback()
+        db.disconnect()
+    return results
@@ -0,0 +1,54 @@
+"""
+Сравнение проверки изображения в ImageSerializer:
+
+* b64decode - прежняя проверка полным декодированием base64;
+* header_only - validate_image_base64: проверка алфавита и разбор заголовка.
+
+Не требует базы данных.
+"""
+import base64
+import os
+import struct
+import zlib
+
+from . import measure
+from ..image_validation import validate_image_base64
+
+PAYLOAD_SIZES = (100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+LIMITS = {
+    'MAX_BYTES': max(PAYLOAD_SIZES) * 2,
+    'MAX_PIXELS': 10 ** 9,
+    'TYPES': ['image/png'],
+}
+
+
+def make_png_base64(size):
+    """PNG-заголовок 4000x3000 со случайным "телом" нужного размера в base64"""
+    ihdr = struct.pack('>IIBBBBB', 4000, 3000, 8, 2, 0, 0, 0)
+    header = (
+        b'\x89PNG\r\n\x1a\n'
+        + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr
+        + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+    )
+    return 'data:image/png;base64,' + base64.b64encode(header + os.urandom(size - len(header))).decode()
+
+
+def _b64decode(value):
+    base64.b64decode(value.split(',')[1])
+
+
+STRATEGIES = {
+    'b64decode': _b64decode,
+    'header_only': lambda value: validate_image_base64(value, LIMITS),
+}
+
+
+def run(options):
+    results = []
+    for size in PAYLOAD_SIZES:
+        value = make_png_base64(size)
+        for name, strategy in STRATEGIES.items():
+            stats = measure(lambda: strategy(value), options['repeat'])
+            results.append({'strategy': name, 'payload_bytes': size, **stats})
+    return results
@@ -0,0 +1,121 @@
+"""
+Нагрузочный клиент для сравнения синхронного (WSGI) и асинхронного (ASGI)
+путей записи перевалов.
+
+Каждый из clients клиентов держит свое keep-alive соединение и отправляет
+requests запросов подряд. Серверы запускаются отдельно, например:
+
+    gunicorn pereval_project.wsgi -w 4 --threads 8 -b 127.0.0.1:8000
+    uvicorn pereval_project.asgi:application --workers 4 --port 8001
+
+Запуск: python manage.py load_test --target wsgi=http://127.0.0.1:8000/api/submitData/
+        --target asgi=http://127.0.0.1:8001/api/submitData/async/
+"""
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from .concurrent_submits import make_report
+from .image_validation import make_png_base64
+
+CLIENT_COUNTS = (100, 500, 1000)
+
+
+def make_body(client, image_size):
+    """Тело запроса: у каждого клиента свой пользователь"""
+    report = make_report(f'load-{uuid.uuid4().hex[:8]}-{client}@example.com')
+    report['images'] = [{'data': make_png_base64(image_size), 'title': 'Фото'}]
+    return json.dumps(report, ensure_ascii=False).encode('utf-8')
+
+
+async def _read_response(reader):
+    """Читает HTTP-ответ; возвращает (код, нужно ли переподключиться)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by server")
+    status = int(status_line.split()[1])
+    length = None
+    close = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection' and value.strip().lower() == 'close':
+            close = True
+    if length is None:
+        await reader.read()
+        close = True
+    else:
+        await reader.readexactly(length)
+    return status, close
+
+
+async def _client(url, body, count, latencies, statuses):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    path = parts.path or '/'
+    request = (
+        f'POST {path} HTTP/1.1\r\n'
+        f'Host: {parts.netloc}\r\n'
+        'Content-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        '\r\n'
+    ).encode('latin-1') + body
+
+    writer = None
+    try:
+        for _ in range(count):
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.perf_counter()
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, close = await _read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+                status, close = 0, True
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses.append(status)
+            if close:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_load(url, clients, requests_per_client, image_size=16 * 1024):
+    """Запускает clients параллельных клиентов и возвращает сводку"""
+    latencies = []
+    statuses = []
+    bodies = [make_body(client, image_size) for client in range(clients)]
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _client(url, body, requests_per_client, latencies, statuses) for body in bodies
+    ))
+    elapsed = time.perf_counter() - started
+
+    ok = sum(1 for status in statuses if 200 <= status < 300)
+    return {
+        'clients': clients,
+        'requests': len(statuses),
+        'ok': ok,
+        'errors': len(statuses) - ok,
+        'seconds': round(elapsed, 3),
+        'rps': round(ok / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'p95_ms': round(_percentile(latencies, 0.95), 1) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 0.99), 1) if latencies else None,
+    }
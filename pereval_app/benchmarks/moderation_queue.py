@@ -0,0 +1,66 @@
+"""
+Задержка выдачи очереди модерации (CLAIM_MODERATION_QUERY) на синтетической
+таблице перевалов: с частичными индексами по активным статусам и без них.
+
+Таблица создается как временная pereval (перекрывает рабочую в search_path
+текущей сессии) и удаляется при откате транзакции. Каждая выдача
+откатывается до точки сохранения, поэтому очередь не убывает между замерами.
+"""
+from . import measure
+from ..data_processor import CLAIM_MODERATION_QUERY, DatabaseConnector
+
+CLAIM_LIMITS = (1, 10, 100)
+
+# Примерно 1% новых и 1% находящихся в работе перевалов
+FILL_QUERY = """
+    INSERT INTO pereval (
+        beauty_title, title, other_titles, connect,
+        add_time, user_id, coords_id, level_id, status
+    )
+    SELECT 'пер.', 'Перевал ' || g, '', '',
+           now() - g * interval '1 minute', 1, 1, 1,
+           CASE g % 100
+               WHEN 0 THEN 'new'
+               WHEN 1 THEN 'pending'
+               ELSE CASE WHEN g % 2 = 0 THEN 'accepted' ELSE 'rejected' END
+           END
+    FROM generate_series(1, %(rows)s) AS g
+"""
+
+
+def _claim(cursor, limit):
+    cursor.execute("SAVEPOINT bench_claim")
+    cursor.execute(CLAIM_MODERATION_QUERY, {'limit': limit})
+    cursor.fetchall()
+    cursor.execute("ROLLBACK TO SAVEPOINT bench_claim")
+
+
+def run(options):
+    db = DatabaseConnector()
+    if not db.connect():
+        raise RuntimeError("Database connection failed")
+
+    cursor = db.cursor
+    results = []
+    try:
+        cursor.execute("CREATE TEMP TABLE pereval (LIKE public.pereval INCLUDING ALL) ON COMMIT DROP")
+        cursor.execute(FILL_QUERY, {'rows': options['rows']})
+        cursor.execute("ANALYZE pereval")
+
+        for variant in ('partial_index', 'no_partial_index'):
+            if variant == 'no_partial_index':
+                cursor.execute("""
+                    SELECT schemaname, indexname FROM pg_indexes
+                    WHERE tablename = 'pereval' AND schemaname LIKE 'pg_temp%%'
+                      AND indexdef LIKE '%%WHERE%%'
+                """)
+                for schema, index in cursor.fetchall():
+                    cursor.execute(f'DROP INDEX "{schema}"."{index}"')
+
+            for limit in CLAIM_LIMITS:
+                stats = measure(lambda: _claim(cursor, limit), options['repeat'])
+                results.append({'variant': variant, 'rows': options['rows'], 'limit': limit, **stats})
+    finally:
+        db.conn.rollback()
+        db.disconnect()
+    return results
@@ -0,0 +1,134 @@
+"""
+Рост таблицы перевалов: обычная таблица против помесячных секций.
+
+Для каждого числа месяцев истории из MONTHS строятся две временные таблицы
+с одинаковыми строками и индексами pereval: обычная и секционированная по
+add_time (см. pereval_app.partitions). Замеры:
+
+* recent_query - перевалы текущего месяца, как в очередях модерации и
+  истории пользователя;
+* vacuum - VACUUM после смены статуса 10% строк текущего месяца. Обычная
+  таблица очищается целиком, секционированная - только секция текущего
+  месяца (autovacuum тоже обрабатывает каждую секцию отдельно);
+* lookup_by_id - поиск по id без даты. У секций он проверяет индекс каждой
+  секции и растет с их числом.
+
+--rows задает число строк для самой длинной истории; строк в месяц во всех
+случаях поровну.
+"""
+from datetime import datetime, timezone
+
+from . import measure
+from ..data_processor import DatabaseConnector
+from ..partitions import add_months, current_month
+
+MONTHS = (6, 12, 24)
+
+COLUMNS = """
+    id bigint NOT NULL,
+    title varchar(255) NOT NULL,
+    add_time timestamptz NOT NULL,
+    user_id bigint NOT NULL,
+    status varchar(20) NOT NULL
+"""
+
+# Строки равномерно за months месяцев до начала следующего месяца; 1% новых
+FILL_QUERY = """
+    INSERT INTO {table} (id, title, add_time, user_id, status)
+    SELECT g, 'Перевал ' || g,
+           %(until)s - (g - 0.5)::float8 * (%(until)s - %(since)s) / %(rows)s::float8,
+           g %% 5000,
+           CASE WHEN g %% 100 = 0 THEN 'new' ELSE 'accepted' END
+    FROM generate_series(1, %(rows)s) AS g
+"""
+
+INDEXES = [
+    'CREATE INDEX ON {table} (add_time DESC, id DESC)',
+    'CREATE INDEX ON {table} (user_id, add_time DESC, id DESC)',
+    "CREATE INDEX ON {table} (add_time, id) WHERE status = 'new'",
+]
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def _create(cursor, table, months, partitioned):
+    first = add_months(current_month(), -(months - 1))
+    if partitioned:
+        cursor.execute(f'CREATE TEMP TABLE {table} ({COLUMNS}, PRIMARY KEY (id, add_time)) '
+                       f'PARTITION BY RANGE (add_time)')
+        for offset in range(months):
+            month = add_months(first, offset)
+            cursor.execute(
+                f'CREATE TEMP TABLE {table}_p{month:%Y_%m} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                [_bound(month), _bound(add_months(month, 1))],
+            )
+    else:
+        cursor.execute(f'CREATE TEMP TABLE {table} ({COLUMNS}, PRIMARY KEY (id))')
+    for index in INDEXES:
+        cursor.execute(index.format(table=table))
+    return first
+
+
+def run(options):
+    rows_per_month = max(options['rows'] // MONTHS[-1], 1000)
+    repeat = options['repeat']
+    db = DatabaseConnector()
+    # VACUUM нельзя выполнять в транзакции
+    if not db.connect(autocommit=True):
+        raise RuntimeError("Database connection failed")
+
+    cursor = db.cursor
+    results = []
+    tables = []
+    try:
+        for months in MONTHS:
+            rows = rows_per_month * months
+            for layout in ('plain', 'partitioned'):
+                table = f'bench_pereval_{layout}'
+                tables.append(table)
+                first = _create(cursor, table, months, layout == 'partitioned')
+                since = _bound(current_month())
+                cursor.execute(FILL_QUERY.format(table=table), {
+                    'since': _bound(first), 'until': _bound(add_months(current_month(), 1)), 'rows': rows,
+                })
+                cursor.execute(f'VACUUM ANALYZE {table}')
+                case = {'layout': layout, 'months': months, 'rows': rows}
+
+                def recent():
+                    cursor.execute(f"""
+                        SELECT id, title, add_time FROM {table}
+                        WHERE add_time >= %s AND user_id = 42
+                        ORDER BY add_time DESC, id DESC
+                    """, [since])
+                    cursor.fetchall()
+
+                stats = measure(recent, repeat)
+                results.append({**case, 'operation': 'recent_query', **stats})
+
+                def touch():
+                    cursor.execute(f"""
+                        UPDATE {table} SET status = CASE status WHEN 'new' THEN 'pending' ELSE 'new' END
+                        WHERE add_time >= %s AND id %% 10 = 0
+                    """, [since])
+
+                target = f'{table}_p{current_month():%Y_%m}' if layout == 'partitioned' else table
+                stats = measure(lambda: cursor.execute(f'VACUUM {target}'), max(repeat // 5, 1), setup=touch)
+                results.append({**case, 'operation': 'vacuum', **stats})
+
+                def lookup():
+                    cursor.execute(f'SELECT id, title FROM {table} WHERE id = %s', [rows // 2])
+                    cursor.fetchall()
+
+                stats = measure(lookup, repeat)
+                results.append({**case, 'operation': 'lookup_by_id', **stats})
+
+                cursor.execute(f'DROP TABLE {table}')
+                tables.remove(table)
+    finally:
+        # Временные таблицы живут до конца сессии, а соединение вернется в пул
+        for table in tables:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        db.disconnect()
+    return results
@@ -0,0 +1,76 @@
+"""
+Методы PerevalDataProcessor на синтетических отчетах:
+
+* submit_params - подготовка параметров с сохранением изображений в BlobStore;
+* submit_data - запись одного отчета;
+* submit_batch - запись пачки отчетов одной транзакцией;
+* get_pereval_by_id - чтение перевала с изображениями и только с метаданными.
+
+Бенчмарк пишет в рабочие таблицы и удаляет созданные строки в конце;
+изображения остаются в BlobStore (у всех отчетов одно содержимое).
+Методы модерации меняют статусы чужих перевалов, их задержку измеряет
+moderation_queue на временной таблице.
+"""
+import uuid
+
+from . import measure
+from .synthetic import SyntheticData
+from ..data_processor import PerevalDataProcessor, user_id_cache
+from ..models import Coords, Pereval, User
+from ..serializers import PerevalSerializer
+
+BATCH_SIZES = (10, 50)
+
+
+def _validated(report):
+    serializer = PerevalSerializer(data=report)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def _cleanup(domain):
+    perevals = Pereval.objects.filter(user__email__endswith=f'@{domain}')
+    coords_ids = list(perevals.values_list('coords_id', flat=True))
+    emails = list(User.objects.filter(email__endswith=f'@{domain}').values_list('email', flat=True))
+    User.objects.filter(email__in=emails).delete()
+    Coords.objects.filter(id__in=coords_ids).delete()
+    for email in emails:
+        user_id_cache.discard(email)
+
+
+def run(options):
+    domain = f'{uuid.uuid4().hex[:12]}.bench.example.com'
+    data = SyntheticData(options['seed'], users=20, domain=domain)
+    image_size = options['image_size']
+    repeat = options['repeat']
+    processor = PerevalDataProcessor()
+    results = []
+
+    def submit(report):
+        result = processor.submit_data(report)
+        if result['status'] != 200:
+            raise RuntimeError(f"submit_data failed: {result['message']}")
+        return result['id']
+
+    try:
+        report = _validated(data.report(image_size))
+        stats = measure(lambda: processor._submit_params(report, report['user']), repeat)
+        results.append({'method': 'submit_params', 'reports': 1, **stats})
+
+        reports = [_validated(data.report(image_size)) for _ in range(repeat)]
+        pereval_ids = []
+        queue = iter(reports)
+        stats = measure(lambda: pereval_ids.append(submit(next(queue))), repeat)
+        results.append({'method': 'submit_data', 'reports': 1, **stats})
+
+        for size in BATCH_SIZES:
+            batch = [_validated(report) for report in data.reports(size, image_size)]
+            stats = measure(lambda: processor.submit_batch(batch), max(repeat // 5, 1))
+            results.append({'method': 'submit_batch', 'reports': size, **stats})
+
+        for image_mode in ('data', 'meta'):
+            stats = measure(lambda: processor.get_pereval_by_id(pereval_ids[0], image_mode=image_mode), repeat)
+            results.append({'method': 'get_pereval_by_id', 'images': image_mode, **stats})
+    finally:
+        _cleanup(domain)
+    return results
@@ -0,0 +1,175 @@
+"""
+Чтение и пакетная запись перевалов: прежний SQL-путь против PerevalRepository.
+
+* read - перевал с пользователем, координатами, уровнем и метаданными
+  изображений: три запроса SQL (перевал, изображения) против
+  select_related + prefetch_related;
+* write_batch - пачка отчетов многострочными INSERT через execute_values
+  против bulk_create.
+
+Запись в обоих случаях откатывается, поэтому замеры не оставляют строк;
+для чтения создается один перевал, который удаляется в конце.
+"""
+import uuid
+
+from django.db import transaction
+
+from . import measure
+from .processor import _cleanup, _validated
+from .synthetic import SyntheticData
+from ..data_processor import DatabaseConnector, PerevalDataProcessor, level_key
+from ..pg_driver import execute_values
+from ..repository import PerevalRepository
+
+BATCH_SIZES = (10, 50)
+
+DETAIL_QUERY = """
+    SELECT
+        p.id, p.beauty_title, p.title, p.other_titles, p.connect,
+        p.add_time, p.status,
+        u.email, u.fam, u.name, u.otc, u.phone,
+        c.latitude, c.longitude, c.height,
+        l.winter, l.summer, l.autumn, l.spring
+    FROM pereval p
+    JOIN pereval_user u ON p.user_id = u.id
+    JOIN pereval_coords c ON p.coords_id = c.id
+    JOIN pereval_level l ON p.level_id = l.id
+    WHERE p.id = %s
+"""
+
+IMAGE_META_QUERY = """
+    SELECT id, title, size, mime_type, date_added FROM pereval_image
+    WHERE pereval_id = %s
+    ORDER BY id
+"""
+
+ALLOCATE_IDS_QUERY = "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)"
+
+USERS_QUERY = """
+    INSERT INTO pereval_user (email, fam, name, otc, phone) VALUES %s
+    ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+    RETURNING id, email
+"""
+
+LEVELS_QUERY = """
+    INSERT INTO pereval_level (winter, summer, autumn, spring) VALUES %s
+    ON CONFLICT (winter, summer, autumn, spring) DO UPDATE SET winter = EXCLUDED.winter
+    RETURNING id, winter, summer, autumn, spring
+"""
+
+COORDS_QUERY = "INSERT INTO pereval_coords (id, latitude, longitude, height, geohash) VALUES %s"
+
+PEREVALS_QUERY = """
+    INSERT INTO pereval (
+        id, beauty_title, title, other_titles, connect,
+        add_time, user_id, coords_id, level_id, status
+    ) VALUES %s
+"""
+
+IMAGES_QUERY = """
+    INSERT INTO pereval_image (pereval_id, pereval_add_time, title, sha256, size, mime_type, date_added) VALUES %s
+"""
+
+
+def _sql_read(cursor, pereval_id):
+    cursor.execute(DETAIL_QUERY, (pereval_id,))
+    row = cursor.fetchone()
+    cursor.execute(IMAGE_META_QUERY, (pereval_id,))
+    return row, cursor.fetchall()
+
+
+def _orm_read(repository, pereval_id):
+    pereval = repository.get(pereval_id)
+    return pereval, list(pereval.images.all())
+
+
+def _sql_write(cursor, batch):
+    count = len(batch)
+    users = {}
+    for params in batch:
+        users.setdefault(params['email'], (
+            params['email'], params['fam'], params['name'], params['otc'], params['phone']
+        ))
+    rows = execute_values(cursor, USERS_QUERY, [users[email] for email in sorted(users)],
+                          page_size=len(users), fetch=True)
+    user_ids = {email: user_id for user_id, email in rows}
+
+    levels = sorted({level_key(params) for params in batch})
+    rows = execute_values(cursor, LEVELS_QUERY, levels, page_size=len(levels), fetch=True)
+    level_ids = {tuple(seasons): level_id for level_id, *seasons in rows}
+
+    cursor.execute(ALLOCATE_IDS_QUERY, ('pereval_coords', count))
+    coords_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute(ALLOCATE_IDS_QUERY, ('pereval', count))
+    pereval_ids = [row[0] for row in cursor.fetchall()]
+
+    execute_values(cursor, COORDS_QUERY, [
+        (coords_id, p['latitude'], p['longitude'], p['height'], p['geohash'])
+        for coords_id, p in zip(coords_ids, batch)
+    ], page_size=count)
+    execute_values(cursor, PEREVALS_QUERY, [
+        (pereval_id, p['beauty_title'], p['title'], p['other_titles'], p['connect'],
+         p['add_time'], user_ids[p['email']], coords_id, level_ids[level_key(p)], 'new')
+        for pereval_id, coords_id, p in zip(pereval_ids, coords_ids, batch)
+    ], page_size=count)
+    images = [
+        (pereval_id, p['add_time'], title, sha256, size, mime_type, p['date_added'])
+        for pereval_id, p in zip(pereval_ids, batch)
+        for title, sha256, size, mime_type in zip(
+            p['image_titles'], p['image_sha256'], p['image_sizes'], p['image_mime_types']
+        )
+    ]
+    if images:
+        execute_values(cursor, IMAGES_QUERY, images, page_size=len(images))
+    return pereval_ids
+
+
+def _orm_write(repository, batch):
+    with transaction.atomic():
+        repository.create_batch(batch)
+        transaction.set_rollback(True)
+
+
+def run(options):
+    domain = f'{uuid.uuid4().hex[:12]}.bench.example.com'
+    data = SyntheticData(options['seed'], users=20, domain=domain)
+    image_size = options['image_size']
+    repeat = options['repeat']
+    processor = PerevalDataProcessor()
+    repository = PerevalRepository()
+    results = []
+
+    db = DatabaseConnector()
+    if not db.connect():
+        raise RuntimeError("Database connection failed")
+    try:
+        report = _validated(data.report(image_size, images=3))
+        result = processor.submit_data(report)
+        if result['status'] != 200:
+            raise RuntimeError(f"submit_data failed: {result['message']}")
+        pereval_id = result['id']
+
+        stats = measure(lambda: _sql_read(db.cursor, pereval_id), repeat)
+        db.conn.rollback()
+        results.append({'operation': 'read', 'layer': 'sql', **stats})
+        stats = measure(lambda: _orm_read(repository, pereval_id), repeat)
+        results.append({'operation': 'read', 'layer': 'orm', **stats})
+
+        for size in BATCH_SIZES:
+            reports = [_validated(report) for report in data.reports(size, image_size)]
+            batch = [processor._submit_params(report, report['user']) for report in reports]
+
+            def sql_write():
+                try:
+                    _sql_write(db.cursor, batch)
+                finally:
+                    db.conn.rollback()
+
+            stats = measure(sql_write, max(repeat // 5, 1))
+            results.append({'operation': 'write_batch', 'layer': 'sql', 'reports': size, **stats})
+            stats = measure(lambda: _orm_write(repository, batch), max(repeat // 5, 1))
+            results.append({'operation': 'write_batch', 'layer': 'orm', 'reports': size, **stats})
+    finally:
+        db.disconnect()
+        _cleanup(domain)
+    return results
@@ -0,0 +1,35 @@
+"""
+Проверка входящих отчетов:
+
+* pereval_serializer - PerevalSerializer(data=...).is_valid() для отчета
+  с одним и с пятью изображениями;
+* image_validate_data - ImageSerializer.validate_data для одного изображения.
+
+Не требует базы данных.
+"""
+from . import measure
+from .synthetic import SyntheticData
+from ..serializers import ImageSerializer, PerevalSerializer
+
+IMAGE_COUNTS = (1, 5)
+
+
+def _validate_report(report):
+    serializer = PerevalSerializer(data=report)
+    if not serializer.is_valid():
+        raise ValueError(f"Synthetic report is invalid: {serializer.errors}")
+
+
+def run(options):
+    data = SyntheticData(options['seed'])
+    image_size = options['image_size']
+    results = []
+    for images in IMAGE_COUNTS:
+        report = data.report(image_size, images)
+        stats = measure(lambda: _validate_report(report), options['repeat'])
+        results.append({'case': 'pereval_serializer', 'images': images, 'image_bytes': image_size, **stats})
+
+    value = data.image(image_size)
+    stats = measure(lambda: ImageSerializer().validate_data(value), options['repeat'])
+    results.append({'case': 'image_validate_data', 'images': 1, 'image_bytes': image_size, **stats})
+    return results
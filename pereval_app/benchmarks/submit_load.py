@@ -0,0 +1,17 @@
+"""
+Сквозная нагрузка на POST /api/submitData/ запущенного сервера с локальной
+базой PostgreSQL (см. load.py). Адрес задается --url, по умолчанию
+http://127.0.0.1:8000/api/submitData/.
+"""
+import asyncio
+
+from .load import run_load
+
+CLIENT_COUNTS = (10, 50)
+
+
+def run(options):
+    return [
+        asyncio.run(run_load(options['url'], clients, options['requests'], options['image_size']))
+        for clients in CLIENT_COUNTS
+    ]
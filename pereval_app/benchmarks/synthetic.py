@@ -0,0 +1,104 @@
+"""
+Генератор синтетических отчетов о перевалах для бенчмарков.
+
+Данные детерминированы: один и тот же seed дает те же пользователей,
+координаты, уровни сложности и изображения, поэтому замеры разных версий
+сравнимы между собой. Изображения - корректный заголовок PNG заданного
+разрешения со случайным телом нужного размера: проверка в ImageSerializer
+их принимает, а размер тела запроса соответствует реальным фотографиям.
+"""
+import base64
+import random
+import struct
+import zlib
+
+FAMILY_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Новиков']
+FIRST_NAMES = ['Алексей', 'Дмитрий', 'Сергей', 'Андрей', 'Мария', 'Анна', 'Елена', 'Ольга']
+PATRONYMICS = ['Иванович', 'Петрович', 'Сергеевич', 'Андреевич', '']
+TITLE_PREFIXES = ['пер.', 'пик', 'седл.']
+TITLES = ['Пхия', 'Кавказский', 'Донгуз-Орун', 'Бечо', 'Ак-Тру', 'Катунский', 'Шавлинский', 'Семинский']
+LEVELS = ['', '1А', '1Б', '2А', '2Б', '3А', '3Б']
+
+# Горные районы: (мин. широта, мин. долгота, макс. широта, макс. долгота, мин. высота, макс. высота)
+REGIONS = [
+    (42.8, 41.0, 43.6, 44.0, 1800, 4500),  # Кавказ
+    (49.5, 85.5, 50.5, 88.5, 1500, 4000),  # Алтай
+    (45.8, 6.5, 46.6, 10.5, 1500, 4200),   # Альпы
+    (38.5, 70.0, 39.5, 73.5, 2500, 5500),  # Памир
+]
+
+IMAGE_WIDTH = 1600
+IMAGE_HEIGHT = 1200
+
+
+def png_bytes(size, rng, width=IMAGE_WIDTH, height=IMAGE_HEIGHT):
+    """PNG-заголовок width x height и случайное "тело" до size байт"""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    header = (
+        b'\x89PNG\r\n\x1a\n'
+        + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr
+        + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+    )
+    return header + rng.randbytes(max(size - len(header), 0))
+
+
+class SyntheticData:
+    """
+    Детерминированный источник отчетов для POST /api/submitData/.
+
+    users - размер пула пользователей: отчеты распределяются между ними,
+    как повторные отправки одних и тех же туристов.
+    """
+
+    def __init__(self, seed=0, users=100, domain='bench.example.com'):
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.user_count = users
+        self.domain = domain
+        self._images = {}
+
+    def user(self, number=None):
+        if number is None:
+            number = self.rng.randrange(self.user_count)
+        rng = random.Random(f'{self.seed}-user-{number}')
+        return {
+            'email': f'user{number}@{self.domain}',
+            'fam': rng.choice(FAMILY_NAMES),
+            'name': rng.choice(FIRST_NAMES),
+            'otc': rng.choice(PATRONYMICS),
+            'phone': f'+79{rng.randrange(10 ** 9):09d}',
+        }
+
+    def coords(self):
+        min_lat, min_lon, max_lat, max_lon, min_height, max_height = self.rng.choice(REGIONS)
+        return {
+            'latitude': f'{self.rng.uniform(min_lat, max_lat):.6f}',
+            'longitude': f'{self.rng.uniform(min_lon, max_lon):.6f}',
+            'height': self.rng.randint(min_height, max_height),
+        }
+
+    def level(self):
+        return {season: self.rng.choice(LEVELS) for season in ('winter', 'summer', 'autumn', 'spring')}
+
+    def image(self, size):
+        """Изображение в base64 (data URI); одинаковые размеры - одинаковое содержимое"""
+        if size not in self._images:
+            data = png_bytes(size, random.Random(f'{self.seed}-image-{size}'))
+            self._images[size] = 'data:image/png;base64,' + base64.b64encode(data).decode('ascii')
+        return self._images[size]
+
+    def report(self, image_size=64 * 1024, images=1, user=None):
+        """Отчет о перевале в формате POST /api/submitData/"""
+        return {
+            'beauty_title': self.rng.choice(TITLE_PREFIXES),
+            'title': f'{self.rng.choice(TITLES)} {self.rng.randrange(1000)}',
+            'other_titles': '',
+            'connect': '',
+            'user': self.user(user),
+            'coords': self.coords(),
+            'level': self.level(),
+            'images': [{'data': self.image(image_size), 'title': f'Фото {i + 1}'} for i in range(images)],
+        }
+
+    def reports(self, count, image_size=64 * 1024, images=1):
+        return [self.report(image_size, images) for _ in range(count)]
@@ -0,0 +1,193 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+
+DEFAULT_MIME_TYPE = 'application/octet-stream'
+
+# Имя файла в хранилище - SHA-256 содержимого в шестнадцатеричном виде
+DIGEST_PATTERN = re.compile(r'[0-9a-f]{64}')
+# Сколько первых байт нужно sniff_mime_type
+SNIFF_BYTES = 16
+
+# Сигнатуры форматов изображений: (смещение, байты, MIME-тип)
+IMAGE_SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (8, b'WEBP', 'image/webp'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+]
+
+
+def sniff_mime_type(header):
+    """Определяет MIME-тип изображения по первым байтам"""
+    for offset, signature, mime_type in IMAGE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return mime_type
+    return DEFAULT_MIME_TYPE
+
+
+def split_data_uri(value):
+    """
+    Разбирает строку изображения из API.
+
+    Возвращает (MIME-тип из префикса data:image/...;base64 или None, base64).
+    """
+    if value.startswith('data:'):
+        prefix, _, payload = value.partition(',')
+        mime_type = prefix[len('data:'):].split(';')[0] or None
+        return mime_type, payload
+    return None, value
+
+
+def decode_image(value):
+    """Декодирует base64 (в том числе data URI) и возвращает (байты, MIME-тип)"""
+    mime_type, payload = split_data_uri(value)
+    try:
+        # Без validate b64decode молча отбрасывает недопустимые символы;
+        # переносы строк в base64 допустимы
+        data = base64.b64decode(''.join(payload.split()), validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid base64 image data: {e}")
+    if not data:
+        raise ValueError("Empty image data")
+    sniffed = sniff_mime_type(data[:16])
+    if sniffed == DEFAULT_MIME_TYPE and mime_type:
+        return data, mime_type
+    return data, sniffed
+
+
+StoredImage = namedtuple('StoredImage', ['sha256', 'size', 'mime_type'])
+
+
+class BlobWriter:
+    """Запись одного файла в BlobStore по частям с подсчетом SHA-256"""
+
+    def __init__(self, store):
+        self.store = store
+        tmp_dir = store.root / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self.file = os.fdopen(fd, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        self.file.write(chunk)
+
+    def commit(self):
+        """Переносит файл на место и возвращает (sha256, размер)"""
+        self.file.close()
+        digest = self.digest.hexdigest()
+        target = self.store.path(digest)
+        try:
+            if target.exists():
+                os.unlink(self.tmp_path)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(self.tmp_path, target)
+        except BaseException:
+            self.abort()
+            raise
+        return digest, self.size
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+class BlobStore:
+    """
+    Хранилище изображений с адресацией по содержимому.
+
+    Файл хранится под своим SHA-256 в каталоге root/ab/cd/<hash>, поэтому
+    повторная загрузка той же фотографии не создает копию. Запись атомарна:
+    данные пишутся во временный файл и переименовываются на место.
+    Имя, не похожее на SHA-256, отклоняется: путь строится из него напрямую.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, digest):
+        if not isinstance(digest, str) or not DIGEST_PATTERN.fullmatch(digest):
+            raise ValueError(f"Invalid image digest {digest!r}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest):
+        try:
+            return self.path(digest).exists()
+        except ValueError:
+            return False
+
+    def describe(self, digest):
+        """StoredImage с размером и MIME-типом сохраненного файла или None, если файла нет"""
+        try:
+            with self.open(digest) as blob:
+                header = blob.read(SNIFF_BYTES)
+                size = os.fstat(blob.fileno()).st_size
+        except (FileNotFoundError, ValueError):
+            return None
+        return StoredImage(digest, size, sniff_mime_type(header))
+
+    def put(self, data):
+        """Сохраняет байты и возвращает (sha256, размер)"""
+        return self.put_stream([data])
+
+    def put_stream(self, chunks):
+        """Сохраняет данные, поступающие частями, и возвращает (sha256, размер)"""
+        writer = self.writer()
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def writer(self):
+        """Открывает BlobWriter для записи одного файла по частям"""
+        return BlobWriter(self)
+
+    def open(self, digest):
+        return open(self.path(digest), 'rb')
+
+    def read(self, digest):
+        with self.open(digest) as blob:
+            return blob.read()
+
+
+_store = None
+
+
+def get_blob_store():
+    """Хранилище изображений в MEDIA_ROOT/images"""
+    global _store
+    if _store is None:
+        _store = BlobStore(Path(settings.MEDIA_ROOT) / 'images')
+    return _store
+
+
+def store_image(value):
+    """
+    Декодирует изображение из API и кладет его в хранилище.
+
+    Возвращает StoredImage с полями sha256, size и mime_type для pereval_image.
+    Уже сохраненное изображение (например, при потоковом разборе запроса)
+    возвращается как есть.
+    """
+    if isinstance(value, StoredImage):
+        return value
+    data, mime_type = decode_image(value)
+    digest, size = get_blob_store().put(data)
+    return StoredImage(digest, size, mime_type)
@@ -0,0 +1,512 @@
+"""
+Массовый импорт и экспорт перевалов через COPY (import_perevals, export_perevals).
+
+Импорт читает NDJSON (отчет в формате POST /api/submitData/ на строку) или
+CSV (плоские столбцы CSV_FIELDS, изображения - JSON-массив в столбце images)
+и пишет записи пачками. Каждая пачка:
+
+* проверяется и переводится в строки промежуточных таблиц; изображения по
+  мере чтения сохраняются в BlobStore, в БД идут только их метаданные;
+* загружается одним COPY во временные таблицы pereval_import_stage и
+  pereval_import_image_stage; id координат и перевалов выделяются из их
+  последовательностей значениями по умолчанию прямо при COPY;
+* раскладывается по рабочим таблицам пятью INSERT ... SELECT и фиксируется.
+
+В памяти одновременно находится не больше одной пачки, поэтому расход
+памяти не зависит от размера файла. Изображения записываются в BlobStore
+до фиксации пачки и после ее отката остаются в хранилище без ссылок, как
+и при откате POST /api/submitData/. Удалять их при откате нельзя: тот же
+файл может принадлежать уже записанному перевалу. Повторный импорт
+использует их заново.
+
+Экспорт выполняет COPY (SELECT ...) TO STDOUT: строки NDJSON или CSV
+собирает сервер, а клиент только переписывает поток в файл. Содержимое
+изображений (images='data', только NDJSON) подставляется построчно из
+BlobStore.
+"""
+import base64
+import codecs
+import csv
+import io
+import json
+import time
+from datetime import timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .blob_store import StoredImage, get_blob_store, store_image
+from .data_processor import DatabaseConnector
+from .geo import encode
+from .models import Pereval
+from .pg_driver import copy_expert, mogrify
+
+CSV_FIELDS = [
+    'email', 'fam', 'name', 'otc', 'phone',
+    'latitude', 'longitude', 'height',
+    'winter', 'summer', 'autumn', 'spring',
+    'beauty_title', 'title', 'other_titles', 'connect', 'add_time', 'status', 'images',
+]
+
+STATUSES = {value for value, _ in Pereval.STATUS_CHOICES}
+
+# Максимальная длина строковых полей (как в моделях)
+MAX_LENGTHS = {
+    'email': 254, 'fam': 255, 'name': 255, 'otc': 255, 'phone': 20,
+    'winter': 10, 'summer': 10, 'autumn': 10, 'spring': 10,
+    'beauty_title': 255, 'title': 255, 'other_titles': 255, 'connect': 255,
+}
+
+REQUIRED_FIELDS = ['email', 'fam', 'name', 'phone', 'latitude', 'longitude', 'height', 'beauty_title', 'title']
+
+STAGE_COLUMNS = [
+    'row_no', 'email', 'fam', 'name', 'otc', 'phone',
+    'latitude', 'longitude', 'height', 'geohash',
+    'winter', 'summer', 'autumn', 'spring',
+    'beauty_title', 'title', 'other_titles', 'connect', 'add_time', 'status',
+]
+
+IMAGE_STAGE_COLUMNS = ['row_no', 'title', 'sha256', 'size', 'mime_type']
+
+# ON COMMIT DELETE ROWS очищает таблицы после каждой пачки
+CREATE_STAGE_QUERY = """
+    CREATE TEMP TABLE IF NOT EXISTS pereval_import_stage (
+        row_no bigint NOT NULL,
+        pereval_id integer NOT NULL DEFAULT nextval(pg_get_serial_sequence('pereval', 'id')),
+        coords_id integer NOT NULL DEFAULT nextval(pg_get_serial_sequence('pereval_coords', 'id')),
+        email text, fam text, name text, otc text, phone text,
+        latitude numeric(9, 6), longitude numeric(9, 6), height integer, geohash text,
+        winter text, summer text, autumn text, spring text,
+        beauty_title text, title text, other_titles text, connect text,
+        add_time timestamptz, status text
+    ) ON COMMIT DELETE ROWS;
+    CREATE TEMP TABLE IF NOT EXISTS pereval_import_image_stage (
+        row_no bigint NOT NULL,
+        title text, sha256 text, size integer, mime_type text
+    ) ON COMMIT DELETE ROWS;
+"""
+
+DROP_STAGE_QUERY = "DROP TABLE IF EXISTS pereval_import_stage, pereval_import_image_stage"
+
+# Раскладка пачки по таблицам. Пользователи и уровни вставляются в порядке
+# ключа (как в submit_batch), существующие не изменяются
+FAN_OUT_QUERIES = [
+    """
+    INSERT INTO pereval_user (email, fam, name, otc, phone)
+    SELECT DISTINCT ON (email) email, fam, name, otc, phone
+    FROM pereval_import_stage
+    ORDER BY email, row_no
+    ON CONFLICT (email) DO NOTHING
+    """,
+    """
+    INSERT INTO pereval_level (winter, summer, autumn, spring)
+    SELECT DISTINCT winter, summer, autumn, spring
+    FROM pereval_import_stage
+    ORDER BY winter, summer, autumn, spring
+    ON CONFLICT (winter, summer, autumn, spring) DO NOTHING
+    """,
+    """
+    INSERT INTO pereval_coords (id, latitude, longitude, height, geohash)
+    SELECT coords_id, latitude, longitude, height, geohash
+    FROM pereval_import_stage
+    """,
+    """
+    INSERT INTO pereval (
+        id, beauty_title, title, other_titles, connect,
+        add_time, user_id, coords_id, level_id, status
+    )
+    SELECT s.pereval_id, s.beauty_title, s.title, s.other_titles, s.connect,
+           s.add_time, u.id, s.coords_id, l.id, s.status
+    FROM pereval_import_stage s
+    JOIN pereval_user u ON u.email = s.email
+    JOIN pereval_level l
+      ON (l.winter, l.summer, l.autumn, l.spring) = (s.winter, s.summer, s.autumn, s.spring)
+    """,
+    """
+    INSERT INTO pereval_image (pereval_id, pereval_add_time, title, sha256, size, mime_type, date_added)
+    SELECT s.pereval_id, s.add_time, i.title, i.sha256, i.size, i.mime_type, now()
+    FROM pereval_import_image_stage i
+    JOIN pereval_import_stage s USING (row_no)
+    """,
+]
+
+# Строка экспорта собирается сервером. Управляющие символы в QUOTE и
+# DELIMITER не встречаются в JSON, поэтому COPY не экранирует строку
+EXPORT_NDJSON_QUERY = """
+    COPY (
+        SELECT json_build_object(
+            'id', p.id,
+            'beauty_title', p.beauty_title, 'title', p.title,
+            'other_titles', p.other_titles, 'connect', p.connect,
+            'add_time', p.add_time, 'status', p.status,
+            'user', json_build_object('email', u.email, 'fam', u.fam, 'name', u.name,
+                                      'otc', u.otc, 'phone', u.phone),
+            'coords', json_build_object('latitude', c.latitude, 'longitude', c.longitude,
+                                        'height', c.height),
+            'level', json_build_object('winter', l.winter, 'summer', l.summer,
+                                       'autumn', l.autumn, 'spring', l.spring),
+            'images', {images}
+        )
+        FROM pereval p
+        JOIN pereval_user u ON u.id = p.user_id
+        JOIN pereval_coords c ON c.id = p.coords_id
+        JOIN pereval_level l ON l.id = p.level_id
+        WHERE p.status = ANY(%(statuses)s)
+        ORDER BY p.id
+    ) TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')
+"""
+
+EXPORT_CSV_QUERY = """
+    COPY (
+        SELECT u.email, u.fam, u.name, u.otc, u.phone,
+               c.latitude, c.longitude, c.height,
+               l.winter, l.summer, l.autumn, l.spring,
+               p.beauty_title, p.title, p.other_titles, p.connect, p.add_time, p.status,
+               {images} AS images
+        FROM pereval p
+        JOIN pereval_user u ON u.id = p.user_id
+        JOIN pereval_coords c ON c.id = p.coords_id
+        JOIN pereval_level l ON l.id = p.level_id
+        WHERE p.status = ANY(%(statuses)s)
+        ORDER BY p.id
+    ) TO STDOUT WITH (FORMAT csv, HEADER)
+"""
+
+# Массив изображений перевала для экспорта: images='meta' - метаданные,
+# 'data' - еще и старое содержимое из столбца data (для строк без sha256)
+EXPORT_IMAGES = {
+    'none': "'[]'::json",
+    'meta': """
+        COALESCE((
+            SELECT json_agg(json_build_object('title', i.title, 'sha256', i.sha256,
+                                              'size', i.size, 'mime_type', i.mime_type) ORDER BY i.id)
+            FROM pereval_image i WHERE i.pereval_id = p.id AND i.pereval_add_time = p.add_time
+        ), '[]'::json)
+    """,
+    'data': """
+        COALESCE((
+            SELECT json_agg(json_build_object('title', i.title, 'sha256', i.sha256,
+                                              'mime_type', i.mime_type, 'data', i.data) ORDER BY i.id)
+            FROM pereval_image i WHERE i.pereval_id = p.id AND i.pereval_add_time = p.add_time
+        ), '[]'::json)
+    """,
+}
+
+
+class RecordError(ValueError):
+    """Запись файла импорта не прошла проверку"""
+
+
+def read_ndjson(stream):
+    """Записи NDJSON: (номер строки, отчет или RecordError)"""
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            report = json.loads(line)
+        except ValueError as e:
+            yield line_no, RecordError(f"Invalid JSON: {e}")
+            continue
+        try:
+            record = flatten_report(report)
+        except RecordError as e:
+            record = e
+        yield line_no, record
+
+
+def read_csv(stream):
+    """Записи CSV с заголовком: (номер строки, запись или RecordError)"""
+    reader = csv.DictReader(stream)
+    missing = set(REQUIRED_FIELDS) - set(reader.fieldnames or [])
+    if missing:
+        raise RecordError(f"CSV header has no columns: {', '.join(sorted(missing))}")
+    for row in reader:
+        record = {key: value for key, value in row.items() if key in CSV_FIELDS}
+        images = record.pop('images', '') or '[]'
+        try:
+            record['images'] = json.loads(images)
+        except ValueError as e:
+            yield reader.line_num, RecordError(f"Invalid images JSON: {e}")
+            continue
+        yield reader.line_num, record
+
+
+def flatten_report(report):
+    """Отчет в формате API (user, coords, level) в плоскую запись CSV_FIELDS"""
+    if not isinstance(report, dict):
+        raise RecordError("JSON object expected")
+    record = {key: value for key, value in report.items() if key in CSV_FIELDS}
+    for group in ('user', 'coords', 'level'):
+        nested = report.get(group) or {}
+        if not isinstance(nested, dict):
+            raise RecordError(f"Field {group} must be an object")
+        record.update(nested)
+    return record
+
+
+def _text(record, field):
+    value = record.get(field)
+    value = '' if value is None else str(value).strip()
+    limit = MAX_LENGTHS.get(field, 255)
+    if len(value) > limit:
+        raise RecordError(f"Field {field} is longer than {limit} characters")
+    return value
+
+
+def _image(item):
+    """Изображение записи: содержимое в base64 или ссылка на уже сохраненное"""
+    if not isinstance(item, dict):
+        raise RecordError("Image must be an object")
+    title = str(item.get('title') or '')[:255]
+    if item.get('data'):
+        try:
+            stored = store_image(item['data'])
+        except ValueError as e:
+            raise RecordError(str(e))
+    elif item.get('sha256'):
+        # Размер и тип берутся из сохраненного файла, а не из записи
+        stored = get_blob_store().describe(item['sha256'])
+        if stored is None:
+            raise RecordError(f"Image {item['sha256']!r} is not in the blob store")
+    else:
+        raise RecordError("Image has neither data nor a stored sha256")
+    return title, stored
+
+
+def prepare_record(record):
+    """
+    Проверяет запись и возвращает (строка pereval_import_stage без row_no,
+    изображения [(название, StoredImage)])
+    """
+    missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, '')]
+    if missing:
+        raise RecordError(f"Missing required fields: {', '.join(missing)}")
+
+    try:
+        latitude = Decimal(str(record['latitude'])).quantize(Decimal('0.000001'))
+        longitude = Decimal(str(record['longitude'])).quantize(Decimal('0.000001'))
+        height = int(record['height'])
+    except (InvalidOperation, ValueError, TypeError):
+        raise RecordError("Coordinates must be numbers")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise RecordError("Coordinates are out of range")
+
+    add_time = record.get('add_time')
+    if add_time:
+        add_time = parse_datetime(str(add_time))
+        if add_time is None:
+            raise RecordError("Invalid add_time")
+        if timezone.is_naive(add_time):
+            add_time = add_time.replace(tzinfo=dt_timezone.utc)
+    else:
+        add_time = timezone.now()
+
+    status = _text(record, 'status') or 'new'
+    if status not in STATUSES:
+        raise RecordError(f"Unknown status {status}")
+
+    images = record.get('images') or []
+    if not isinstance(images, list):
+        raise RecordError("Field images must be an array")
+
+    row = [
+        _text(record, 'email'), _text(record, 'fam'), _text(record, 'name'),
+        _text(record, 'otc'), _text(record, 'phone'),
+        latitude, longitude, height, encode(float(latitude), float(longitude)),
+        _text(record, 'winter'), _text(record, 'summer'), _text(record, 'autumn'), _text(record, 'spring'),
+        _text(record, 'beauty_title'), _text(record, 'title'),
+        _text(record, 'other_titles'), _text(record, 'connect'),
+        add_time.isoformat(), status,
+    ]
+    return row, [_image(item) for item in images]
+
+
+class PerevalImporter:
+    """
+    Загрузка записей пачками по batch_size через промежуточные таблицы.
+
+    progress(imported, rejected) вызывается после каждой пачки,
+    reject(номер строки, ошибка) - для каждой отклоненной записи.
+    """
+
+    def __init__(self, batch_size=10_000, progress=None, reject=None):
+        self.batch_size = batch_size
+        self.progress = progress or (lambda imported, rejected: None)
+        self.reject = reject or (lambda line_no, error: None)
+        self.imported = 0
+        self.rejected = 0
+
+    def run(self, records):
+        db = DatabaseConnector()
+        if not db.connect():
+            raise RuntimeError("Cannot connect to the database")
+        try:
+            db.cursor.execute(CREATE_STAGE_QUERY)
+            db.conn.commit()
+
+            stage = io.StringIO()
+            images = io.StringIO()
+            stage_writer = csv.writer(stage)
+            image_writer = csv.writer(images)
+            pending = 0
+            for line_no, record in records:
+                try:
+                    if isinstance(record, Exception):
+                        raise record
+                    row, stored_images = prepare_record(record)
+                except RecordError as e:
+                    self.rejected += 1
+                    self.reject(line_no, e)
+                    continue
+                stage_writer.writerow([line_no] + row)
+                for title, stored in stored_images:
+                    image_writer.writerow([line_no, title, stored.sha256, stored.size, stored.mime_type])
+                pending += 1
+                if pending >= self.batch_size:
+                    self._flush(db, stage, images, pending)
+                    stage.seek(0)
+                    stage.truncate()
+                    images.seek(0)
+                    images.truncate()
+                    pending = 0
+            if pending:
+                self._flush(db, stage, images, pending)
+
+        except BaseException:
+            db.conn.rollback()
+            raise
+        finally:
+            # Соединение вернется в пул - временные таблицы ему не нужны
+            try:
+                db.cursor.execute(DROP_STAGE_QUERY)
+                db.conn.commit()
+            except Exception:
+                db.conn.rollback()
+            db.disconnect()
+        return self.imported, self.rejected
+
+    def _flush(self, db, stage, images, count):
+        """Одна пачка: COPY в промежуточные таблицы, раскладка и фиксация"""
+        cursor = db.cursor
+        stage.seek(0)
+        copy_expert(
+            cursor, f"COPY pereval_import_stage ({', '.join(STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", stage
+        )
+        images.seek(0)
+        copy_expert(
+            cursor, f"COPY pereval_import_image_stage ({', '.join(IMAGE_STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            images
+        )
+        # Автоочистка не собирает статистику временных таблиц
+        cursor.execute("ANALYZE pereval_import_stage")
+        for query in FAN_OUT_QUERIES:
+            cursor.execute(query)
+        db.conn.commit()
+        self.imported += count
+        self.progress(self.imported, self.rejected)
+
+
+class _NDJSONImageWriter:
+    """
+    Файловый объект для pg_driver.copy_expert: дописывает в каждую строку NDJSON
+    содержимое изображений из BlobStore и передает ее дальше
+    """
+
+    def __init__(self, output, on_line):
+        self.output = output
+        self.on_line = on_line
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.pending = ''
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = self.decoder.decode(data)
+        lines = (self.pending + data).split('\n')
+        self.pending = lines.pop()
+        for line in lines:
+            self._write_line(line)
+
+    def _write_line(self, line):
+        report = json.loads(line)
+        store = get_blob_store()
+        for image in report['images']:
+            if image.get('sha256'):
+                image['data'] = base64.b64encode(store.read(image['sha256'])).decode('ascii')
+            image.pop('sha256', None)
+        self.output.write(json.dumps(report, ensure_ascii=False) + '\n')
+        self.on_line()
+
+    def close(self):
+        if self.pending:
+            self._write_line(self.pending)
+            self.pending = ''
+
+
+class _CountingWriter:
+    """Передает поток COPY в файл, считая строки"""
+
+    def __init__(self, output, on_line):
+        self.output = output
+        self.on_line = on_line
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = self.decoder.decode(data)
+        self.output.write(data)
+        for _ in range(data.count('\n')):
+            self.on_line()
+
+
+def export_perevals(output, fmt='ndjson', statuses=('accepted',), images='meta', progress=None,
+                    progress_every=10_000):
+    """
+    Пишет перевалы с указанными статусами в текстовый файл output.
+
+    fmt - 'ndjson' или 'csv'; images - 'none', 'meta' или 'data'
+    (содержимое изображений, только для NDJSON). Возвращает число строк.
+    """
+    if fmt == 'csv' and images == 'data':
+        raise ValueError("Image data can only be exported to NDJSON")
+    progress = progress or (lambda count: None)
+    count = 0
+    # Для CSV заголовок - тоже строка
+    skip = 1 if fmt == 'csv' else 0
+
+    def on_line():
+        nonlocal count, skip
+        if skip:
+            skip -= 1
+            return
+        count += 1
+        if count % progress_every == 0:
+            progress(count)
+
+    query = (EXPORT_NDJSON_QUERY if fmt == 'ndjson' else EXPORT_CSV_QUERY).format(images=EXPORT_IMAGES[images])
+    writer = _NDJSONImageWriter(output, on_line) if images == 'data' else _CountingWriter(output, on_line)
+
+    # Выгрузка только читает и может идти с реплики
+    db = DatabaseConnector(read_only=True)
+    if not db.connect():
+        raise RuntimeError("Cannot connect to the database")
+    try:
+        copy_expert(db.cursor, mogrify(db.cursor, query, {'statuses': list(statuses)}), writer)
+        if images == 'data':
+            writer.close()
+        db.conn.rollback()
+    finally:
+        db.disconnect()
+    progress(count)
+    return count
+
+
+class Throughput:
+    """Скорость обработки для сообщений о ходе импорта и экспорта"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+
+    def rate(self, count):
+        elapsed = time.monotonic() - self.started
+        return round(count / elapsed, 1) if elapsed else 0
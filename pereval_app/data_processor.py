@@ -1,43 +1,250 @@
-import os
-import psycopg2
-from psycopg2 import sql
-from datetime import datetime
+from collections import OrderedDict
+import base64
 import json
 import logging
+import threading
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .blob_store import get_blob_store, store_image
+from .db_pool import get_pool
+from .db_router import get_replicas, read_alias
+from .geo import encode
+from .metrics import span
+from .pg_driver import errors
+from .prepared import statements
+from .repository import PerevalRepository, aware_datetime
+from .response_cache import invalidate_pereval
+from .thumbnails import read_rendition, schedule_renditions
 
 logger = logging.getLogger(__name__)
 
 
+# Пользователь, координаты, уровень сложности, перевал и изображения
+# записываются одним запросом (цепочкой CTE) за один обмен с сервером.
+# Существующий пользователь с тем же email не изменяется: DO UPDATE нужен
+# только для того, чтобы RETURNING вернул его id (в отличие от DO NOTHING,
+# он видит и строку, вставленную параллельной транзакцией). Если id
+# пользователя известен из user_id_cache, upsert пропускается и берется
+# %(user_id)s - текст запроса при этом не меняется. Уровни сложности
+# хранятся без повторов (уникальный набор сезонов) и выбираются так же:
+# из level_id_cache или upsert. Содержимое изображений
+# к этому моменту уже лежит в BlobStore, в таблицу пишутся только метаданные.
+# submission_key - ключ отчета из очереди отложенной записи: уникальный
+# индекс (submission_key, add_time) не дает записать повторно доставленный
+# отчет второй раз, если add_time не изменился.
+SUBMIT_PEREVAL_QUERY = """
+    WITH new_user AS (
+        INSERT INTO pereval_user (email, fam, name, otc, phone)
+        SELECT %(email)s, %(fam)s, %(name)s, %(otc)s, %(phone)s
+        WHERE %(user_id)s::integer IS NULL
+        ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+        RETURNING id
+    ),
+    pereval_user_id AS (
+        SELECT id FROM new_user
+        UNION ALL
+        SELECT %(user_id)s::integer WHERE %(user_id)s::integer IS NOT NULL
+    ),
+    new_coords AS (
+        INSERT INTO pereval_coords (latitude, longitude, height, geohash)
+        VALUES (%(latitude)s, %(longitude)s, %(height)s, %(geohash)s)
+        RETURNING id
+    ),
+    new_level AS (
+        INSERT INTO pereval_level (winter, summer, autumn, spring)
+        SELECT %(winter)s, %(summer)s, %(autumn)s, %(spring)s
+        WHERE %(level_id)s::integer IS NULL
+        ON CONFLICT (winter, summer, autumn, spring) DO UPDATE SET winter = EXCLUDED.winter
+        RETURNING id
+    ),
+    pereval_level_id AS (
+        SELECT id FROM new_level
+        UNION ALL
+        SELECT %(level_id)s::integer WHERE %(level_id)s::integer IS NOT NULL
+    ),
+    new_pereval AS (
+        INSERT INTO pereval (
+            beauty_title, title, other_titles, connect,
+            add_time, user_id, coords_id, level_id, status, submission_key
+        )
+        SELECT %(beauty_title)s, %(title)s, %(other_titles)s, %(connect)s,
+               %(add_time)s, pereval_user_id.id, new_coords.id, pereval_level_id.id, 'new', %(submission_key)s
+        FROM pereval_user_id, new_coords, pereval_level_id
+        RETURNING id, user_id, level_id, add_time
+    ),
+    new_images AS (
+        INSERT INTO pereval_image (pereval_id, pereval_add_time, title, sha256, size, mime_type, date_added)
+        SELECT new_pereval.id, new_pereval.add_time, img.title, img.sha256, img.size, img.mime_type, %(date_added)s
+        FROM new_pereval,
+             unnest(
+                 %(image_titles)s::text[], %(image_sha256)s::text[],
+                 %(image_sizes)s::integer[], %(image_mime_types)s::text[]
+             ) AS img (title, sha256, size, mime_type)
+    )
+    SELECT id, user_id, level_id FROM new_pereval
+"""
+
+
+# add_time входит в уникальный индекс вместе с ключом и выбирает секцию
+SUBMITTED_PEREVAL_QUERY = """
+    SELECT id FROM pereval
+    WHERE submission_key = %(submission_key)s AND add_time = %(add_time)s::timestamptz
+"""
+
+
+# Выдача модератору пачки новых перевалов. SKIP LOCKED пропускает строки,
+# которые в этот момент забирает другой модератор, поэтому параллельные
+# запросы не ждут друг друга и не получают одни и те же записи. Порядок
+# подзапроса совпадает с частичным индексом pereval_new_queue_idx.
+CLAIM_MODERATION_QUERY = """
+    UPDATE pereval SET status = 'pending'
+    WHERE id IN (
+        SELECT id FROM pereval
+        WHERE status = 'new'
+        ORDER BY add_time, id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, beauty_title, title, add_time
+"""
+
+SET_MODERATION_STATUS_QUERY = """
+    UPDATE pereval SET status = %(status)s
+    WHERE id = %(id)s AND status = 'pending'
+    RETURNING id
+"""
+
+
+class IdCache:
+    """
+    LRU-кэш ключ -> id строки справочника (пользователя по email, уровня
+    сложности по четырем сезонам).
+
+    Попадание в кэш избавляет SUBMIT_PEREVAL_QUERY от upsert (и от лишней
+    версии строки, которую оставляет DO UPDATE). Если строку удалили в
+    другом процессе, вставка перевала нарушит внешний ключ - тогда запись
+    из кэша удаляется и запрос повторяется.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.warmed = False
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_id(self, value):
+        with self._lock:
+            for key in [key for key, cached in self._data.items() if cached == value]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.warmed = False
+
+    def __len__(self):
+        return len(self._data)
+
+
+user_id_cache = IdCache(getattr(settings, 'PEREVAL_USER_CACHE_SIZE', 10_000))
+# Уровней сложности немного (сочетания "1А", "2Б"... по сезонам), поэтому
+# справочник загружается в память целиком при первой отправке
+level_id_cache = IdCache(getattr(settings, 'PEREVAL_LEVEL_CACHE_SIZE', 10_000))
+
+WARM_LEVELS_QUERY = "SELECT id, winter, summer, autumn, spring FROM pereval_level ORDER BY id LIMIT %s"
+
+# Запросы с постоянным текстом готовятся на сервере один раз на соединение
+# (см. prepared). Типы указаны для параметров, которые сервер не может
+# вывести из столбцов: значения в списках SELECT и сравнениях
+statements.register('pereval_submit', SUBMIT_PEREVAL_QUERY, {
+    'email': 'text', 'fam': 'text', 'name': 'text', 'otc': 'text', 'phone': 'text',
+    'user_id': 'integer', 'level_id': 'integer',
+    'winter': 'text', 'summer': 'text', 'autumn': 'text', 'spring': 'text',
+    'beauty_title': 'text', 'title': 'text', 'other_titles': 'text', 'connect': 'text',
+    'add_time': 'timestamptz', 'date_added': 'timestamptz', 'submission_key': 'uuid',
+    'image_titles': 'text[]', 'image_sha256': 'text[]', 'image_sizes': 'integer[]',
+    'image_mime_types': 'text[]',
+})
+statements.register('pereval_warm_levels', WARM_LEVELS_QUERY, ['bigint'])
+statements.register('pereval_claim_moderation', CLAIM_MODERATION_QUERY, {'limit': 'bigint'})
+statements.register('pereval_set_moderation_status', SET_MODERATION_STATUS_QUERY, {'status': 'text'})
+
+
+def level_key(params):
+    return params['winter'], params['summer'], params['autumn'], params['spring']
+
+
 class DatabaseConnector:
-    """Класс для подключения к базе данных"""
+    """
+    Класс для подключения к базе данных через общий пул соединений.
 
-    def __init__(self):
+    read_only=True - соединение с реплики (см. db_router.read_alias); если
+    она недоступна, соединение берется из пула alias
+    """
+
+    def __init__(self, alias='default', read_only=False):
+        self.alias = alias
+        self.read_only = read_only
+        self.leased_alias = None
         self.conn = None
         self.cursor = None
 
-    def connect(self):
-        """Установка соединения с БД"""
-        try:
-            self.conn = psycopg2.connect(
-                host=os.getenv('FSTR_DB_HOST', 'localhost'),
-                port=os.getenv('FSTR_DB_PORT', '5432'),
-                database=os.getenv('FSTR_DB_NAME', 'pereval'),
-                user=os.getenv('FSTR_DB_LOGIN', 'postgres'),
-                password=os.getenv('FSTR_DB_PASS', '')
-            )
-            self.cursor = self.conn.cursor()
-            logger.info("Successfully connected to database")
-            return True
-        except Exception as e:
-            logger.error(f"Database connection error: {e}")
-            return False
+    def connect(self, autocommit=False):
+        """Получение соединения из пула"""
+        aliases = [self.alias]
+        if self.read_only:
+            replica = read_alias()
+            if replica != self.alias:
+                aliases.insert(0, replica)
+
+        for alias in aliases:
+            try:
+                with span('db_connect'):
+                    self.conn = get_pool(alias).getconn()
+                self.conn.autocommit = autocommit
+                self.cursor = self.conn.cursor()
+                self.leased_alias = alias
+                logger.debug(f"Leased database connection from pool {alias}")
+                return True
+            except Exception as e:
+                logger.error(f"Database connection error ({alias}): {e}")
+                if self.conn is not None:
+                    get_pool(alias).putconn(self.conn, close=True)
+                    self.conn = None
+                if alias != self.alias:
+                    get_replicas().mark_failed(alias)
+        return False
 
     def disconnect(self):
-        """Закрытие соединения с БД"""
+        """Возврат соединения в пул"""
         if self.cursor:
             self.cursor.close()
+            self.cursor = None
         if self.conn:
-            self.conn.close()
+            get_pool(self.leased_alias).putconn(self.conn)
+            self.conn = None
+            self.leased_alias = None
 
     def __enter__(self):
         self.connect()
@@ -52,99 +259,102 @@ class PerevalDataProcessor:
 
     def __init__(self):
         self.db = DatabaseConnector()
+        # get_pereval_by_id отдал исходное изображение вместо копии
+        self.rendition_fallback = False
 
-    def _create_or_get_user(self, user_data):
-        """Создает или получает существующего пользователя"""
-        try:
-            # Проверяем, существует ли пользователь
-            select_query = sql.SQL("""
-                SELECT id FROM pereval_user WHERE email = %s
-            """)
-            self.db.cursor.execute(select_query, (user_data['email'],))
-            result = self.db.cursor.fetchone()
-
-            if result:
-                return result[0]  # Возвращаем существующий ID
-
-            # Создаем нового пользователя
-            insert_query = sql.SQL("""
-                INSERT INTO pereval_user (email, fam, name, otc, phone)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
-            """)
-            self.db.cursor.execute(insert_query, (
-                user_data['email'],
-                user_data['fam'],
-                user_data['name'],
-                user_data.get('otc', ''),
-                user_data['phone']
-            ))
-            return self.db.cursor.fetchone()[0]
-
-        except Exception as e:
-            logger.error(f"Error creating/getting user: {e}")
-            raise
-
-    def _create_coords(self, coords_data):
-        """Создает запись координат"""
-        try:
-            insert_query = sql.SQL("""
-                INSERT INTO pereval_coords (latitude, longitude, height)
-                VALUES (%s, %s, %s)
-                RETURNING id
-            """)
-            self.db.cursor.execute(insert_query, (
-                float(coords_data['latitude']),
-                float(coords_data['longitude']),
-                int(coords_data['height'])
-            ))
-            return self.db.cursor.fetchone()[0]
-        except Exception as e:
-            logger.error(f"Error creating coords: {e}")
-            raise
-
-    def _create_level(self, level_data):
-        """Создает запись уровня сложности"""
-        try:
-            insert_query = sql.SQL("""
-                INSERT INTO pereval_level (winter, summer, autumn, spring)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id
-            """)
-            self.db.cursor.execute(insert_query, (
-                level_data.get('winter', ''),
-                level_data.get('summer', ''),
-                level_data.get('autumn', ''),
-                level_data.get('spring', '')
-            ))
-            return self.db.cursor.fetchone()[0]
-        except Exception as e:
-            logger.error(f"Error creating level: {e}")
-            raise
-
-    def _create_images(self, pereval_id, images_data):
-        """Создает записи изображений"""
-        try:
-            for img in images_data:
-                insert_query = sql.SQL("""
-                    INSERT INTO pereval_image (pereval_id, data, title, date_added)
-                    VALUES (%s, %s, %s, %s)
-                """)
-                self.db.cursor.execute(insert_query, (
-                    pereval_id,
-                    img['data'],
-                    img['title'],
-                    datetime.now()
-                ))
-        except Exception as e:
-            logger.error(f"Error creating images: {e}")
-            raise
-
-    def submit_data(self, data):
+    def _submit_params(self, data, user_data):
         """
-        Основной метод для добавления данных о перевале
+        Параметры запроса SUBMIT_PEREVAL_QUERY.
+
+        Изображения сохраняются в BlobStore здесь, до записи в БД. Если запрос
+        затем откатится, файлы останутся без ссылок, но благодаря адресации по
+        содержимому повторная отправка их переиспользует.
         """
-        # Проверка обязательных полей
+        coords_data = data['coords']
+        level_data = data['level']
+        latitude = float(coords_data['latitude'])
+        longitude = float(coords_data['longitude'])
+        with span('store_images'):
+            images = [(img['title'], store_image(img['data'])) for img in data.get('images', [])]
+
+        return {
+            'user_id': user_id_cache.get(user_data['email']),
+            'level_id': level_id_cache.get((
+                level_data.get('winter', ''), level_data.get('summer', ''),
+                level_data.get('autumn', ''), level_data.get('spring', ''),
+            )),
+            'email': user_data['email'],
+            'fam': user_data['fam'],
+            'name': user_data['name'],
+            'otc': user_data.get('otc', ''),
+            'phone': user_data['phone'],
+            'latitude': latitude,
+            'longitude': longitude,
+            'height': int(coords_data['height']),
+            'geohash': encode(latitude, longitude),
+            'winter': level_data.get('winter', ''),
+            'summer': level_data.get('summer', ''),
+            'autumn': level_data.get('autumn', ''),
+            'spring': level_data.get('spring', ''),
+            'beauty_title': data['beauty_title'],
+            'title': data['title'],
+            'other_titles': data.get('other_titles', ''),
+            'connect': data.get('connect', ''),
+            # Время с часовым поясом: одинаково для SUBMIT_PEREVAL_QUERY и
+            # create_batch, не зависит от TimeZone сессии
+            'add_time': aware_datetime(data.get('add_time')).isoformat(),
+            'image_titles': [title for title, _ in images],
+            'image_sha256': [stored.sha256 for _, stored in images],
+            'image_sizes': [stored.size for _, stored in images],
+            'image_mime_types': [stored.mime_type for _, stored in images],
+            'date_added': timezone.now(),
+            'submission_key': None,
+        }
+
+    def _execute_submit(self, params):
+        """Выполняет SUBMIT_PEREVAL_QUERY в автокоммите и возвращает id перевала"""
+        if not level_id_cache.warmed:
+            self._warm_level_cache()
+            if params['level_id'] is None:
+                params = {**params, 'level_id': level_id_cache.get(level_key(params))}
+        try:
+            statements.execute(self.db.cursor, 'pereval_submit', params)
+        except errors.UniqueViolation:
+            # Отчет с этим ключом уже записан (повторная доставка из очереди)
+            pereval_id = self._submitted_pereval(params)
+            if pereval_id is None:
+                raise
+            return pereval_id
+        except errors.ForeignKeyViolation:
+            if params['user_id'] is None and params['level_id'] is None:
+                raise
+            # Пользователь или уровень из кэша удален - повторяем с upsert
+            user_id_cache.discard(params['email'])
+            level_id_cache.discard(level_key(params))
+            params = {**params, 'user_id': None, 'level_id': None}
+            statements.execute(self.db.cursor, 'pereval_submit', params)
+        pereval_id, user_id, level_id = self.db.cursor.fetchone()
+        user_id_cache.set(params['email'], user_id)
+        level_id_cache.set(level_key(params), level_id)
+        return pereval_id
+
+    def _submitted_pereval(self, params):
+        """id перевала, уже записанного с ключом отправки из params, или None"""
+        if params['submission_key'] is None:
+            return None
+        self.db.cursor.execute(SUBMITTED_PEREVAL_QUERY, params)
+        row = self.db.cursor.fetchone()
+        return row[0] if row else None
+
+    def _warm_level_cache(self):
+        """Загружает справочник уровней сложности в level_id_cache"""
+        statements.execute(self.db.cursor, 'pereval_warm_levels', (level_id_cache.max_size,))
+        for level_id, *seasons in self.db.cursor.fetchall():
+            level_id_cache.set(tuple(seasons), level_id)
+        level_id_cache.warmed = True
+
+    def _check_required(self, data):
+        """Проверка обязательных полей; возвращает ответ с ошибкой или None"""
         required_fields = ['beauty_title', 'title', 'user', 'coords', 'level', 'images']
         missing_fields = []
 
@@ -170,68 +380,41 @@ class PerevalDataProcessor:
                     "message": f"Missing required user field: {field}",
                     "id": None
                 }
+        return None
+
+    def submit_data(self, data):
+        """
+        Основной метод для добавления данных о перевале
+        """
+        # Проверка обязательных полей
+        error = self._check_required(data)
+        if error is not None:
+            return error
+        user_data = data['user']
+
+        try:
+            params = self._submit_params(data, user_data)
+        except ValueError as e:
+            return {
+                "status": 400,
+                "message": str(e),
+                "id": None
+            }
 
         try:
-            # Подключение к БД
-            if not self.db.connect():
+            # Подключение к БД. Весь граф записывается одним запросом,
+            # который атомарен сам по себе, поэтому отдельные BEGIN/COMMIT
+            # не нужны
+            if not self.db.connect(autocommit=True):
                 return {
                     "status": 500,
                     "message": "Ошибка подключения к базе данных",
                     "id": None
                 }
 
-            # Начинаем транзакцию
-            self.db.cursor.execute("BEGIN")
-
-            # 1. Создаем/получаем пользователя
-            user_id = self._create_or_get_user(user_data)
-
-            # 2. Создаем координаты
-            coords_id = self._create_coords(data['coords'])
-
-            # 3. Создаем уровень сложности
-            level_id = self._create_level(data['level'])
-
-            # 4. Создаем перевал
-            add_time = data.get("add_time")
-            if isinstance(add_time, datetime):
-                add_time_str = add_time.strftime('%Y-%m-%d %H:%M:%S')
-            elif add_time:
-                add_time_str = add_time
-            else:
-                add_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            insert_query = sql.SQL("""
-                INSERT INTO pereval (
-                    beauty_title, title, other_titles, connect, 
-                    add_time, user_id, coords_id, level_id, status
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """)
-
-            self.db.cursor.execute(insert_query, (
-                data['beauty_title'],
-                data['title'],
-                data.get('other_titles', ''),
-                data.get('connect', ''),
-                add_time_str,
-                user_id,
-                coords_id,
-                level_id,
-                'new'  # Статус по умолчанию
-            ))
-
-            # Получаем ID вставленного перевала
-            pereval_id = self.db.cursor.fetchone()[0]
-
-            # 5. Создаем изображения
-            images = data.get('images', [])
-            if images:
-                self._create_images(pereval_id, images)
-
-            # Фиксируем транзакцию
-            self.db.conn.commit()
+            with span('insert'):
+                pereval_id = self._execute_submit(params)
+            schedule_renditions(params['image_sha256'])
 
             return {
                 "status": 200,
@@ -240,9 +423,6 @@ class PerevalDataProcessor:
             }
 
         except Exception as e:
-            if self.db.conn:
-                self.db.conn.rollback()
-
             logger.error(f"Error submitting data: {e}")
             return {
                 "status": 500,
@@ -253,70 +433,200 @@ class PerevalDataProcessor:
         finally:
             self.db.disconnect()
 
-    def get_pereval_by_id(self, pereval_id):
-        """Получение данных о перевале по ID"""
+    def submit_batch(self, reports):
+        """
+        Добавление пачки перевалов, уже проверенных PerevalSerializer.
+
+        Возвращает результат для каждого отчета в том же формате, что и
+        submit_data. Пачка пишется одной транзакцией; если она не прошла,
+        отчеты записываются по одному, чтобы ошибка в одном из них не
+        помешала остальным.
+        """
+        results = [None] * len(reports)
+        batch = []
+        positions = []
+        for position, data in enumerate(reports):
+            try:
+                batch.append(self._submit_params(data, data['user']))
+                positions.append(position)
+            except ValueError as e:
+                results[position] = {"status": 400, "message": str(e), "id": None}
+        for position, result in zip(positions, self.submit_prepared(batch)):
+            results[position] = result
+        return results
+
+    def submit_prepared(self, batch):
+        """
+        Запись пачки готовых параметров SUBMIT_PEREVAL_QUERY (см. _submit_params).
+
+        Пачка пишется одной транзакцией через PerevalRepository; если она не
+        прошла, отчеты записываются по одному. Возвращает результат для
+        каждого отчета.
+        """
+        if not batch:
+            return []
+
+        try:
+            pereval_ids = PerevalRepository(self.db.alias).create_batch(batch)
+        except Exception as e:
+            logger.warning(f"Batch of {len(batch)} perevals failed, retrying one by one: {e}")
+        else:
+            schedule_renditions([digest for params in batch for digest in params['image_sha256']])
+            return [{"status": 200, "message": "Отправлено успешно", "id": pereval_id}
+                    for pereval_id in pereval_ids]
+
+        if not self.db.connect(autocommit=True):
+            return [{"status": 500, "message": "Ошибка подключения к базе данных", "id": None} for _ in batch]
+
+        try:
+            results = []
+            for params in batch:
+                try:
+                    with span('insert'):
+                        pereval_id = self._execute_submit(params)
+                    results.append({"status": 200, "message": "Отправлено успешно", "id": pereval_id})
+                    schedule_renditions(params['image_sha256'])
+                except Exception as e:
+                    logger.error(f"Error submitting data: {e}")
+                    results.append({"status": 500, "message": f"Ошибка при выполнении операции: {str(e)}",
+                                    "id": None})
+            return results
+
+        finally:
+            self.db.disconnect()
+
+    def _read_image(self, digest, legacy_data, size=None):
+        """
+        Содержимое изображения в base64: из BlobStore или из старого столбца data.
+
+        size - имя уменьшенной копии (см. thumbnails); если копию получить
+        не удалось, отдается исходное изображение и ставится rendition_fallback.
+        """
+        if digest and size:
+            rendition = read_rendition(digest, size)
+            if rendition is not None:
+                return base64.b64encode(rendition).decode('ascii')
+            self.rendition_fallback = True
+        if digest:
+            return base64.b64encode(get_blob_store().read(digest)).decode('ascii')
+        return legacy_data
+
+    def _image_meta(self, image):
+        """Метаданные изображения со ссылкой на содержимое, без самих данных"""
+        return {
+            'id': image.id,
+            'title': image.title,
+            'size': image.size,
+            'mime_type': image.mime_type,
+            'date_added': image.date_added,
+            'url': reverse('image-data', args=[image.id]),
+        }
+
+    def get_pereval_by_id(self, pereval_id, size=None, image_mode='data'):
+        """
+        Получение данных о перевале по ID.
+
+        size - размер копий изображений; image_mode='meta' - вместо содержимого
+        изображений только их метаданные и ссылки на GET /api/images/<id>/
+        """
+        # База для чтения выбирает PrimaryReplicaRouter
+        repository = PerevalRepository()
         try:
-            if not self.db.connect():
+            pereval = repository.get(pereval_id, with_content=image_mode != 'meta')
+            if pereval is None:
                 return None
 
-            query = sql.SQL("""
-                SELECT 
-                    p.id, p.beauty_title, p.title, p.other_titles, p.connect,
-                    p.add_time, p.status,
-                    u.email, u.fam, u.name, u.otc, u.phone,
-                    c.latitude, c.longitude, c.height,
-                    l.winter, l.summer, l.autumn, l.spring
-                FROM pereval p
-                JOIN pereval_user u ON p.user_id = u.id
-                JOIN pereval_coords c ON p.coords_id = c.id
-                JOIN pereval_level l ON p.level_id = l.id
-                WHERE p.id = %s
-            """)
-
-            self.db.cursor.execute(query, (pereval_id,))
-            result = self.db.cursor.fetchone()
-
-            if result:
-                # Получаем изображения
-                img_query = sql.SQL("""
-                    SELECT data, title FROM pereval_image 
-                    WHERE pereval_id = %s
-                """)
-                self.db.cursor.execute(img_query, (pereval_id,))
-                images = [{'data': row[0], 'title': row[1]} for row in self.db.cursor.fetchall()]
+            if image_mode == 'meta':
+                images = [self._image_meta(image) for image in pereval.images.all()]
+            else:
+                # Старые изображения без sha256 хранят base64 в столбце data:
+                # он загружается только для них
+                legacy_data = repository.legacy_image_data(
+                    [image.id for image in pereval.images.all() if not image.sha256]
+                )
+                images = [
+                    {'data': self._read_image(image.sha256, legacy_data.get(image.id), size),
+                     'title': image.title}
+                    for image in pereval.images.all()
+                ]
 
-                return {
-                    "id": result[0],
-                    "beauty_title": result[1],
-                    "title": result[2],
-                    "other_titles": result[3],
-                    "connect": result[4],
-                    "add_time": result[5],
-                    "status": result[6],
-                    "user": {
-                        "email": result[7],
-                        "fam": result[8],
-                        "name": result[9],
-                        "otc": result[10],
-                        "phone": result[11]
-                    },
-                    "coords": {
-                        "latitude": float(result[12]),
-                        "longitude": float(result[13]),
-                        "height": result[14]
-                    },
-                    "level": {
-                        "winter": result[15],
-                        "summer": result[16],
-                        "autumn": result[17],
-                        "spring": result[18]
-                    },
-                    "images": images
-                }
-            return None
+            user, coords, level = pereval.user, pereval.coords, pereval.level
+            return {
+                "id": pereval.id,
+                "beauty_title": pereval.beauty_title,
+                "title": pereval.title,
+                "other_titles": pereval.other_titles,
+                "connect": pereval.connect,
+                "add_time": pereval.add_time,
+                "status": pereval.status,
+                "user": {
+                    "email": user.email,
+                    "fam": user.fam,
+                    "name": user.name,
+                    "otc": user.otc,
+                    "phone": user.phone
+                },
+                "coords": {
+                    "latitude": float(coords.latitude),
+                    "longitude": float(coords.longitude),
+                    "height": coords.height
+                },
+                "level": {
+                    "winter": level.winter,
+                    "summer": level.summer,
+                    "autumn": level.autumn,
+                    "spring": level.spring
+                },
+                "images": images
+            }
 
         except Exception as e:
             logger.error(f"Error getting pereval: {e}")
             return None
+
+    def claim_for_moderation(self, limit):
+        """
+        Забирает до limit новых перевалов в работу (статус pending).
+
+        Возвращает список перевалов в порядке добавления или None при ошибке БД.
+        """
+        try:
+            if not self.db.connect(autocommit=True):
+                return None
+
+            statements.execute(self.db.cursor, 'pereval_claim_moderation', {'limit': limit})
+            rows = sorted(self.db.cursor.fetchall(), key=lambda row: (row[3], row[0]))
+        except Exception as e:
+            logger.error(f"Error claiming perevals for moderation: {e}")
+            return None
+        finally:
+            self.db.disconnect()
+
+        invalidate_pereval(*(row[0] for row in rows))
+        return [
+            {"id": row[0], "beauty_title": row[1], "title": row[2], "add_time": row[3], "status": "pending"}
+            for row in rows
+        ]
+
+    def set_moderation_status(self, pereval_id, status):
+        """
+        Завершает модерацию перевала, находящегося в работе.
+
+        Возвращает True, если статус изменен, False, если перевал не в работе,
+        и None при ошибке БД.
+        """
+        try:
+            if not self.db.connect(autocommit=True):
+                return None
+
+            statements.execute(self.db.cursor, 'pereval_set_moderation_status', {'id': pereval_id, 'status': status})
+            updated = self.db.cursor.fetchone() is not None
+        except Exception as e:
+            logger.error(f"Error setting moderation status: {e}")
+            return None
         finally:
-            self.db.disconnect()
\ No newline at end of file
+            self.db.disconnect()
+
+        if updated:
+            invalidate_pereval(pereval_id)
+        return updated
@@ -0,0 +1,39 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel, is_psycopg3
+
+from pereval_app.db_pool import get_pool
+
+if not is_psycopg3:
+    import psycopg2.extras
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend, берущий соединения из общего пула pereval_app.db_pool.
+
+    Django при "закрытии" соединения возвращает его в пул, а не разрывает,
+    поэтому ORM и PerevalDataProcessor используют один набор соединений.
+    Пул открывает соединения тем же драйвером, что и Django (psycopg 3, если
+    он установлен, иначе psycopg2), и с теми же параметрами.
+    """
+
+    def get_new_connection(self, conn_params):
+        if self.settings_dict['OPTIONS'].get('pool'):
+            raise ImproperlyConfigured("OPTIONS['pool'] is not supported, connections come from pereval_app.db_pool")
+        options = self.settings_dict['OPTIONS']
+        connection = get_pool(self.alias, conn_params).getconn()
+        if 'isolation_level' in options:
+            self.isolation_level = IsolationLevel(options['isolation_level'])
+            connection.isolation_level = self.isolation_level
+        else:
+            self.isolation_level = IsolationLevel.READ_COMMITTED
+        if not is_psycopg3:
+            psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                get_pool(self.alias).putconn(self.connection)
+                self.connection = None
@@ -0,0 +1,256 @@
+import threading
+import time
+import logging
+from collections import deque
+
+from django.conf import settings
+
+from .pg_driver import (
+    TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN, Database, Error, InterfaceError, OperationalError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(OperationalError):
+    """Свободное соединение не появилось за отведенное время"""
+
+
+class ConnectionPool:
+    """
+    Ограниченный потокобезопасный пул соединений драйвера Django
+    (psycopg 3 или psycopg2, см. pg_driver).
+
+    Соединения выдаются через getconn() и возвращаются через putconn().
+    Если все соединения заняты, getconn() ждет освобождения не дольше timeout
+    секунд. Перед выдачей соединение проверяется: закрытые и "сломанные"
+    соединения отбрасываются, а простаивавшие дольше check_interval
+    пингуются запросом SELECT 1.
+
+    session - пары (SQL, параметры), выполняемые на каждом новом соединении
+    (часовой пояс и роль сессии, как в init_connection_state Django).
+    """
+
+    def __init__(self, conn_params, max_size=10, timeout=30.0, check_interval=30.0, session=()):
+        if max_size < 1:
+            raise ValueError("max_size must be positive")
+        self.conn_params = conn_params
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.session = list(session)
+
+        self._idle = deque()  # (connection, время возврата в пул)
+        self._size = 0  # открытых соединений, выданных и свободных
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._stats = {
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'checkouts': 0,
+            'checkout_waits': 0,
+            'checkout_timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def _connect(self):
+        conn = Database.connect(**self.conn_params)
+        if self.session:
+            try:
+                with conn.cursor() as cursor:
+                    for sql, params in self.session:
+                        cursor.execute(sql, params)
+                conn.commit()
+            except Exception:
+                conn.close()
+                raise
+        with self._cond:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        """Проверка соединения перед выдачей"""
+        if conn.closed:
+            return False
+        status = conn.info.transaction_status
+        if status != TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - idle_since < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['connections_discarded'] += 1
+            self._cond.notify()
+
+    def getconn(self):
+        """Выдает соединение из пула, при необходимости открывая новое"""
+        deadline = time.monotonic() + self.timeout
+        waited = None
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise InterfaceError("connection pool is closed")
+
+                while not self._idle and self._size >= self.max_size:
+                    if waited is None:
+                        waited = time.monotonic()
+                        self._stats['checkout_waits'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['checkout_timeouts'] += 1
+                        logger.warning(
+                            f"Connection pool exhausted: {self._size}/{self.max_size} in use"
+                        )
+                        raise PoolTimeout(
+                            f"No free connection in pool after {self.timeout} seconds"
+                        )
+                    self._cond.wait(remaining)
+
+                if waited is not None:
+                    elapsed = time.monotonic() - waited
+                    self._stats['wait_seconds_total'] += elapsed
+                    self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], elapsed)
+                    waited = None
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    conn, idle_since = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                logger.info("Discarding unhealthy pooled connection")
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Возвращает соединение в пул"""
+        if not close and not conn.closed:
+            try:
+                status = conn.info.transaction_status
+                if status == TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Error:
+                close = True
+
+        with self._cond:
+            if not (close or conn.closed or self._closed):
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    def closeall(self):
+        """Закрывает все свободные соединения и запрещает новые выдачи"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Счетчики пула для мониторинга"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            })
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def libpq_params(conn_params):
+    """
+    Только параметры подключения libpq из get_connection_params() Django,
+    без объектов драйвера (context, cursor_factory) - для строки подключения
+    асинхронного пула.
+    """
+    return {key: value for key, value in conn_params.items() if isinstance(value, (str, int))}
+
+
+def session_settings(alias):
+    """
+    Настройки сессии базы alias, которые Django задает своим соединениям:
+    часовой пояс (UTC при USE_TZ) и роль из OPTIONS['assume_role']
+    """
+    from django.db import connections
+    wrapper = connections[alias]
+    session = []
+    if wrapper.timezone_name:
+        session.append(("SELECT set_config('TimeZone', %s, false)", [wrapper.timezone_name]))
+    role = wrapper.settings_dict['OPTIONS'].get('assume_role')
+    if role:
+        session.append(("SELECT set_config('role', %s, false)", [role]))
+    return session
+
+
+def get_pool(alias='default', conn_params=None):
+    """
+    Возвращает общий для процесса пул соединений базы данных alias.
+
+    Параметры подключения и настройки сессии берутся из
+    settings.DATABASES[alias] через backend Django, поэтому ORM и
+    PerevalDataProcessor работают с одним и тем же набором одинаково
+    настроенных соединений: сырой SQL читает время без пояса в том же
+    часовом поясе, что и ORM.
+    """
+    pool = _pools.get(alias)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        if alias not in _pools:
+            if conn_params is None:
+                from django.db import connections
+                conn_params = connections[alias].get_connection_params()
+            options = getattr(settings, 'DB_POOL', {})
+            _pools[alias] = ConnectionPool(
+                conn_params,
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 30.0),
+                check_interval=options.get('CHECK_INTERVAL', 30.0),
+                session=session_settings(alias),
+            )
+        return _pools[alias]
+
+
+def pool_stats():
+    """Статистика всех созданных пулов по псевдонимам БД"""
+    return {alias: pool.stats() for alias, pool in list(_pools.items())}
@@ -0,0 +1,311 @@
+"""
+Чтение с реплик PostgreSQL.
+
+Реплики - псевдонимы из settings.DATABASES, перечисленные в
+PEREVAL_REPLICAS['ALIASES']. PrimaryReplicaRouter отправляет запросы
+чтения ORM на реплику, запись - всегда в default; DatabaseConnector с
+read_only=True берет соединение из пула реплики тем же выбором.
+
+Реплика выбирается по кругу (round_robin) или с наименьшей задержкой
+(least_latency). Раз в PROBE_INTERVAL секунд фоновый поток проверяет
+реплики запросом задержки репликации: недоступные и отставшие больше
+MAX_LAG_SECONDS исключаются до следующей проверки. Запросы клиентов
+проверку не ждут. Если подходящих реплик нет, чтение идет в default.
+
+Свои записи клиент читает с основной базы: StickyPrimaryMiddleware
+закрепляет за default запросы, изменяющие данные, и после успешного
+изменения ставит подписанную cookie, с которой следующие STICKY_SECONDS
+секунд все запросы клиента тоже читают с default. Вне запросов то же
+делает use_primary().
+"""
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('round_robin', 'least_latency')
+
+DEFAULT_OPTIONS = {
+    'ALIASES': [],
+    'STRATEGY': 'round_robin',
+    'PROBE_INTERVAL': 5.0,
+    'MAX_LAG_SECONDS': 10.0,
+    'STICKY_SECONDS': 10,
+    'COOKIE': 'pereval_primary',
+}
+
+# Соль подписи cookie: подпись не подходит к другим cookie с тем же SECRET_KEY
+COOKIE_SALT = 'pereval_app.db_router.sticky'
+
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+# Отставание реплики в секундах. Если реплика применила все полученное,
+# отставания нет, даже если на основной базе давно ничего не менялось
+REPLICATION_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Вес нового замера в скользящем среднем задержки
+LATENCY_SMOOTHING = 0.3
+
+_primary_pinned = contextvars.ContextVar('pereval_primary_pinned', default=False)
+
+
+def get_options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'PEREVAL_REPLICAS', {})}
+
+
+class ReplicaSet:
+    """Выбор реплики для чтения и периодическая проверка их состояния"""
+
+    def __init__(self, aliases, strategy='round_robin', probe_interval=5.0, max_lag=10.0):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown replica strategy {strategy!r}, expected one of {STRATEGIES}")
+        self.aliases = list(aliases)
+        self.strategy = strategy
+        self.probe_interval = probe_interval
+        self.max_lag = max_lag
+
+        self._state = {
+            alias: {'healthy': True, 'latency_seconds': None, 'lag_seconds': None, 'reads': 0}
+            for alias in self.aliases
+        }
+        self._cycle = itertools.count()
+        self._lock = threading.Lock()
+        self._prober = None
+        self._prober_pid = None
+        self._stopped = threading.Event()
+
+    def _probe(self, alias):
+        """Задержка запроса к реплике и ее отставание; None, если реплика недоступна"""
+        connection = connections[alias]
+        started = time.perf_counter()
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(REPLICATION_LAG_QUERY)
+                    lag = float(cursor.fetchone()[0])
+                else:
+                    # Заглушки (например, SQLite в тестах) не реплицируются
+                    cursor.execute("SELECT 1")
+                    lag = 0.0
+        except Exception as e:
+            logger.warning(f"Replica {alias} probe failed: {e}")
+            # Следующая проверка подключится заново
+            connection.close()
+            return None
+        return time.perf_counter() - started, lag
+
+    def probe(self):
+        """Проверяет все реплики и обновляет их состояние"""
+        for alias in self.aliases:
+            result = self._probe(alias)
+            with self._lock:
+                state = self._state[alias]
+                if result is None:
+                    state['healthy'] = False
+                    continue
+                latency, lag = result
+                previous = state['latency_seconds']
+                state['latency_seconds'] = latency if previous is None else (
+                    previous + LATENCY_SMOOTHING * (latency - previous)
+                )
+                state['lag_seconds'] = lag
+                healthy = lag <= self.max_lag
+                if state['healthy'] and not healthy:
+                    logger.warning(f"Replica {alias} lags {lag:.1f}s behind, reading from others")
+                state['healthy'] = healthy
+
+    def start(self):
+        """
+        Запускает фоновую проверку реплик, если она еще не идет в этом
+        процессе (после fork поток родителя не наследуется)
+        """
+        with self._lock:
+            if not self.aliases or (self._prober is not None and self._prober_pid == os.getpid()):
+                return
+            self._stopped.clear()
+            self._prober = threading.Thread(target=self._run, name='pereval-replica-probe', daemon=True)
+            self._prober_pid = os.getpid()
+        self._prober.start()
+
+    def stop(self):
+        """Останавливает фоновую проверку"""
+        self._stopped.set()
+        with self._lock:
+            prober, self._prober = self._prober, None
+        if prober is not None and prober.is_alive():
+            prober.join()
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    self.probe()
+                except Exception:
+                    logger.exception("Replica probe failed")
+                if self._stopped.wait(self.probe_interval):
+                    break
+        finally:
+            # Соединения Django у каждого потока свои
+            connections.close_all()
+
+    def choose(self):
+        """Псевдоним реплики для чтения или None, если подходящих нет"""
+        if not self.aliases:
+            return None
+        self.start()
+        with self._lock:
+            candidates = [alias for alias in self.aliases if self._state[alias]['healthy']]
+            if not candidates:
+                return None
+            if self.strategy == 'least_latency':
+                alias = min(candidates, key=lambda name: self._state[name]['latency_seconds'] or 0.0)
+            else:
+                alias = candidates[next(self._cycle) % len(candidates)]
+            self._state[alias]['reads'] += 1
+        return alias
+
+    def mark_failed(self, alias):
+        """Исключает реплику до следующей проверки (например, при ошибке подключения)"""
+        with self._lock:
+            if alias in self._state:
+                self._state[alias]['healthy'] = False
+
+    def stats(self):
+        """Состояние реплик по псевдонимам для мониторинга"""
+        with self._lock:
+            return {alias: dict(state) for alias, state in self._state.items()}
+
+
+_replicas = None
+_replicas_lock = threading.Lock()
+
+
+def get_replicas():
+    """Общий для процесса набор реплик, настроенный через PEREVAL_REPLICAS"""
+    global _replicas
+    if _replicas is None:
+        with _replicas_lock:
+            if _replicas is None:
+                options = get_options()
+                _replicas = ReplicaSet(
+                    options['ALIASES'],
+                    strategy=options['STRATEGY'],
+                    probe_interval=options['PROBE_INTERVAL'],
+                    max_lag=options['MAX_LAG_SECONDS'],
+                )
+    return _replicas
+
+
+def primary_pinned():
+    """Читает ли текущий запрос или контекст с основной базы"""
+    return _primary_pinned.get()
+
+
+@contextmanager
+def use_primary():
+    """Все чтения внутри блока идут в default"""
+    token = _primary_pinned.set(True)
+    try:
+        yield
+    finally:
+        _primary_pinned.reset(token)
+
+
+def read_alias():
+    """Псевдоним базы для очередного чтения"""
+    # Внутри транзакции на основной базе реплика не видит ее изменений
+    if _primary_pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return get_replicas().choose() or DEFAULT_DB_ALIAS
+
+
+class PrimaryReplicaRouter:
+    """Чтение ORM - с реплик (см. read_alias), запись и миграции - в default"""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Связанные объекты читаются из той же базы, что и сам объект
+            return instance._state.db
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class StickyPrimaryMiddleware:
+    """
+    Чтение своих записей: изменяющие запросы и запросы в течение
+    STICKY_SECONDS после успешного изменения работают с default.
+
+    Cookie подписана, и срок проверяется по времени подписи: клиент не
+    может сам продлить окно или закрепить за default все свои запросы.
+    Работает и в синхронном, и в асинхронном стеке без переходов между ними.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pinned(self, request, options):
+        if request.method not in SAFE_METHODS:
+            return True
+        if not options['STICKY_SECONDS']:
+            return False
+        return request.get_signed_cookie(
+            options['COOKIE'], default=None, salt=COOKIE_SALT, max_age=options['STICKY_SECONDS'],
+        ) is not None
+
+    def _remember_write(self, request, response, options):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and options['STICKY_SECONDS']:
+            response.set_signed_cookie(
+                options['COOKIE'], '1', salt=COOKIE_SALT,
+                max_age=options['STICKY_SECONDS'], httponly=True, samesite='Lax',
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        options = get_options()
+        token = _primary_pinned.set(self._pinned(request, options))
+        try:
+            response = self.get_response(request)
+        finally:
+            _primary_pinned.reset(token)
+        return self._remember_write(request, response, options)
+
+    async def __acall__(self, request):
+        options = get_options()
+        token = _primary_pinned.set(self._pinned(request, options))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _primary_pinned.reset(token)
+        return self._remember_write(request, response, options)
@@ -0,0 +1,124 @@
+"""
+Геохеш и геометрия на сфере без внешних зависимостей.
+
+Геохеш точки хранится в pereval_coords.geohash под обычным B-tree индексом:
+все точки ячейки имеют общий префикс, поэтому поиск в прямоугольнике
+сводится к нескольким диапазонным сканированиям по LIKE 'префикс%'.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Геохеш точки заданной длины"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = bits * 2 + 1
+                lon_range[0] = mid
+            else:
+                bits *= 2
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = bits * 2 + 1
+                lat_range[0] = mid
+            else:
+                bits *= 2
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Размер ячейки геохеша (высота и ширина в градусах)"""
+    lat_bits = precision * 5 // 2
+    lon_bits = precision * 5 - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def cover_bbox(min_lat, min_lon, max_lat, max_lon, max_cells=16):
+    """
+    Префиксы геохешей, покрывающие прямоугольник (min_lon <= max_lon).
+
+    Выбирается самая точная длина, при которой ячеек не больше max_cells.
+    Возвращает пустой список, если даже однобуквенных ячеек нужно больше
+    (тогда индекс не поможет и искать надо по широте/долготе).
+    """
+    chosen = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        cell_h, cell_w = cell_size(precision)
+        rows = math.floor((max_lat + 90) / cell_h) - math.floor((min_lat + 90) / cell_h) + 1
+        cols = math.floor((max_lon + 180) / cell_w) - math.floor((min_lon + 180) / cell_w) + 1
+        if rows * cols > max_cells:
+            break
+        chosen = precision, cell_h, cell_w, rows, cols
+    if chosen is None:
+        return []
+
+    precision, cell_h, cell_w, rows, cols = chosen
+    start_lat = math.floor((min_lat + 90) / cell_h) * cell_h - 90
+    start_lon = math.floor((min_lon + 180) / cell_w) * cell_w - 180
+    cells = set()
+    for row in range(rows):
+        lat = min(start_lat + (row + 0.5) * cell_h, 90.0)
+        for col in range(cols):
+            lon = min(start_lon + (col + 0.5) * cell_w, 180.0)
+            cells.add(encode(lat, lon, precision))
+    return sorted(cells)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Расстояние по большому кругу в километрах"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(latitude, longitude, radius_km):
+    """
+    Прямоугольник (min_lat, min_lon, max_lat, max_lon), содержащий круг радиуса radius_km.
+
+    Если круг пересекает антимеридиан, min_lon > max_lon.
+    """
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(latitude - d_lat, -90.0)
+    max_lat = min(latitude + d_lat, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return min_lat, -180.0, max_lat, 180.0
+
+    d_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(latitude))))
+    if d_lon >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    min_lon = longitude - d_lon
+    max_lon = longitude + d_lon
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def split_antimeridian(min_lat, min_lon, max_lat, max_lon):
+    """Разбивает прямоугольник, пересекающий антимеридиан, на два обычных"""
+    if min_lon <= max_lon:
+        return [(min_lat, min_lon, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
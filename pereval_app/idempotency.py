@@ -0,0 +1,155 @@
+"""
+Идемпотентность POST /api/submitData/ по заголовку Idempotency-Key.
+
+Ключ занимается одним INSERT ... ON CONFLICT DO NOTHING: из параллельных
+запросов с одинаковым ключом строку вставит ровно один, остальные получат
+пустой RETURNING и прочитают уже существующую запись. После обработки в
+строку записывается ответ, который повторные запросы получают без обращения
+к PerevalDataProcessor. Истекшие ключи занимаются заново тем же запросом.
+
+Пока ответа нет, ключ занят до locked_until (PEREVAL_IDEMPOTENCY_LOCK_SECONDS).
+Если обработчик упал, не освободив ключ, после этого срока повтор запроса
+занимает ключ заново, а не получает 409 до конца TTL. Ответ сохраняет и
+ключ освобождает только тот, кто занял ключ последним: locked_until из
+claim() передается в complete() и release() как признак владельца.
+"""
+import hashlib
+import json
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .data_processor import DatabaseConnector
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_LOCK_SECONDS = 60
+MAX_KEY_LENGTH = 255
+
+CLAIM_KEY_QUERY = """
+    INSERT INTO pereval_idempotency_key (key, request_hash, created_at, expires_at, locked_until)
+    VALUES (%(key)s, %(request_hash)s, now(), now() + %(ttl)s * interval '1 second',
+            now() + %(lock_seconds)s * interval '1 second')
+    ON CONFLICT (key) DO UPDATE SET
+        request_hash = EXCLUDED.request_hash,
+        status_code = NULL,
+        response = NULL,
+        created_at = EXCLUDED.created_at,
+        expires_at = EXCLUDED.expires_at,
+        locked_until = EXCLUDED.locked_until
+    WHERE pereval_idempotency_key.expires_at < now()
+       OR (pereval_idempotency_key.status_code IS NULL
+           AND (pereval_idempotency_key.locked_until IS NULL OR pereval_idempotency_key.locked_until < now()))
+    RETURNING locked_until
+"""
+
+GET_KEY_QUERY = """
+    SELECT request_hash, status_code, response::text
+    FROM pereval_idempotency_key
+    WHERE key = %(key)s
+"""
+
+COMPLETE_KEY_QUERY = """
+    UPDATE pereval_idempotency_key
+    SET status_code = %(status_code)s, response = %(response)s::jsonb, locked_until = NULL
+    WHERE key = %(key)s AND request_hash = %(request_hash)s AND locked_until = %(lease)s
+"""
+
+RELEASE_KEY_QUERY = """
+    DELETE FROM pereval_idempotency_key
+    WHERE key = %(key)s AND request_hash = %(request_hash)s AND status_code IS NULL
+      AND locked_until = %(lease)s
+"""
+
+PURGE_EXPIRED_QUERY = "DELETE FROM pereval_idempotency_key WHERE expires_at < now()"
+
+# Результат claim(): CLAIMED - ключ занят этим запросом, IN_PROGRESS - его
+# обрабатывает другой запрос, MISMATCH - ключ уже использован с другим телом,
+# REPLAY - есть сохраненный ответ (status_code, response). У CLAIMED в lease
+# время, до которого ключ занят этим запросом
+CLAIMED = 'claimed'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+REPLAY = 'replay'
+
+Claim = namedtuple('Claim', ['state', 'status_code', 'response', 'lease'], defaults=[None])
+
+
+def get_ttl():
+    return getattr(settings, 'PEREVAL_IDEMPOTENCY_TTL', DEFAULT_TTL)
+
+
+def get_lock_seconds():
+    return getattr(settings, 'PEREVAL_IDEMPOTENCY_LOCK_SECONDS', DEFAULT_LOCK_SECONDS)
+
+
+def request_fingerprint(payload):
+    """SHA-256 тела запроса в каноническом виде (порядок ключей не важен)"""
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """Ключи идемпотентности в таблице pereval_idempotency_key"""
+
+    def __init__(self, alias='default', ttl=None, lock_seconds=None):
+        self.db = DatabaseConnector(alias)
+        self.ttl = ttl if ttl is not None else get_ttl()
+        self.lock_seconds = lock_seconds if lock_seconds is not None else get_lock_seconds()
+
+    def _execute(self, query, params):
+        """Выполняет запрос в автокоммите и возвращает первую строку результата"""
+        if not self.db.connect(autocommit=True):
+            raise ConnectionError("Ошибка подключения к базе данных")
+        try:
+            self.db.cursor.execute(query, params)
+            if self.db.cursor.description is None:
+                return None
+            return self.db.cursor.fetchone()
+        finally:
+            self.db.disconnect()
+
+    def claim(self, key, request_hash):
+        """Занимает ключ или возвращает состояние уже существующего"""
+        params = {'key': key, 'request_hash': request_hash, 'ttl': self.ttl, 'lock_seconds': self.lock_seconds}
+        row = self._execute(CLAIM_KEY_QUERY, params)
+        if row is not None:
+            return Claim(CLAIMED, None, None, row[0])
+
+        row = self._execute(GET_KEY_QUERY, params)
+        if row is None:
+            # Ключ удалили между двумя запросами - пробуем занять еще раз
+            return self.claim(key, request_hash)
+        stored_hash, status_code, response = row
+        if stored_hash != request_hash:
+            return Claim(MISMATCH, None, None)
+        if status_code is None:
+            return Claim(IN_PROGRESS, None, None)
+        return Claim(REPLAY, status_code, json.loads(response))
+
+    def complete(self, key, request_hash, lease, status_code, response):
+        """Сохраняет ответ на запрос с ключом, если ключ все еще занят этим запросом"""
+        self._execute(COMPLETE_KEY_QUERY, {
+            'key': key,
+            'request_hash': request_hash,
+            'lease': lease,
+            'status_code': status_code,
+            'response': json.dumps(response, ensure_ascii=False, cls=DjangoJSONEncoder),
+        })
+
+    def release(self, key, request_hash, lease):
+        """Освобождает ключ, чтобы клиент мог повторить запрос (после ошибки сервера)"""
+        self._execute(RELEASE_KEY_QUERY, {'key': key, 'request_hash': request_hash, 'lease': lease})
+
+    def purge_expired(self):
+        """Удаляет истекшие ключи и возвращает их число"""
+        if not self.db.connect(autocommit=True):
+            raise ConnectionError("Ошибка подключения к базе данных")
+        try:
+            self.db.cursor.execute(PURGE_EXPIRED_QUERY)
+            return self.db.cursor.rowcount
+        finally:
+            self.db.disconnect()
@@ -0,0 +1,155 @@
+"""
+Дешевая проверка изображений в base64 без полного декодирования.
+
+Алфавит и паддинг проверяются одним проходом bytes.translate (выполняется
+в C), а декодируются только первые байты, нужные для определения формата
+по сигнатуре и размеров картинки.
+"""
+import base64
+import binascii
+import struct
+from collections import namedtuple
+
+from django.conf import settings
+
+from .blob_store import split_data_uri, sniff_mime_type
+
+BASE64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+BASE64_WHITESPACE = b' \t\n\r'
+
+# Сколько байт заголовка декодировать за первый раз и максимум для поиска
+# маркера SOF в JPEG (перед ним может идти EXIF с миниатюрой)
+HEADER_BYTES = 48
+MAX_HEADER_BYTES = 256 * 1024
+
+DEFAULT_LIMITS = {
+    'MAX_BYTES': 20 * 1024 * 1024,
+    'MAX_PIXELS': 80_000_000,
+    'TYPES': ['image/jpeg', 'image/png', 'image/webp'],
+}
+
+ImageInfo = namedtuple('ImageInfo', ['mime_type', 'size', 'width', 'height'])
+
+# Маркеры SOF, содержащие размеры кадра
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class ImageValidationError(ValueError):
+    """Изображение не прошло проверку"""
+
+
+def get_limits():
+    return {**DEFAULT_LIMITS, **getattr(settings, 'PEREVAL_IMAGE_LIMITS', {})}
+
+
+def _jpeg_size(header):
+    """Размеры JPEG по маркеру SOF или None, если он не попал в header"""
+    pos = 2
+    while pos + 4 <= len(header):
+        if header[pos] != 0xFF:
+            raise ImageValidationError("Corrupted JPEG header")
+        marker = header[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack('>H', header[pos + 2:pos + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > len(header):
+                return None
+            height, width = struct.unpack('>HH', header[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def image_size(mime_type, header):
+    """
+    Размеры изображения (ширина, высота) по заголовку.
+
+    Возвращает None, если заголовок слишком короткий.
+    """
+    if mime_type == 'image/png':
+        if len(header) < 24:
+            return None
+        return struct.unpack('>II', header[16:24])
+    if mime_type == 'image/gif':
+        if len(header) < 10:
+            return None
+        return struct.unpack('<HH', header[6:10])
+    if mime_type == 'image/webp':
+        chunk = header[12:16]
+        if chunk == b'VP8 ' and len(header) >= 30:
+            width, height = struct.unpack('<HH', header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L' and len(header) >= 25:
+            bits = int.from_bytes(header[21:25], 'little')
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X' and len(header) >= 30:
+            return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+        return None
+    if mime_type == 'image/jpeg':
+        return _jpeg_size(header)
+    return None
+
+
+def check_image(mime_type, size, dimensions, limits=None):
+    """Проверяет формат, размер и разрешение и возвращает ImageInfo"""
+    limits = limits or get_limits()
+    if mime_type not in limits['TYPES']:
+        raise ImageValidationError("Unsupported image format")
+    if size > limits['MAX_BYTES']:
+        raise ImageValidationError(f"Image is larger than {limits['MAX_BYTES']} bytes")
+    if dimensions is None:
+        raise ImageValidationError("Cannot determine image dimensions")
+    width, height = dimensions
+    if not width or not height:
+        raise ImageValidationError("Invalid image dimensions")
+    if width * height > limits['MAX_PIXELS']:
+        raise ImageValidationError(f"Image has more than {limits['MAX_PIXELS']} pixels")
+    return ImageInfo(mime_type, size, width, height)
+
+
+def validate_image_base64(value, limits=None):
+    """
+    Проверяет изображение в base64 (в том числе data URI) и возвращает ImageInfo.
+
+    Полностью строка не декодируется: проверяется алфавит, длина и паддинг,
+    а из base64 раскрываются только байты заголовка.
+    """
+    _, payload = split_data_uri(value)
+    try:
+        raw = payload.encode('ascii')
+    except UnicodeEncodeError:
+        raise ImageValidationError("Invalid base64 image data")
+
+    if raw.translate(None, BASE64_ALPHABET + b'='):
+        # Допускаем base64 с переносами строк, как и base64.b64decode
+        raw = raw.translate(None, BASE64_WHITESPACE)
+        if raw.translate(None, BASE64_ALPHABET + b'='):
+            raise ImageValidationError("Invalid base64 image data")
+
+    padding = 2 if raw.endswith(b'==') else 1 if raw.endswith(b'=') else 0
+    if len(raw) <= padding or len(raw) % 4 or raw.count(b'=') != padding:
+        raise ImageValidationError("Invalid base64 image data")
+
+    size = len(raw) // 4 * 3 - padding
+    header_chars = HEADER_BYTES // 3 * 4
+    max_header_chars = MAX_HEADER_BYTES // 3 * 4
+    while True:
+        try:
+            header = base64.b64decode(raw[:header_chars])
+        except binascii.Error:
+            raise ImageValidationError("Invalid base64 image data")
+        mime_type = sniff_mime_type(header)
+        dimensions = image_size(mime_type, header)
+        # Только у JPEG размеры могут оказаться дальше первых байт
+        if dimensions is not None or mime_type != 'image/jpeg':
+            break
+        if header_chars >= len(raw) or header_chars >= max_header_chars:
+            break
+        header_chars = min(header_chars * 8, max_header_chars)
+
+    return check_image(mime_type, size, dimensions, limits)
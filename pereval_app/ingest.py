@@ -0,0 +1,299 @@
+"""
+Отложенная запись перевалов (write-behind) через локальную очередь.
+
+В этом режиме POST /api/submitData/ только проверяет отчет, сохраняет
+изображения в BlobStore и кладет параметры SUBMIT_PEREVAL_QUERY в очередь
+на SQLite (режим WAL), после чего сразу отвечает 202 с номером для
+отслеживания. Команда drain_ingest разбирает очередь пачками через
+PerevalDataProcessor.submit_prepared.
+
+Очередь - файл на локальном диске, поэтому на каждом сервере с веб-процессами
+должен работать свой drain_ingest. Выданные воркеру записи арендуются на
+LEASE_SECONDS: если воркер упал, записи вернутся в очередь, а после
+MAX_ATTEMPTS выдач считаются неудачными. Результат принимается только с
+токеном аренды, под которым запись выдана последний раз. Отчет пишется в
+БД с tracking_id в качестве submission_key, поэтому повторная выдача уже
+записанного отчета (воркер не успел отметить результат) не создаст второй
+перевал, а вернет id первого.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPTIONS = {
+    'ENABLED': False,
+    'PATH': None,
+    'BATCH_SIZE': 50,
+    'MAX_DEPTH': 10_000,
+    'MAX_ATTEMPTS': 5,
+    'LEASE_SECONDS': 60,
+    'RETENTION_SECONDS': 7 * 24 * 60 * 60,
+}
+
+QUEUED = 'queued'
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+
+# Окно, за которое считается скорость разбора очереди
+RATE_WINDOW_SECONDS = 60
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ingest_queue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tracking_id TEXT NOT NULL UNIQUE,
+        params TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        pereval_id INTEGER,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        locked_until REAL,
+        lease TEXT
+    );
+    CREATE INDEX IF NOT EXISTS ingest_queue_status_idx ON ingest_queue (status, id);
+    CREATE INDEX IF NOT EXISTS ingest_queue_updated_idx ON ingest_queue (updated_at);
+"""
+
+
+class QueueFull(Exception):
+    """В очереди больше MAX_DEPTH необработанных отчетов"""
+
+
+def get_options():
+    options = {**DEFAULT_OPTIONS, **getattr(settings, 'PEREVAL_INGEST', {})}
+    if options['PATH'] is None:
+        options['PATH'] = Path(settings.BASE_DIR) / 'ingest' / 'queue.sqlite3'
+    return options
+
+
+def ingest_enabled():
+    return get_options()['ENABLED']
+
+
+class IngestQueue:
+    """Очередь отчетов в SQLite; у каждого потока свое соединение"""
+
+    def __init__(self, path, max_depth=10_000, max_attempts=5, lease_seconds=60):
+        self.path = Path(path)
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(ingest_queue)")}
+            if 'lease' not in columns:
+                # Очередь, созданная до появления токенов аренды
+                conn.execute("ALTER TABLE ingest_queue ADD COLUMN lease TEXT")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: транзакции открываются явно (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: принятый (202) отчет не теряется и при сбое питания
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        return _Transaction(conn)
+
+    def enqueue(self, params):
+        """Кладет параметры SUBMIT_PEREVAL_QUERY в очередь и возвращает номер для отслеживания"""
+        tracking_id = uuid.uuid4().hex
+        body = json.dumps(params, ensure_ascii=False, cls=DjangoJSONEncoder)
+        now = time.time()
+        with self._transaction() as conn:
+            depth = conn.execute(
+                "SELECT count(*) FROM ingest_queue WHERE status IN (?, ?)", (QUEUED, PROCESSING)
+            ).fetchone()[0]
+            if depth >= self.max_depth:
+                raise QueueFull(f"Ingest queue is full ({depth} reports)")
+            conn.execute(
+                "INSERT INTO ingest_queue (tracking_id, params, status, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (tracking_id, body, QUEUED, now, now)
+            )
+        return tracking_id
+
+    def claim(self, limit):
+        """
+        Арендует до limit отчетов. Возвращает токен аренды для complete() и
+        список (id, параметры); в параметрах submission_key - tracking_id.
+        """
+        now = time.time()
+        lease = uuid.uuid4().hex
+        with self._transaction() as conn:
+            # Аренда истекла, а попытки исчерпаны: воркер падает на этом отчете
+            expired = conn.execute(
+                "UPDATE ingest_queue SET status = ?, error = ?, locked_until = NULL, lease = NULL,"
+                " updated_at = ? WHERE status = ? AND locked_until < ? AND attempts >= ?",
+                (FAILED, "Lease expired, no attempts left", now, PROCESSING, now, self.max_attempts)
+            ).rowcount
+            if expired:
+                logger.error(f"{expired} ingest reports failed: lease expired after {self.max_attempts} attempts")
+            rows = conn.execute(
+                "SELECT id, tracking_id, params FROM ingest_queue"
+                " WHERE status = ? OR (status = ? AND locked_until < ?)"
+                " ORDER BY id LIMIT ?",
+                (QUEUED, PROCESSING, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE ingest_queue SET status = ?, attempts = attempts + 1,"
+                " locked_until = ?, lease = ?, updated_at = ? WHERE id = ?",
+                [(PROCESSING, now + self.lease_seconds, lease, now, row_id) for row_id, _, _ in rows]
+            )
+        return lease, [
+            (row_id, {**json.loads(params), 'submission_key': tracking_id})
+            for row_id, tracking_id, params in rows
+        ]
+
+    def complete(self, lease, outcomes):
+        """
+        Записывает результаты обработки: пары (id, результат submit_prepared).
+
+        Ошибки сервера (5xx) возвращают отчет в очередь, пока не исчерпаны
+        попытки; остальные ошибки окончательные. Результаты по записям,
+        которые после истечения аренды выданы другому воркеру (токен lease
+        сменился), отбрасываются.
+        """
+        now = time.time()
+        lost = 0
+        with self._transaction() as conn:
+            for row_id, result in outcomes:
+                row = conn.execute(
+                    "SELECT attempts FROM ingest_queue WHERE id = ? AND status = ? AND lease = ?",
+                    (row_id, PROCESSING, lease)
+                ).fetchone()
+                if row is None:
+                    lost += 1
+                    continue
+                if result['status'] == 200:
+                    conn.execute(
+                        "UPDATE ingest_queue SET status = ?, pereval_id = ?, error = NULL,"
+                        " locked_until = NULL, lease = NULL, updated_at = ? WHERE id = ?",
+                        (DONE, result['id'], now, row_id)
+                    )
+                    continue
+                retry = result['status'] >= 500 and row[0] < self.max_attempts
+                conn.execute(
+                    "UPDATE ingest_queue SET status = ?, error = ?, locked_until = NULL, lease = NULL,"
+                    " updated_at = ? WHERE id = ?",
+                    (QUEUED if retry else FAILED, result['message'], now, row_id)
+                )
+        if lost:
+            logger.warning(f"Dropped results of {lost} ingest reports: lease {lease} has expired")
+
+    def status(self, tracking_id):
+        """Состояние отчета или None, если номер неизвестен"""
+        row = self._connection().execute(
+            "SELECT status, pereval_id, error, attempts, created_at, updated_at"
+            " FROM ingest_queue WHERE tracking_id = ?",
+            (tracking_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        state, pereval_id, error, attempts, created_at, updated_at = row
+        return {
+            'tracking_id': tracking_id,
+            'state': state,
+            'id': pereval_id,
+            'error': error,
+            'attempts': attempts,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+
+    def stats(self):
+        """Глубина очереди и скорость разбора для мониторинга"""
+        conn = self._connection()
+        now = time.time()
+        counts = dict(conn.execute("SELECT status, count(*) FROM ingest_queue GROUP BY status").fetchall())
+        oldest = conn.execute(
+            "SELECT min(created_at) FROM ingest_queue WHERE status = ?", (QUEUED,)
+        ).fetchone()[0]
+        drained = conn.execute(
+            "SELECT count(*) FROM ingest_queue WHERE status IN (?, ?) AND updated_at >= ?",
+            (DONE, FAILED, now - RATE_WINDOW_SECONDS)
+        ).fetchone()[0]
+        enqueued = conn.execute(
+            "SELECT count(*) FROM ingest_queue WHERE created_at >= ?", (now - RATE_WINDOW_SECONDS,)
+        ).fetchone()[0]
+        return {
+            'depth': counts.get(QUEUED, 0) + counts.get(PROCESSING, 0),
+            'queued': counts.get(QUEUED, 0),
+            'processing': counts.get(PROCESSING, 0),
+            'done': counts.get(DONE, 0),
+            'failed': counts.get(FAILED, 0),
+            'max_depth': self.max_depth,
+            'oldest_queued_seconds': round(now - oldest, 3) if oldest else 0,
+            'enqueue_rate': round(enqueued / RATE_WINDOW_SECONDS, 3),
+            'drain_rate': round(drained / RATE_WINDOW_SECONDS, 3),
+        }
+
+    def purge(self, older_than_seconds):
+        """Удаляет обработанные отчеты старше заданного возраста"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM ingest_queue WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - older_than_seconds)
+            )
+            return cursor.rowcount
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_ingest_queue():
+    """Общая для процесса очередь, настроенная через PEREVAL_INGEST"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                options = get_options()
+                _queue = IngestQueue(
+                    options['PATH'],
+                    max_depth=options['MAX_DEPTH'],
+                    max_attempts=options['MAX_ATTEMPTS'],
+                    lease_seconds=options['LEASE_SECONDS'],
+                )
+    return _queue
+
+
+def drain(processor, limit):
+    """Обрабатывает одну пачку из очереди и возвращает число отчетов в ней"""
+    queue = get_ingest_queue()
+    lease, items = queue.claim(limit)
+    if not items:
+        return 0
+    results = processor.submit_prepared([params for _, params in items])
+    queue.complete(lease, zip([row_id for row_id, _ in items], results))
+    return len(items)
@@ -0,0 +1,72 @@
+import json
+import platform
+from datetime import datetime, timezone
+from importlib import import_module
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from pereval_app.benchmarks import BENCHMARKS, compare
+
+
+class Command(BaseCommand):
+    help = 'Запуск бенчмарков производительности pereval_app'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Бенчмарки: {', '.join(BENCHMARKS)}")
+        parser.add_argument('--repeat', type=int, default=20, help='Число повторов каждого замера')
+        parser.add_argument('--image-size', type=int, default=64 * 1024,
+                            help='Размер синтетического изображения в байтах')
+        parser.add_argument('--rows', type=int, default=1_000_000,
+                            help='Число строк в синтетических таблицах')
+        parser.add_argument('--seed', type=int, default=0, help='Seed генератора синтетических данных')
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api/submitData/',
+                            help='Адрес POST /api/submitData/ для submit_load')
+        parser.add_argument('--requests', type=int, default=10,
+                            help='Запросов на одного клиента в submit_load')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--baseline', help='JSON с результатами прошлого запуска для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.10,
+                            help='Допустимое замедление относительно --baseline (0.10 = 10%%)')
+
+    def handle(self, *args, **options):
+        names = options['names'] or [name for name in BENCHMARKS if name != 'submit_load']
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        results = {}
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            results[name] = import_module(BENCHMARKS[name]).run(options)
+            for result in results[name]:
+                self.stdout.write('  ' + '  '.join(f'{key}={value}' for key, value in result.items()))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'created': datetime.now(timezone.utc).isoformat(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'options': {key: options[key] for key in ('repeat', 'image_size', 'rows', 'seed', 'requests')},
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            for name, case, key, before, after in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"{name} {case}: {key} {before} -> {after} (+{(after / before - 1) * 100:.1f}%)"
+                ))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
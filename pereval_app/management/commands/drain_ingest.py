@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pereval_app.data_processor import PerevalDataProcessor
+from pereval_app.ingest import drain, get_ingest_queue, get_options
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Записывает в БД отчеты из очереди отложенной записи (PEREVAL_INGEST)'
+
+    def add_arguments(self, parser):
+        options = get_options()
+        parser.add_argument('--workers', type=int, default=2, help='Число параллельных воркеров')
+        parser.add_argument('--batch-size', type=int, default=options['BATCH_SIZE'],
+                            help='Отчетов в одной транзакции')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и завершиться, не дожидаясь новых отчетов')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        drained = [0] * options['workers']
+
+        def worker(number):
+            processor = PerevalDataProcessor()
+            while not stop.is_set():
+                # Как в обработчике запроса: потерянные и устаревшие
+                # (CONN_MAX_AGE) соединения потока закрываются между пачками
+                close_old_connections()
+                try:
+                    count = drain(processor, options['batch_size'])
+                except Exception as e:
+                    logger.error(f"Ingest worker {number} failed: {e}")
+                    stop.wait(options['poll_interval'])
+                    continue
+                finally:
+                    close_old_connections()
+                drained[number] += count
+                if not count:
+                    if options['once']:
+                        return
+                    stop.wait(options['poll_interval'])
+
+        workers = [threading.Thread(target=worker, args=(number,), daemon=True)
+                   for number in range(options['workers'])]
+        for thread in workers:
+            thread.start()
+
+        queue = get_ingest_queue()
+        retention = get_options()['RETENTION_SECONDS']
+        try:
+            while any(thread.is_alive() for thread in workers):
+                time.sleep(min(options['poll_interval'], 1.0) if options['once'] else 10)
+                stats = queue.stats()
+                self.stdout.write(
+                    f"drained={sum(drained)} depth={stats['depth']} failed={stats['failed']} "
+                    f"drain_rate={stats['drain_rate']}/s enqueue_rate={stats['enqueue_rate']}/s"
+                )
+                if not options['once']:
+                    queue.purge(retention)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in workers:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {sum(drained)} reports written"))
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pereval_app.bulk_io import STATUSES, Throughput, export_perevals
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка перевалов в NDJSON или CSV через COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Файл для выгрузки ('-' - стандартный вывод)")
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Формат файла; по умолчанию определяется по расширению')
+        parser.add_argument('--status', nargs='+', choices=sorted(STATUSES), default=['accepted'],
+                            help='Статусы выгружаемых перевалов')
+        parser.add_argument('--images', choices=['none', 'meta', 'data'], default='meta',
+                            help='Изображения: без них, метаданные или содержимое (только NDJSON)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        if fmt == 'csv' and options['images'] == 'data':
+            raise CommandError("Image data can only be exported to NDJSON")
+        throughput = Throughput()
+
+        def progress(count):
+            self.stderr.write(f"exported={count} rate={throughput.rate(count)}/s")
+
+        output = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+        try:
+            count = export_perevals(output, fmt, options['status'], options['images'], progress)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS(f"Done: {count} perevals exported"))
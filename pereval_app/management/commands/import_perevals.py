@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pereval_app.bulk_io import PerevalImporter, RecordError, Throughput, read_csv, read_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт перевалов из NDJSON или CSV через COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл для импорта ('-' - стандартный ввод)")
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Формат файла; по умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=10_000,
+                            help='Записей в одной транзакции')
+        parser.add_argument('--rejects', help='Файл для номеров и причин отклоненных записей')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        throughput = Throughput()
+        rejects = open(options['rejects'], 'w', encoding='utf-8') if options['rejects'] else self.stderr
+
+        def progress(imported, rejected):
+            self.stdout.write(
+                f"imported={imported} rejected={rejected} rate={throughput.rate(imported)}/s"
+            )
+
+        def reject(line_no, error):
+            rejects.write(f"line {line_no}: {error}\n")
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            records = read_csv(stream) if fmt == 'csv' else read_ndjson(stream)
+            importer = PerevalImporter(options['batch_size'], progress, reject)
+            imported, rejected = importer.run(records)
+        except (RecordError, RuntimeError) as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if options['rejects']:
+                rejects.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {imported} imported, {rejected} rejected"))
@@ -0,0 +1,34 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pereval_app.benchmarks.load import CLIENT_COUNTS, run_load
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест POST-эндпоинтов отправки перевалов: сравнение '
+            'синхронного (WSGI) и асинхронного (ASGI) путей. Серверы запускаются отдельно')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                            help='Эндпоинт для проверки, например asgi=http://127.0.0.1:8001/api/submitData/async/')
+        parser.add_argument('--clients', type=int, nargs='+', default=list(CLIENT_COUNTS),
+                            help='Число одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=10, help='Запросов на одного клиента')
+        parser.add_argument('--image-size', type=int, default=16 * 1024,
+                            help='Размер изображения в отчете в байтах')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith('http://'):
+                raise CommandError(f"Invalid target {target!r}, expected NAME=http://host:port/path/")
+            targets.append((name, url))
+
+        for clients in options['clients']:
+            for name, url in targets:
+                result = asyncio.run(run_load(url, clients, options['requests'], options['image_size']))
+                self.stdout.write('  '.join(
+                    [f'target={name}'] + [f'{key}={value}' for key, value in result.items()]
+                ))
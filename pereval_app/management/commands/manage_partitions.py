@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from pereval_app.partitions import (
+    DEFAULT_AHEAD_MONTHS, DETACH_ORDER, PARTITIONED_TABLES, detach_month, ensure_partitions, expired_months,
+    is_partitioned, missing_months, partition_name,
+)
+
+
+class Command(BaseCommand):
+    help = ('Создает помесячные секции pereval и pereval_image на несколько месяцев вперед '
+            'и отсоединяет секции старше срока хранения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=DEFAULT_AHEAD_MONTHS,
+                            help='На сколько месяцев вперед создавать секции')
+        parser.add_argument('--retain-months', type=int,
+                            help='Отсоединить секции месяцев старше этого числа полных месяцев')
+        target = parser.add_mutually_exclusive_group()
+        target.add_argument('--archive-schema',
+                            help='Перенести отсоединенные секции в эту схему (по умолчанию остаются на месте)')
+        target.add_argument('--drop', action='store_true', help='Удалить отсоединенные секции')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, какие секции будут созданы и отсоединены')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Partitioning requires PostgreSQL")
+        if options['ahead'] < 0 or (options['retain_months'] is not None and options['retain_months'] < 1):
+            raise CommandError("--ahead must be non-negative and --retain-months positive")
+
+        for table in PARTITIONED_TABLES:
+            # Каждая таблица в своей транзакции: ошибка в одной не откатывает другую
+            with transaction.atomic(), connection.cursor() as cursor:
+                if not is_partitioned(cursor, table):
+                    raise CommandError(f"{table} is not partitioned, apply migrations first")
+
+                if options['dry_run']:
+                    for month in missing_months(cursor, table, options['ahead']):
+                        self.stdout.write(f"Would create partition {partition_name(table, month)}")
+                else:
+                    for name in ensure_partitions(cursor, table, options['ahead']):
+                        self.stdout.write(f"Created partition {name}")
+
+        if options['retain_months'] is not None:
+            with connection.cursor() as cursor:
+                months = expired_months(cursor, options['retain_months'])
+            for month in months:
+                if options['dry_run']:
+                    for table in DETACH_ORDER:
+                        self.stdout.write(f"Would detach partition {partition_name(table, month)}")
+                    continue
+                # Секции перевалов и их изображений за месяц отсоединяются вместе
+                with transaction.atomic(), connection.cursor() as cursor:
+                    names = detach_month(cursor, month, options['archive_schema'], options['drop'])
+                for name in names:
+                    if options['drop']:
+                        self.stdout.write(f"Dropped partition {name}")
+                    elif options['archive_schema']:
+                        self.stdout.write(f"Detached partition {name} to schema {options['archive_schema']}")
+                    else:
+                        self.stdout.write(f"Detached partition {name}")
+
+        self.stdout.write(self.style.SUCCESS("Partitions are up to date"))
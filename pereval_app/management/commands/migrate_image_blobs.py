@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pereval_app.blob_store import store_image
+from pereval_app.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Переносит base64-содержимое pereval_image.data в хранилище изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Сколько изображений загружать в память за раз')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        migrated = 0
+        failed = 0
+
+        while True:
+            # Постраничный обход по id: в памяти одновременно не больше batch_size изображений
+            batch = list(
+                Image.objects
+                .filter(id__gt=last_id, sha256='', data__isnull=False)
+                .order_by('id')
+                .only('id', 'data')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            converted = []
+            for image in batch:
+                try:
+                    stored = store_image(image.data)
+                except ValueError as e:
+                    failed += 1
+                    self.stderr.write(f"Image {image.id}: {e}")
+                    continue
+                image.sha256, image.size, image.mime_type = stored.sha256, stored.size, stored.mime_type
+                image.data = None
+                converted.append(image)
+
+            with transaction.atomic():
+                Image.objects.bulk_update(converted, ['sha256', 'size', 'mime_type', 'data'])
+            migrated += len(converted)
+            self.stdout.write(f"Migrated {migrated} images (last id {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {migrated} migrated, {failed} failed"))
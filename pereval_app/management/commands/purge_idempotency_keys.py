@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pereval_app.idempotency import IdempotencyStore
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истекшие ключи идемпотентности из pereval_idempotency_key'
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyStore().purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys"))
@@ -0,0 +1,211 @@
+"""
+Метрики производительности в формате Prometheus.
+
+Этапы обработки отправки (разбор тела, проверка, соединение с БД, запись,
+фиксация транзакции) измеряются через span() и попадают в гистограмму
+pereval_submit_stage_seconds. GET /metrics отдает гистограммы, счетчики и
+текущее состояние пулов соединений, кэшей и очереди отложенной записи.
+Метрики хранятся в памяти процесса: при нескольких процессах каждый
+опрашивается отдельно.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Границы корзин гистограмм задержек, в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Поля отчета, которые не попадают в логи как есть
+REDACTED_FIELDS = frozenset({'data', 'phone', 'email'})
+DEFAULT_LOG_PAYLOAD_CHARS = 2000
+
+
+def _label_string(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Гистограмма с метками; значения - в секундах"""
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}  # метки -> [счетчики корзин..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values):
+                cumulative += count
+                labels = _label_string(key + (('le', _format_value(bound)),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_label_string(key)} {values[-2]!r}')
+            lines.append(f'{self.name}_count{_label_string(key)} {values[-1]}')
+        return lines
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_label_string(key)} {value}')
+        return lines
+
+
+SUBMIT_STAGE_SECONDS = Histogram(
+    'pereval_submit_stage_seconds', 'Duration of submit pipeline stages'
+)
+SUBMIT_RESULTS = Counter(
+    'pereval_submit_total', 'Submitted reports by endpoint and response status'
+)
+
+METRICS = [SUBMIT_STAGE_SECONDS, SUBMIT_RESULTS]
+
+
+@contextmanager
+def span(stage):
+    """Измеряет длительность этапа отправки"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SUBMIT_STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def _gauges(name, documentation, samples):
+    """Строки для набора значений (метки, значение) одной метрики-gauge"""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} gauge']
+    for labels, value in samples:
+        lines.append(f'{name}{_label_string(tuple(sorted(labels.items())))} {_format_value(value)}')
+    return lines
+
+
+def _state_lines():
+    """Текущее состояние пулов, кэшей и очереди на момент запроса /metrics"""
+    from .data_processor import level_id_cache, user_id_cache
+    from .db_pool import pool_stats
+    from .db_router import get_replicas
+    from .ingest import get_ingest_queue, ingest_enabled
+    from .prepared import statements
+    from .response_cache import get_response_cache
+
+    lines = []
+    pools = {}
+    for alias, stats in pool_stats().items():
+        for key, value in stats.items():
+            pools.setdefault(key, []).append(({'alias': alias}, value))
+    for key, samples in pools.items():
+        lines += _gauges(f'pereval_db_pool_{key}', f'Connection pool {key}', samples)
+
+    replicas = get_replicas().stats()
+    if replicas:
+        for key in ('healthy', 'latency_seconds', 'lag_seconds', 'reads'):
+            lines += _gauges(f'pereval_db_replica_{key}', f'Read replica {key}', [
+                ({'alias': alias}, int(state[key]) if key == 'healthy' else state[key])
+                for alias, state in replicas.items() if state[key] is not None
+            ])
+
+    for key, value in get_response_cache().stats().items():
+        lines += _gauges(f'pereval_response_cache_{key}', f'Response cache {key}', [({}, value)])
+
+    lines += _gauges('pereval_id_cache_entries', 'Entries in in-process id caches', [
+        ({'cache': 'user'}, len(user_id_cache)),
+        ({'cache': 'level'}, len(level_id_cache)),
+    ])
+
+    statement_stats = statements.stats()
+    for key in ('prepares', 'executions', 'seconds_total', 'seconds_max'):
+        lines += _gauges(f'pereval_statement_{key}', f'Prepared statement {key}', [
+            ({'statement': name}, stats[key]) for name, stats in sorted(statement_stats.items())
+        ])
+
+    if ingest_enabled():
+        for key, value in get_ingest_queue().stats().items():
+            lines += _gauges(f'pereval_ingest_{key}', f'Ingest queue {key}', [({}, value)])
+    return lines
+
+
+def render_prometheus():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    lines = []
+    for metric in METRICS:
+        lines += metric.collect()
+    lines += _state_lines()
+    return '\n'.join(lines) + '\n'
+
+
+def redact_payload(payload, max_chars=None):
+    """
+    Отчет для записи в лог: содержимое изображений, телефон и email
+    заменены заглушками, а длина строки ограничена max_chars.
+    """
+    if max_chars is None:
+        max_chars = getattr(settings, 'PEREVAL_LOG_PAYLOAD_CHARS', DEFAULT_LOG_PAYLOAD_CHARS)
+
+    def redact(value):
+        if isinstance(value, dict):
+            return {
+                key: f'<{_describe(item)}>' if key in REDACTED_FIELDS else redact(item)
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [redact(item) for item in value]
+        return value
+
+    text = repr(redact(payload))
+    if len(text) > max_chars:
+        text = f'{text[:max_chars]}... ({len(text)} chars)'
+    return text
+
+
+def _describe(value):
+    if isinstance(value, str):
+        return f'{len(value)} chars'
+    return type(value).__name__
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval_app', '0002_coords_image_level_pereval_user_delete_perevalareas_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=50, verbose_name='MIME-тип'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='SHA-256 содержимого'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='size',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Размер в байтах'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='data',
+            field=models.TextField(blank=True, null=True, verbose_name='Данные изображения (base64)'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-17 23:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval_app', '0003_image_blob_store'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pereval',
+            index=models.Index(fields=['-add_time', '-id'], name='pereval_add_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pereval',
+            index=models.Index(fields=['user', '-add_time', '-id'], name='pereval_user_add_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-17 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval_app', '0004_pereval_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pereval',
+            index=models.Index(condition=models.Q(('status', 'new')), fields=['add_time', 'id'], name='pereval_new_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pereval',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['add_time', 'id'], name='pereval_pending_queue_idx'),
+        ),
+    ]
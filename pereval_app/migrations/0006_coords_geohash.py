@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-17 23:15
+
+from django.db import migrations, models
+
+from pereval_app.geo import encode
+
+BATCH_SIZE = 1000
+
+
+def fill_geohash(apps, schema_editor):
+    Coords = apps.get_model('pereval_app', 'Coords')
+    last_id = 0
+    while True:
+        batch = list(Coords.objects.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not batch:
+            break
+        for coords in batch:
+            coords.geohash = encode(float(coords.latitude), float(coords.longitude))
+        Coords.objects.bulk_update(batch, ['geohash'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval_app', '0005_pereval_moderation_queue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coords',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, verbose_name='Геохеш'),
+        ),
+        migrations.AlterField(
+            model_name='coords',
+            name='height',
+            field=models.IntegerField(db_index=True, verbose_name='Высота'),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
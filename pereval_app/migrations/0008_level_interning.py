@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-17 23:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Перед созданием уникального ограничения повторяющиеся уровни сливаются:
+# перевалы переводятся на строку с наименьшим id, остальные удаляются
+MERGE_DUPLICATE_LEVELS = """
+    CREATE TEMP TABLE level_duplicates ON COMMIT DROP AS
+    SELECT id, keep_id FROM (
+        SELECT id, min(id) OVER (PARTITION BY winter, summer, autumn, spring) AS keep_id
+        FROM pereval_level
+    ) AS levels
+    WHERE id <> keep_id;
+
+    UPDATE pereval SET level_id = level_duplicates.keep_id
+    FROM level_duplicates
+    WHERE pereval.level_id = level_duplicates.id;
+
+    DELETE FROM pereval_level USING level_duplicates
+    WHERE pereval_level.id = level_duplicates.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval_app', '0007_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATE_LEVELS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='level',
+            constraint=models.UniqueConstraint(fields=('winter', 'summer', 'autumn', 'spring'), name='pereval_level_seasons_uniq'),
+        ),
+        migrations.AlterField(
+            model_name='pereval',
+            name='level',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='pereval_app.level', verbose_name='Уровень сложности'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 23:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval_app', '0008_level_interning'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pereval',
+            name='add_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время добавления'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-17 23:42
+
+import django.db.models.deletion
+from django.db import NotSupportedError, migrations, models
+from django.db.models import OuterRef, Subquery
+
+from pereval_app.partitions import (
+    ADD_IMAGE_FOREIGN_KEY_QUERY, IMAGE_FOREIGN_KEY, MIN_SERVER_VERSION, PARTITIONED_TABLES, convert_to_partitioned,
+    convert_to_plain,
+)
+
+
+def fill_pereval_add_time(apps, schema_editor):
+    Image = apps.get_model('pereval_app', 'Image')
+    Pereval = apps.get_model('pereval_app', 'Pereval')
+    add_time = Pereval.objects.filter(pk=OuterRef('pereval_id')).values('add_time')[:1]
+    Image.objects.using(schema_editor.connection.alias).update(pereval_add_time=Subquery(add_time))
+
+
+def partition_tables(apps, schema_editor):
+    # Секционирование - возможность PostgreSQL; на других СУБД (заглушки
+    # реплик в тестах) таблицы остаются обычными
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    if schema_editor.connection.pg_version < MIN_SERVER_VERSION:
+        raise NotSupportedError("Partitioning requires PostgreSQL 15 or newer")
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            convert_to_partitioned(cursor, table)
+        cursor.execute(ADD_IMAGE_FOREIGN_KEY_QUERY)
+
+
+def merge_partitions(apps, schema_editor):
+    # Строки отсоединенных секций (архив) обратно не возвращаются
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE pereval_image DROP CONSTRAINT IF EXISTS {IMAGE_FOREIGN_KEY}')
+        for table in PARTITIONED_TABLES:
+            convert_to_plain(cursor, table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval_app', '0009_pereval_add_time_default'),
+    ]
+
+    operations = [
+        # Внешний ключ на pereval в БД заменяется составным
+        # (pereval_id, pereval_add_time), см. partitions.py
+        migrations.AlterField(
+            model_name='image',
+            name='pereval',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='pereval_app.pereval', verbose_name='Перевал'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='pereval_add_time',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Время отчета перевала'),
+        ),
+        migrations.RunPython(fill_pereval_add_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='image',
+            name='pereval_add_time',
+            field=models.DateTimeField(editable=False, verbose_name='Время отчета перевала'),
+        ),
+        migrations.RunPython(partition_tables, merge_partitions),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pereval_app', '0011_idempotency_key_locked_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pereval',
+            name='submission_key',
+            field=models.UUIDField(blank=True, editable=False, null=True, verbose_name='Ключ отправки'),
+        ),
+        migrations.AddConstraint(
+            model_name='pereval',
+            constraint=models.UniqueConstraint(fields=('submission_key', 'add_time'), name='pereval_submission_key_uniq'),
+        ),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.utils import timezone
+
+from . import geo
 
 
 class User(models.Model):
@@ -22,7 +25,9 @@ class Coords(models.Model):
     """Модель координат"""
     latitude = models.DecimalField(max_digits=9, decimal_places=6, verbose_name="Широта")
     longitude = models.DecimalField(max_digits=9, decimal_places=6, verbose_name="Долгота")
-    height = models.IntegerField(verbose_name="Высота")
+    height = models.IntegerField(verbose_name="Высота", db_index=True)
+    # Геохеш точки для поиска на карте по префиксу (см. geo.py)
+    geohash = models.CharField(max_length=12, verbose_name="Геохеш", blank=True, db_index=True)
 
     class Meta:
         db_table = 'pereval_coords'
@@ -32,6 +37,10 @@ class Coords(models.Model):
     def __str__(self):
         return f"({self.latitude}, {self.longitude}, {self.height})"
 
+    def save(self, *args, **kwargs):
+        self.geohash = geo.encode(float(self.latitude), float(self.longitude))
+        super().save(*args, **kwargs)
+
 
 class Level(models.Model):
     """Модель уровня сложности"""
@@ -44,6 +53,11 @@ class Level(models.Model):
         db_table = 'pereval_level'
         verbose_name = 'Уровень сложности'
         verbose_name_plural = 'Уровни сложности'
+        # Уровень - справочное значение: одна строка на набор сезонов,
+        # которую разделяют все перевалы с такой сложностью
+        constraints = [
+            models.UniqueConstraint(fields=['winter', 'summer', 'autumn', 'spring'], name='pereval_level_seasons_uniq'),
+        ]
 
     def __str__(self):
         seasons = []
@@ -67,12 +81,15 @@ class Pereval(models.Model):
     title = models.CharField(max_length=255, verbose_name="Название")
     other_titles = models.CharField(max_length=255, verbose_name="Другие названия", blank=True)
     connect = models.CharField(max_length=255, verbose_name="Соединяет", blank=True)
-    add_time = models.DateTimeField(auto_now_add=True, verbose_name="Время добавления")
+    # Время из отчета (туристы отправляют отчеты позже, чем побывали на перевале);
+    # auto_now_add перезаписал бы его при bulk_create
+    add_time = models.DateTimeField(default=timezone.now, verbose_name="Время добавления")
 
     # Связи с другими моделями
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
     coords = models.ForeignKey(Coords, on_delete=models.CASCADE, verbose_name="Координаты")
-    level = models.ForeignKey(Level, on_delete=models.CASCADE, verbose_name="Уровень сложности")
+    # Уровень разделяют многие перевалы, поэтому удалить используемый уровень нельзя
+    level = models.ForeignKey(Level, on_delete=models.PROTECT, verbose_name="Уровень сложности")
 
     # Статус модерации
     status = models.CharField(
@@ -81,12 +98,32 @@ class Pereval(models.Model):
         default='new',
         verbose_name="Статус"
     )
+    # Ключ отчета из очереди отложенной записи (pereval_app.ingest): повторно
+    # доставленный отчет не создает второй перевал
+    submission_key = models.UUIDField(verbose_name="Ключ отправки", null=True, blank=True, editable=False)
 
     class Meta:
         db_table = 'pereval'
         verbose_name = 'Перевал'
         verbose_name_plural = 'Перевалы'
         ordering = ['-add_time']
+        indexes = [
+            # Постраничная выдача по ключу (add_time, id): общий список и перевалы пользователя
+            models.Index(fields=['-add_time', '-id'], name='pereval_add_time_id_idx'),
+            models.Index(fields=['user', '-add_time', '-id'], name='pereval_user_add_time_id_idx'),
+            # Очереди модерации: маленькие частичные индексы только по активным статусам
+            models.Index(fields=['add_time', 'id'], name='pereval_new_queue_idx', condition=models.Q(status='new')),
+            models.Index(fields=['add_time', 'id'], name='pereval_pending_queue_idx',
+                         condition=models.Q(status='pending')),
+        ]
+        constraints = [
+            # add_time входит в ключ секций (pereval_app.partitions), без него
+            # уникальный индекс на секционированной таблице не создать. Поэтому
+            # повтор отчета ловится, только если add_time тот же: очередь
+            # (pereval_app.ingest) хранит параметры с уже выбранным add_time,
+            # но тот же ключ с другим add_time даст второй перевал
+            models.UniqueConstraint(fields=['submission_key', 'add_time'], name='pereval_submission_key_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.beauty_title}) - {self.get_status_display()}"
@@ -94,8 +131,18 @@ class Pereval(models.Model):
 
 class Image(models.Model):
     """Модель изображения"""
-    pereval = models.ForeignKey(Pereval, on_delete=models.CASCADE, related_name='images', verbose_name="Перевал")
-    data = models.TextField(verbose_name="Данные изображения (base64)")  # Храним base64
+    # pereval секционирована по add_time (см. partitions.py): внешний ключ в
+    # БД составной (pereval_id, pereval_add_time) и создается миграцией 0010
+    pereval = models.ForeignKey(Pereval, on_delete=models.CASCADE, related_name='images', verbose_name="Перевал",
+                                db_constraint=False)
+    # Копия pereval.add_time - ключ секций pereval_image
+    pereval_add_time = models.DateTimeField(verbose_name="Время отчета перевала", editable=False)
+    # Устаревшее поле: новые изображения хранятся в BlobStore (MEDIA_ROOT/images),
+    # старые переносятся туда командой migrate_image_blobs
+    data = models.TextField(verbose_name="Данные изображения (base64)", null=True, blank=True)
+    sha256 = models.CharField(max_length=64, verbose_name="SHA-256 содержимого", blank=True, db_index=True)
+    size = models.PositiveIntegerField(verbose_name="Размер в байтах", null=True, blank=True)
+    mime_type = models.CharField(max_length=50, verbose_name="MIME-тип", blank=True)
     title = models.CharField(max_length=255, verbose_name="Название изображения")
     date_added = models.DateTimeField(auto_now_add=True, verbose_name="Время добавления")
 
@@ -105,4 +152,31 @@ class Image(models.Model):
         verbose_name_plural = 'Изображения'
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+    def save(self, *args, **kwargs):
+        if self.pereval_add_time is None:
+            self.pereval_add_time = self.pereval.add_time
+        super().save(*args, **kwargs)
+
+
+class IdempotencyKey(models.Model):
+    """Ключ идемпотентности POST /api/submitData/ и сохраненный ответ на запрос"""
+    key = models.CharField(max_length=255, unique=True, verbose_name="Ключ")
+    request_hash = models.CharField(max_length=64, verbose_name="SHA-256 тела запроса")
+    # Пока запрос выполняется, статус и ответ пустые
+    status_code = models.PositiveSmallIntegerField(verbose_name="Код ответа", null=True, blank=True)
+    response = models.JSONField(verbose_name="Тело ответа", null=True, blank=True)
+    created_at = models.DateTimeField(verbose_name="Время создания")
+    expires_at = models.DateTimeField(verbose_name="Действует до", db_index=True)
+    # Пока ответа нет, ключ занят до этого времени; после него повтор запроса
+    # занимает ключ заново
+    locked_until = models.DateTimeField(verbose_name="Занят до", null=True, blank=True)
+
+    class Meta:
+        db_table = 'pereval_idempotency_key'
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
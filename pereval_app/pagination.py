@@ -0,0 +1,90 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничная выдача по ключу (add_time, id) вместо OFFSET.
+
+    Курсор хранит ключ последней записи страницы, а следующая страница
+    выбирается условием (add_time, id) < курсор. С индексом по
+    (-add_time, -id) стоимость запроса не зависит от номера страницы.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 20
+    max_page_size = 100
+    ordering = ('-add_time', '-id')
+
+    def encode_cursor(self, instance):
+        key = [instance.add_time.isoformat(), instance.id]
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    def decode_cursor(self, value):
+        try:
+            add_time, pk = json.loads(base64.urlsafe_b64decode(value.encode()))
+            add_time = parse_datetime(add_time)
+        except (binascii.Error, ValueError, TypeError):
+            add_time = None
+        if add_time is None or not isinstance(pk, int):
+            raise NotFound("Invalid cursor")
+        return add_time, pk
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            add_time, pk = self.decode_cursor(cursor)
+            # add_time__lte задает границу диапазона для индексного сканирования,
+            # второе условие отсекает уже выданные записи с тем же add_time
+            queryset = queryset.filter(
+                Q(add_time__lt=add_time) | Q(id__lt=pk),
+                add_time__lte=add_time,
+            )
+
+        # Одна лишняя запись показывает, есть ли следующая страница
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,335 @@
+"""
+Помесячное секционирование pereval и pereval_image по времени отчета.
+
+Секция месяца называется <таблица>_pГГГГ_ММ и содержит строки с
+[1-е число месяца, 1-е число следующего) по UTC. Строки вне созданных
+секций (старые отчеты, даты далеко в будущем) попадают в секцию
+<таблица>_default. create_partition переносит в новую секцию строки ее
+месяца из секции по умолчанию, поэтому секции можно создавать и для
+прошедших месяцев.
+
+Изображение хранит время отчета своего перевала (pereval_add_time), и
+обе таблицы секционированы по одному значению: изображения перевала лежат
+в секции того же месяца. Первичный ключ секционированной таблицы должен
+включать ключ секций, поэтому он (id, add_time) и (id, pereval_add_time),
+а внешний ключ изображения составной: (pereval_id, pereval_add_time) ->
+pereval (id, add_time), с каскадным удалением и изменением. Каскадное
+изменение переносит изображения вслед за перевалом, у которого изменили
+add_time; перенос строки между секциями вместе с такими ключами
+PostgreSQL поддерживает с 15-й версии.
+
+Уникальность одного id индекс не гарантирует (уникальна только пара с
+датой): id выдает только последовательность таблицы, явные id (bulk_io)
+тоже берутся из нее. Поиск по одному id без даты проверяет индекс
+первичного ключа каждой секции.
+
+Старые месяцы отсоединяются парой секций (detach_month): сначала
+изображения, затем перевалы - PostgreSQL не отсоединит секцию pereval,
+пока на ее строки ссылаются изображения.
+
+Функции работают на переданном курсоре; транзакцией управляет вызывающий
+код (миграция 0010 и команда manage_partitions).
+"""
+import logging
+import re
+from datetime import date, datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Таблица -> столбец ключа секций. pereval_image ссылается на pereval,
+# поэтому ее секции отсоединяются первыми
+PARTITIONED_TABLES = {
+    'pereval': 'add_time',
+    'pereval_image': 'pereval_add_time',
+}
+DETACH_ORDER = ('pereval_image', 'pereval')
+
+IMAGE_FOREIGN_KEY = 'pereval_image_pereval_fk'
+ADD_IMAGE_FOREIGN_KEY_QUERY = f"""
+    ALTER TABLE pereval_image ADD CONSTRAINT {IMAGE_FOREIGN_KEY}
+    FOREIGN KEY (pereval_id, pereval_add_time) REFERENCES pereval (id, add_time)
+    ON DELETE CASCADE ON UPDATE CASCADE
+"""
+
+# Перенос строк между секциями при изменении ключа, на который ссылается
+# внешний ключ, - с PostgreSQL 15
+MIN_SERVER_VERSION = 150000
+
+# Сколько месяцев вперед создавать секции
+DEFAULT_AHEAD_MONTHS = 3
+
+
+def month_start(value):
+    """Первое число месяца даты или времени"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month():
+    return month_start(datetime.now(timezone.utc))
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def default_partition_name(table):
+    return f'{table}_default'
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def list_partitions(cursor, table):
+    """Месячные секции таблицы: [(месяц, имя)] по возрастанию месяца"""
+    cursor.execute("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = %s::regclass
+    """, [table])
+    pattern = re.compile(rf'^{re.escape(table)}_p(\d{{4}})_(\d{{2}})$')
+    months = []
+    for (name,) in cursor.fetchall():
+        match = pattern.match(name)
+        if match:
+            months.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(months)
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass", [table])
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def _foreign_keys_to(cursor, table):
+    """Внешние ключи других таблиц на table: [(таблица, имя, определение)]"""
+    cursor.execute("""
+        SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE confrelid = %s::regclass AND contype = 'f' AND conparentid = 0
+    """, [table])
+    return cursor.fetchall()
+
+
+def create_partition(cursor, table, month):
+    """
+    Создает секцию месяца month, если ее нет, и переносит в нее строки
+    этого месяца из секции по умолчанию. Возвращает True, если секция создана.
+    """
+    name = partition_name(table, month)
+    if name in {existing for _, existing in list_partitions(cursor, table)}:
+        return False
+
+    column = PARTITIONED_TABLES[table]
+    default = default_partition_name(table)
+    bounds = {'lower': _bound(month), 'upper': _bound(add_months(month, 1))}
+    # Секция создается отдельной таблицей и присоединяется после переноса
+    # строк: ATTACH проверяет, что в секции по умолчанию их больше нет
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE "{column}" >= %(lower)s '
+                   f'AND "{column}" < %(upper)s)', bounds)
+    # Перенос удаляет строки из секции по умолчанию, и внешний ключ с
+    # каскадным удалением удалил бы изображения перенесенных перевалов.
+    # На время переноса такие ключи снимаются и затем создаются заново
+    # (с проверкой всех строк)
+    foreign_keys = _foreign_keys_to(cursor, table) if cursor.fetchone()[0] else []
+    for referencing, key, _ in foreign_keys:
+        cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT "{key}"')
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM "{default}" WHERE "{column}" >= %(lower)s AND "{column}" < %(upper)s
+            RETURNING *
+        )
+        INSERT INTO "{name}" SELECT * FROM moved
+    """, bounds)
+    if cursor.rowcount:
+        logger.info(f"Moved {cursor.rowcount} rows from {default} to {name}")
+    cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%(lower)s) TO (%(upper)s)',
+                   bounds)
+    for referencing, key, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {referencing} ADD CONSTRAINT "{key}" {definition}')
+    return True
+
+
+def missing_months(cursor, table, ahead=DEFAULT_AHEAD_MONTHS, today=None):
+    """Месяцы с текущего на ahead вперед, для которых еще нет секций"""
+    first = month_start(today) if today else current_month()
+    existing = {month for month, _ in list_partitions(cursor, table)}
+    return [month for month in (add_months(first, offset) for offset in range(ahead + 1)) if month not in existing]
+
+
+def ensure_partitions(cursor, table, ahead=DEFAULT_AHEAD_MONTHS, today=None):
+    """Секции с текущего месяца на ahead месяцев вперед; возвращает имена созданных"""
+    created = []
+    for month in missing_months(cursor, table, ahead, today):
+        if create_partition(cursor, table, month):
+            created.append(partition_name(table, month))
+    return created
+
+
+def detach_partition(cursor, table, name, archive_schema=None, drop=False):
+    """
+    Отсоединяет секцию от таблицы. Отсоединенная секция остается обычной
+    таблицей с тем же именем, переносится в схему archive_schema или
+    удаляется (drop). Внешние ключи отсоединенной секции на секционированные
+    таблицы снимаются: строки, на которые они ссылаются, отсоединяются вместе
+    с ней
+    """
+    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+    if drop:
+        cursor.execute(f'DROP TABLE "{name}"')
+        return
+    cursor.execute("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f' AND confrelid::regclass::text = ANY(%s)
+    """, [name, list(PARTITIONED_TABLES)])
+    for (key,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE "{name}" DROP CONSTRAINT "{key}"')
+    if archive_schema:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"')
+        cursor.execute(f'ALTER TABLE "{name}" SET SCHEMA "{archive_schema}"')
+
+
+def expired_months(cursor, retain_months, today=None):
+    """Месяцы секций pereval старше retain_months полных месяцев до текущего"""
+    cutoff = add_months(month_start(today) if today else current_month(), -retain_months)
+    return [month for month, _ in list_partitions(cursor, 'pereval') if month < cutoff]
+
+
+def detach_month(cursor, month, archive_schema=None, drop=False):
+    """
+    Отсоединяет секции месяца month у всех таблиц в порядке DETACH_ORDER
+    (см. detach_partition). Изображения месяца, оставшиеся в секции по
+    умолчанию, сначала переносятся в свою секцию. Возвращает имена секций
+    """
+    create_partition(cursor, 'pereval_image', month)
+    names = []
+    for table in DETACH_ORDER:
+        name = partition_name(table, month)
+        if name in {existing for _, existing in list_partitions(cursor, table)}:
+            detach_partition(cursor, table, name, archive_schema, drop)
+            names.append(name)
+    return names
+
+
+def convert_to_partitioned(cursor, table, history_months=24, ahead=DEFAULT_AHEAD_MONTHS):
+    """
+    Заменяет обычную таблицу секционированной с теми же столбцами, индексами
+    и внешними ключами.
+
+    Создаются секции месяцев с данными за последние history_months месяцев и
+    секции на ahead месяцев вперед; остальные строки попадают в секцию по
+    умолчанию. Таблица копируется целиком в текущей транзакции. На таблицу
+    не должны ссылаться внешние ключи. Обратное преобразование -
+    convert_to_plain.
+    """
+    column = PARTITIONED_TABLES[table]
+    staging = f'{table}_partitioned'
+
+    cursor.execute("""
+        SELECT pg_get_indexdef(indexrelid) FROM pg_index
+        WHERE indrelid = %s::regclass AND NOT indisprimary
+    """, [table])
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+    """, [table])
+    foreign_keys = cursor.fetchall()
+
+    # Продолжаем нумерацию старой последовательности, чтобы id удаленных
+    # строк не выдавались повторно
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    cursor.execute(f'SELECT last_value FROM {sequence}')
+    last_value = cursor.fetchone()[0]
+    cursor.execute(f'SELECT COALESCE(max(id), 0) FROM "{table}"')
+    last_value = max(last_value, cursor.fetchone()[0])
+
+    cursor.execute(f"""
+        CREATE TABLE "{staging}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE ("{column}")
+    """)
+    cursor.execute(f'ALTER TABLE "{staging}" ADD CONSTRAINT "{table}_pkey_new" PRIMARY KEY (id, "{column}")')
+    cursor.execute(f'CREATE TABLE "{default_partition_name(table)}" PARTITION OF "{staging}" DEFAULT')
+
+    cursor.execute(f"""
+        SELECT DISTINCT date_trunc('month', "{column}" AT TIME ZONE 'UTC')::date FROM "{table}"
+        WHERE "{column}" >= %s
+    """, [_bound(add_months(current_month(), -history_months))])
+    months = {row[0] for row in cursor.fetchall()}
+    months.update(add_months(current_month(), offset) for offset in range(ahead + 1))
+    for month in sorted(months):
+        cursor.execute(
+            f'CREATE TABLE "{partition_name(table, month)}" PARTITION OF "{staging}" '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [_bound(month), _bound(add_months(month, 1))],
+        )
+
+    cursor.execute(f'INSERT INTO "{staging}" SELECT * FROM "{table}"')
+    cursor.execute(f'DROP TABLE "{table}"')
+    cursor.execute(f'ALTER TABLE "{staging}" RENAME TO "{table}"')
+    cursor.execute(f'ALTER TABLE "{table}" RENAME CONSTRAINT "{table}_pkey_new" TO "{table}_pkey"')
+
+    # Индексы на секционированной таблице создаются и во всех секциях
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+    cursor.execute(f'CREATE SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+    cursor.execute(f"SELECT setval('\"{table}_id_seq\"', %s)", [max(last_value, 1)])
+    cursor.execute(f"""ALTER TABLE "{table}" ALTER COLUMN id SET DEFAULT nextval('"{table}_id_seq"')""")
+    cursor.execute(f'ANALYZE "{table}"')
+
+
+def convert_to_plain(cursor, table):
+    """
+    Заменяет секционированную таблицу обычной с первичным ключом (id) и теми
+    же индексами и внешними ключами; id снова identity. Переносятся строки
+    присоединенных секций и секции по умолчанию, отсоединенные секции
+    остаются как есть. На таблицу не должны ссылаться внешние ключи.
+    """
+    staging = f'{table}_plain'
+
+    # У секционированной таблицы определение индекса - "ON ONLY <таблица>"
+    cursor.execute("""
+        SELECT replace(pg_get_indexdef(indexrelid), ' ON ONLY ', ' ON ') FROM pg_index
+        WHERE indrelid = %s::regclass AND NOT indisprimary
+    """, [table])
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f' AND conparentid = 0
+    """, [table])
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    cursor.execute(f'SELECT last_value FROM {sequence}')
+    last_value = cursor.fetchone()[0]
+    cursor.execute(f'SELECT COALESCE(max(id), 0) FROM "{table}"')
+    last_value = max(last_value, cursor.fetchone()[0])
+
+    cursor.execute(f'CREATE TABLE "{staging}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    # Умолчание nextval ссылается на последовательность, которая удаляется
+    # вместе со старой таблицей
+    cursor.execute(f'ALTER TABLE "{staging}" ALTER COLUMN id DROP DEFAULT')
+    cursor.execute(f'INSERT INTO "{staging}" SELECT * FROM "{table}"')
+    cursor.execute(f'DROP TABLE "{table}"')
+    cursor.execute(f'ALTER TABLE "{staging}" RENAME TO "{table}"')
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id)')
+
+    for definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+    cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, max(last_value, 1)])
+    cursor.execute(f'ANALYZE "{table}"')
@@ -0,0 +1,81 @@
+"""
+Драйвер PostgreSQL, через который работает Django: psycopg 3, если он
+установлен, иначе psycopg2.
+
+Пул db_pool отдает одни и те же соединения ORM и PerevalDataProcessor,
+поэтому код, обращающийся к драйверу напрямую, берет модуль, исключения и
+статусы транзакции отсюда. Для различий API (COPY, mogrify, execute_values)
+здесь же обертки с интерфейсом psycopg2.
+"""
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+if is_psycopg3:
+    import psycopg as Database
+    from psycopg import errors
+    from psycopg.pq import TransactionStatus
+
+    TRANSACTION_STATUS_IDLE = TransactionStatus.IDLE
+    TRANSACTION_STATUS_UNKNOWN = TransactionStatus.UNKNOWN
+else:
+    import psycopg2 as Database
+    import psycopg2.errors as errors
+    import psycopg2.extensions
+    import psycopg2.extras
+
+    TRANSACTION_STATUS_IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    TRANSACTION_STATUS_UNKNOWN = psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+
+Error = Database.Error
+InterfaceError = Database.InterfaceError
+OperationalError = Database.OperationalError
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+def mogrify(cursor, query, params=None):
+    """Текст запроса с подставленными параметрами (str)"""
+    if not hasattr(cursor, 'mogrify'):
+        # Курсор с привязкой параметров на сервере (server_side_binding)
+        cursor = Database.ClientCursor(cursor.connection)
+    query = cursor.mogrify(query, params)
+    return query.decode('utf-8') if isinstance(query, bytes) else query
+
+
+def copy_expert(cursor, query, file, size=COPY_CHUNK_SIZE):
+    """COPY ... FROM STDIN читает из file, COPY ... TO STDOUT пишет в file (байты)"""
+    if not is_psycopg3:
+        cursor.copy_expert(query, file, size)
+        return
+    with cursor.copy(query) as copy:
+        if hasattr(file, 'read'):
+            while True:
+                chunk = file.read(size)
+                if not chunk:
+                    break
+                copy.write(chunk)
+        else:
+            for chunk in copy:
+                file.write(bytes(chunk))
+
+
+def execute_values(cursor, query, argslist, template=None, page_size=100, fetch=False):
+    """
+    Многострочный INSERT: query с одним %s вместо VALUES, как у
+    psycopg2.extras.execute_values. Под psycopg 3 строки подставляются на
+    клиенте тем же mogrify, пачками по page_size.
+    """
+    if not is_psycopg3:
+        return psycopg2.extras.execute_values(cursor, query, argslist, template, page_size, fetch)
+    argslist = list(argslist)
+    head, tail = query.split('%s', 1)
+    result = []
+    for start in range(0, len(argslist), page_size):
+        rows = []
+        for args in argslist[start:start + page_size]:
+            row_template = template or '(%s)' % ', '.join(['%s'] * len(args))
+            rows.append(mogrify(cursor, row_template, args))
+        # Запрос уже без параметров: %% в его тексте означает %
+        cursor.execute(head.replace('%%', '%') + ', '.join(rows) + tail.replace('%%', '%'))
+        if fetch:
+            result.extend(cursor.fetchall())
+    return result if fetch else None
@@ -0,0 +1,162 @@
+"""
+Реестр именованных серверных prepared statements для запросов пула db_pool.
+
+Запрос регистрируется один раз при импорте модуля: текст с параметрами
+%(name)s или %s переводится в PREPARE с параметрами $1..$n и явными
+типами. На каждом соединении пула PREPARE выполняется при первом
+использовании, дальше запрос идет как EXECUTE имя (...), и сервер не
+разбирает и не планирует его заново. Реестр считает выполнения и время
+каждого запроса (экспортируются в /metrics).
+
+PEREVAL_PREPARED_STATEMENTS = False отключает PREPARE (например, за
+pgbouncer в режиме transaction, где соединение сервера меняется между
+транзакциями): тогда запросы выполняются как обычно, а статистика
+продолжает собираться. Асинхронный путь на psycopg 3 готовит запросы сам
+(prepare_threshold драйвера).
+"""
+import logging
+import re
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+from .pg_driver import errors
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s|%s|%%')
+
+
+def to_server_params(query):
+    """
+    Переводит параметры драйвера (%(name)s, %s) в параметры сервера.
+
+    Возвращает (текст с $1..$n, имена параметров по порядку номеров);
+    у позиционных параметров %s имена - их индексы.
+    """
+    names = []
+
+    def replace(match):
+        if match.group() == '%%':
+            return '%'
+        name = match.group(1)
+        if name is None:
+            names.append(len(names))
+            return f'${len(names)}'
+        if name not in names:
+            names.append(name)
+        return f'${names.index(name) + 1}'
+
+    return _PLACEHOLDER.sub(replace, query), names
+
+
+class PreparedStatement:
+    """
+    Запрос с именем для PREPARE.
+
+    types - типы параметров: словарь имя -> тип для %(name)s или список для
+    %s. Тип, который не указан, сервер выводит из контекста, как у обычного
+    запроса; указывать нужно параметры в списках SELECT и сравнениях.
+    """
+
+    def __init__(self, name, query, types=None):
+        self.name = name
+        self.query = query
+        server_query, self.params = to_server_params(query)
+        types = types or {}
+        if isinstance(types, (list, tuple)):
+            types = dict(enumerate(types))
+        unknown = set(types) - set(self.params)
+        if unknown:
+            raise ValueError(f"Statement {name} has no parameters {sorted(map(str, unknown))}")
+
+        declared = ''
+        if self.params:
+            declared = ' (%s)' % ', '.join(types.get(param, 'unknown') for param in self.params)
+        self.prepare_sql = f'PREPARE {name}{declared} AS {server_query}'
+
+        if not self.params:
+            self.execute_sql = f'EXECUTE {name}'
+        elif isinstance(self.params[0], int):
+            self.execute_sql = f'EXECUTE {name} (%s)' % ', '.join(['%s'] * len(self.params))
+        else:
+            self.execute_sql = f'EXECUTE {name} (%s)' % ', '.join(f'%({param})s' for param in self.params)
+
+
+class StatementRegistry:
+    """
+    Зарегистрированные запросы, их подготовка на соединениях и статистика.
+
+    Набор подготовленных на соединении запросов хранится по слабой ссылке
+    на соединение: закрытое и выброшенное пулом соединение уносит его с собой.
+    """
+
+    def __init__(self):
+        self._statements = {}
+        self._prepared = weakref.WeakKeyDictionary()  # соединение -> имена
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, query, types=None):
+        statement = PreparedStatement(name, query, types)
+        with self._lock:
+            if name in self._statements and self._statements[name].query != query:
+                raise ValueError(f"Statement {name} is already registered with another query")
+            self._statements[name] = statement
+            self._stats.setdefault(name, {'prepares': 0, 'executions': 0, 'seconds_total': 0.0,
+                                          'seconds_max': 0.0})
+        return statement
+
+    def _enabled(self):
+        return getattr(settings, 'PEREVAL_PREPARED_STATEMENTS', True)
+
+    def _prepare(self, cursor, statement):
+        conn = cursor.connection
+        with self._lock:
+            prepared = self._prepared.setdefault(conn, set())
+            if statement.name in prepared:
+                return
+        cursor.execute(statement.prepare_sql)
+        with self._lock:
+            prepared.add(statement.name)
+            self._stats[statement.name]['prepares'] += 1
+
+    def _forget(self, conn):
+        with self._lock:
+            self._prepared.pop(conn, None)
+
+    def execute(self, cursor, name, params=None):
+        """Выполняет зарегистрированный запрос на курсоре соединения пула"""
+        statement = self._statements[name]
+        started = time.perf_counter()
+        if not self._enabled():
+            cursor.execute(statement.query, params)
+        else:
+            self._prepare(cursor, statement)
+            try:
+                cursor.execute(statement.execute_sql, params)
+            except errors.InvalidSqlStatementName:
+                # Сессию сбросили (DISCARD ALL, DEALLOCATE): готовим заново.
+                # В открытой транзакции после ошибки повторять нельзя
+                self._forget(cursor.connection)
+                if not cursor.connection.autocommit:
+                    raise
+                logger.info(f"Prepared statement {name} is gone, preparing again")
+                self._prepare(cursor, statement)
+                cursor.execute(statement.execute_sql, params)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats[name]
+            stats['executions'] += 1
+            stats['seconds_total'] += elapsed
+            stats['seconds_max'] = max(stats['seconds_max'], elapsed)
+
+    def stats(self):
+        """Счетчики по именам запросов для мониторинга"""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+statements = StatementRegistry()
@@ -0,0 +1,175 @@
+"""
+Доступ к перевалам через ORM: единое место для запросов чтения и пакетной
+записи.
+
+Чтение выбирает перевал с пользователем, координатами и уровнем одним JOIN
+(select_related), а изображения - вторым запросом (prefetch_related) без
+столбца data со старым base64-содержимым. Пакетная запись идет через
+bulk_create в transaction.atomic. Соединения ORM берутся из того же пула
+pereval_app.db_pool, что и у PerevalDataProcessor.
+
+Одиночная отправка (SUBMIT_PEREVAL_QUERY), выдача модерации и COPY в
+bulk_io остаются на SQL: это один оператор на операцию, который ORM
+выразить не может.
+"""
+import uuid
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .metrics import span
+from .models import Coords, Image, Level, Pereval, User
+
+# Поля изображения для списков и image_mode='meta'
+IMAGE_META_FIELDS = ('id', 'pereval_id', 'title', 'size', 'mime_type', 'date_added')
+# Поля изображения для выдачи содержимого (data загружается отдельно и
+# только для старых записей без sha256)
+IMAGE_CONTENT_FIELDS = ('id', 'pereval_id', 'title', 'sha256')
+
+
+def _submission_key(params):
+    key = params.get('submission_key')
+    return uuid.UUID(str(key)) if key else None
+
+
+def aware_datetime(value):
+    """
+    Время отчета (datetime или строка) с часовым поясом. Время без пояса
+    считается временем TIME_ZONE, пустое значение - текущим временем.
+    """
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is None:
+        return timezone.now()
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+class PerevalRepository:
+    """
+    Запросы к перевалам и изображениям базы данных using.
+
+    using=None - базу выбирает роутер (чтение с реплик, запись в default)
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+
+    def perevals(self):
+        """Перевалы вместе с пользователем, координатами и уровнем"""
+        return Pereval.objects.using(self.using).select_related('user', 'coords', 'level')
+
+    def _with_images(self, queryset, fields):
+        return queryset.prefetch_related(
+            Prefetch('images', queryset=Image.objects.using(self.using).only(*fields).order_by('id'))
+        )
+
+    def list_queryset(self):
+        """Перевалы для списков: изображения без содержимого"""
+        return self._with_images(self.perevals(), IMAGE_META_FIELDS)
+
+    def get(self, pereval_id, with_content=False):
+        """
+        Перевал с изображениями или None.
+
+        with_content - загрузить поля для выдачи содержимого изображений
+        (sha256), иначе только метаданные
+        """
+        fields = IMAGE_CONTENT_FIELDS if with_content else IMAGE_META_FIELDS
+        return self._with_images(self.perevals(), fields).filter(pk=pereval_id).first()
+
+    def legacy_image_data(self, image_ids):
+        """base64 старых изображений, хранящихся в pereval_image.data: id -> строка"""
+        if not image_ids:
+            return {}
+        return dict(Image.objects.using(self.using).filter(pk__in=image_ids).values_list('id', 'data'))
+
+    def image_source(self, image_id):
+        """sha256 и MIME-тип изображения или None, если его нет"""
+        return Image.objects.using(self.using).filter(pk=image_id).values('sha256', 'mime_type').first()
+
+    def create_batch(self, batch):
+        """
+        Записывает пачку параметров SUBMIT_PEREVAL_QUERY (см.
+        PerevalDataProcessor._submit_params) одной транзакцией и возвращает
+        id перевалов в том же порядке. Для отчетов с submission_key, которые
+        уже записаны, возвращается id существующего перевала
+        """
+        with transaction.atomic(using=self.using or DEFAULT_DB_ALIAS):
+            keys = [_submission_key(params) for params in batch if params.get('submission_key')]
+            submitted = {}
+            if keys:
+                submitted = dict(
+                    Pereval.objects.using(self.using).filter(submission_key__in=keys)
+                    .values_list('submission_key', 'id')
+                )
+            pending = [params for params in batch if _submission_key(params) not in submitted]
+
+            # Пользователи и уровни без повторов и в порядке ключа: ON CONFLICT
+            # не может обновить одну строку дважды, а единый порядок блокировок
+            # исключает взаимоблокировки параллельных пачек
+            users = {}
+            levels = {}
+            for params in pending:
+                users.setdefault(params['email'], User(
+                    email=params['email'], fam=params['fam'], name=params['name'],
+                    otc=params['otc'], phone=params['phone'],
+                ))
+                key = (params['winter'], params['summer'], params['autumn'], params['spring'])
+                levels.setdefault(key, Level(winter=key[0], summer=key[1], autumn=key[2], spring=key[3]))
+
+            # DO UPDATE, а не DO NOTHING, чтобы RETURNING вернул id и
+            # существующих строк
+            with span('insert_users'):
+                User.objects.using(self.using).bulk_create(
+                    [users[email] for email in sorted(users)],
+                    update_conflicts=True, unique_fields=['email'], update_fields=['email'],
+                )
+            with span('insert_levels'):
+                Level.objects.using(self.using).bulk_create(
+                    [levels[key] for key in sorted(levels)],
+                    update_conflicts=True, unique_fields=['winter', 'summer', 'autumn', 'spring'],
+                    update_fields=['winter'],
+                )
+
+            coords = [
+                Coords(latitude=params['latitude'], longitude=params['longitude'],
+                       height=params['height'], geohash=params['geohash'])
+                for params in pending
+            ]
+            with span('insert_coords'):
+                Coords.objects.using(self.using).bulk_create(coords)
+
+            perevals = [
+                Pereval(
+                    beauty_title=params['beauty_title'], title=params['title'],
+                    other_titles=params['other_titles'], connect=params['connect'],
+                    add_time=aware_datetime(params['add_time']), user=users[params['email']], coords=coords_row,
+                    level=levels[(params['winter'], params['summer'], params['autumn'], params['spring'])],
+                    status='new', submission_key=params.get('submission_key'),
+                )
+                for params, coords_row in zip(pending, coords)
+            ]
+            with span('insert_perevals'):
+                Pereval.objects.using(self.using).bulk_create(perevals)
+
+            images = [
+                Image(pereval=pereval, pereval_add_time=pereval.add_time, title=title, sha256=sha256, size=size,
+                      mime_type=mime_type, date_added=aware_datetime(params['date_added']))
+                for pereval, params in zip(perevals, pending)
+                for title, sha256, size, mime_type in zip(
+                    params['image_titles'], params['image_sha256'],
+                    params['image_sizes'], params['image_mime_types'],
+                )
+            ]
+            if images:
+                with span('insert_images'):
+                    Image.objects.using(self.using).bulk_create(images)
+        created = iter(perevals)
+        return [
+            submitted[key] if key in submitted else next(created).pk
+            for key in map(_submission_key, batch)
+        ]
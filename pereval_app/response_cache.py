@@ -0,0 +1,243 @@
+"""
+Кэш готовых JSON-ответов для чтения перевалов.
+
+Первый уровень - LRU в памяти процесса, ограниченный суммарным размером
+тел в байтах. Второй, необязательный, - общий backend из settings.CACHES,
+чтобы несколько процессов не собирали один и тот же ответ. Для общего
+кэша у каждого перевала есть счетчик поколений: инвалидация увеличивает
+его, и старые записи перестают находиться во всех процессах сразу.
+
+Без общего backend инвалидация видна только своему процессу, и другие
+процессы (воркеры gunicorn) отдавали бы устаревший ответ и 304 на старый
+ETag до TIMEOUT секунд. Поэтому по умолчанию (ENABLED: None) кэш включен
+только с общим backend; LocMemCache и DummyCache общими не считаются.
+ENABLED: True включает кэш и без него - для развертываний в один процесс.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag'])
+
+DEFAULT_OPTIONS = {
+    'ENABLED': None,
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'BACKEND': None,
+    'TIMEOUT': 300,
+    'MAX_GENERATIONS': 100_000,
+}
+
+
+def make_etag(body):
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+def is_shared_backend(alias):
+    """Виден ли backend из CACHES всем процессам (память процесса - нет)"""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+class LRUByteCache:
+    """
+    Потокобезопасный LRU-кэш CachedResponse с ограничением по объему тел.
+
+    Ключ - кортеж, первый элемент которого задает группу для delete_group().
+    timeout - срок жизни записи в секундах (None - без срока).
+    """
+
+    def __init__(self, max_bytes, timeout=None):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._data = OrderedDict()  # ключ -> (значение, момент устаревания)
+        self._groups = {}  # группа -> ключи, для инвалидации всех вариантов
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = len(value.body)
+        if size > self.max_bytes:
+            return
+        expires_at = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, expires_at)
+            self._bytes += size
+            self._groups.setdefault(key[0], set()).add(key)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0].body)
+            group = key[0]
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+
+    def delete_group(self, group):
+        with self._lock:
+            for key in list(self._groups.get(group, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._groups.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class ResponseCache:
+    """
+    Двухуровневый кэш ответов с ключом (id перевала, вариант представления).
+
+    Вариант различает представления одной записи (например, с полными
+    изображениями или только с метаданными); invalidate() сбрасывает все
+    варианты перевала. lookup() возвращает вместе с ответом поколение записи,
+    которое нужно передать в store(): если между чтением из БД и сохранением
+    запись инвалидировали, устаревший ответ попадет под старое поколение и
+    никому не будет выдан.
+
+    Без общего backend поколения хранятся в процессе для не более чем
+    max_generations перевалов. Поколения берутся из общего счетчика; у
+    вытесненных перевалов поколение равно наибольшему вытесненному, так что
+    оно не уменьшается и старые записи по-прежнему не находятся.
+
+    Выключенный кэш (enabled=False) ничего не хранит: каждый запрос читает
+    БД, ETag по-прежнему вычисляется по телу ответа.
+    """
+
+    def __init__(self, max_bytes, backend=None, timeout=300, max_generations=100_000, enabled=True):
+        self.enabled = enabled
+        self.local = LRUByteCache(max_bytes, timeout)
+        self.backend = caches[backend] if backend else None
+        self.timeout = timeout
+        self.max_generations = max_generations
+        self._generations = OrderedDict()
+        self._generation_counter = 0
+        self._generation_floor = 0
+        self._generations_lock = threading.Lock()
+
+    def _generation(self, pereval_id):
+        if self.backend is None:
+            with self._generations_lock:
+                return self._generations.get(pereval_id, self._generation_floor)
+        return self.backend.get(f'pereval:{pereval_id}:gen', 0)
+
+    def lookup(self, pereval_id, variant):
+        """Возвращает (CachedResponse или None, поколение)"""
+        if not self.enabled:
+            return None, 0
+        generation = self._generation(pereval_id)
+        key = (pereval_id, variant, generation)
+        cached = self.local.get(key)
+        if cached is not None or self.backend is None:
+            return cached, generation
+
+        body = self.backend.get(f'pereval:{pereval_id}:{generation}:{variant}')
+        if body is None:
+            return None, generation
+        cached = CachedResponse(body, make_etag(body))
+        self.local.set(key, cached)
+        return cached, generation
+
+    def store(self, pereval_id, variant, generation, body):
+        cached = CachedResponse(body, make_etag(body))
+        if not self.enabled:
+            return cached
+        self.local.set((pereval_id, variant, generation), cached)
+        if self.backend is not None:
+            self.backend.set(f'pereval:{pereval_id}:{generation}:{variant}', body, self.timeout)
+        return cached
+
+    def invalidate(self, pereval_id):
+        if not self.enabled:
+            return
+        if self.backend is None:
+            with self._generations_lock:
+                self._generation_counter += 1
+                self._generations[pereval_id] = self._generation_counter
+                self._generations.move_to_end(pereval_id)
+                while len(self._generations) > self.max_generations:
+                    _, evicted = self._generations.popitem(last=False)
+                    self._generation_floor = max(self._generation_floor, evicted)
+        self.local.delete_group(pereval_id)
+        if self.backend is not None:
+            gen_key = f'pereval:{pereval_id}:gen'
+            # add() не перезапишет счетчик, созданный другим процессом
+            self.backend.add(gen_key, 0, None)
+            try:
+                self.backend.incr(gen_key)
+            except ValueError:
+                self.backend.set(gen_key, 1, None)
+
+    def stats(self):
+        return self.local.stats()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Общий для процесса кэш ответов, настроенный через PEREVAL_RESPONSE_CACHE"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                options = {**DEFAULT_OPTIONS, **getattr(settings, 'PEREVAL_RESPONSE_CACHE', {})}
+                enabled = options['ENABLED']
+                if enabled is None:
+                    enabled = bool(options['BACKEND']) and is_shared_backend(options['BACKEND'])
+                _cache = ResponseCache(options['MAX_BYTES'], options['BACKEND'], options['TIMEOUT'],
+                                       options['MAX_GENERATIONS'], enabled)
+    return _cache
+
+
+def invalidate_pereval(*pereval_ids):
+    """Сбрасывает закэшированные ответы для перевалов"""
+    cache = get_response_cache()
+    for pereval_id in pereval_ids:
+        cache.invalidate(pereval_id)
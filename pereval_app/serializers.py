@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from datetime import datetime
-import base64
+from .blob_store import StoredImage
+from .image_validation import ImageValidationError, validate_image_base64
 from .models import User, Coords, Level, Pereval, Image
 
 
@@ -8,12 +9,10 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['email', 'fam', 'name', 'otc', 'phone']
-
-    def validate_email(self, value):
-        """Проверка уникальности email"""
-        if User.objects.filter(email=value).exists():
-            pass
-        return value
+        # Повторная отправка с тем же email - обычный случай: пользователь
+        # находится или создается upsert в SUBMIT_PEREVAL_QUERY, поэтому
+        # проверка уникальности (лишний запрос к БД) не нужна
+        extra_kwargs = {'email': {'validators': []}}
 
 
 class CoordsSerializer(serializers.ModelSerializer):
@@ -26,27 +25,37 @@ class LevelSerializer(serializers.ModelSerializer):
     class Meta:
         model = Level
         fields = ['winter', 'summer', 'autumn', 'spring']
+        # Уровни - общий справочник: совпадение с существующим уровнем не
+        # ошибка, а повторное использование строки (upsert при записи)
+        validators = []
+
+
+class ImageDataField(serializers.CharField):
+    """
+    Содержимое изображения: строка base64 либо StoredImage, если изображение
+    уже сохранено при потоковом разборе запроса
+    """
+
+    def run_validation(self, data=serializers.empty):
+        if isinstance(data, StoredImage):
+            return data
+        return super().run_validation(data)
 
 
 class ImageSerializer(serializers.Serializer):
-    data = serializers.CharField(required=True)
+    data = ImageDataField(required=True)
     title = serializers.CharField(required=True, max_length=255)
 
     def validate_data(self, value):
-        """Проверка формата изображения"""
-        if isinstance(value, str) and value.startswith('data:image'):
-            try:
-                # Проверяем, что это валидный base64
-                base64.b64decode(value.split(',')[1])
-                return value
-            except:
-                raise serializers.ValidationError("Invalid base64 image data")
-        # Gринимаем обычный base64 без префикса
-        try:
-            base64.b64decode(value)
+        """Проверка формата изображения без полного декодирования base64"""
+        if isinstance(value, StoredImage):
+            # Уже декодировано и проверено при потоковом разборе
             return value
-        except:
-            raise serializers.ValidationError("Invalid base64 image data")
+        try:
+            validate_image_base64(value)
+        except ImageValidationError as e:
+            raise serializers.ValidationError(str(e))
+        return value
 
 
 class PerevalSerializer(serializers.Serializer):
@@ -65,4 +74,79 @@ class PerevalSerializer(serializers.Serializer):
         if 'images' not in data or not data['images']:
             raise serializers.ValidationError("At least one image is required")
 
-        return data
\ No newline at end of file
+        return data
+
+
+class ImageMetaSerializer(serializers.ModelSerializer):
+    """Метаданные изображения без содержимого"""
+
+    class Meta:
+        model = Image
+        fields = ['id', 'title', 'size', 'mime_type', 'date_added']
+
+
+class PerevalListSerializer(serializers.ModelSerializer):
+    """Перевал в списке: вложенные данные и метаданные изображений без base64"""
+    user = UserSerializer(read_only=True)
+    coords = CoordsSerializer(read_only=True)
+    level = LevelSerializer(read_only=True)
+    images = ImageMetaSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Pereval
+        fields = [
+            'id', 'beauty_title', 'title', 'other_titles', 'connect', 'add_time',
+            'status', 'user', 'coords', 'level', 'images',
+        ]
+
+
+class ModerationClaimSerializer(serializers.Serializer):
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=100)
+
+
+class ModerationStatusSerializer(serializers.Serializer):
+    """Итог модерации; 'new' возвращает перевал в очередь"""
+    status = serializers.ChoiceField(choices=['accepted', 'rejected', 'new'])
+
+
+def _parse_floats(value, count, name):
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        raise serializers.ValidationError(f"{name}: ожидаются числа через запятую")
+    if len(numbers) != count:
+        raise serializers.ValidationError(f"{name}: ожидается {count} числа")
+    return numbers
+
+
+class PerevalSearchSerializer(serializers.Serializer):
+    """
+    Параметры поиска на карте:
+    bbox=min_lon,min_lat,max_lon,max_lat или near=lat,lon&k=10, а также min_height/max_height
+    """
+    bbox = serializers.CharField(required=False)
+    near = serializers.CharField(required=False)
+    k = serializers.IntegerField(required=False, default=10, min_value=1, max_value=1000)
+    min_height = serializers.IntegerField(required=False)
+    max_height = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(required=False, default=1000, min_value=1, max_value=5000)
+
+    def validate_bbox(self, value):
+        min_lon, min_lat, max_lon, max_lat = _parse_floats(value, 4, 'bbox')
+        if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            raise serializers.ValidationError("bbox: координаты вне допустимого диапазона")
+        # min_lon > max_lon означает прямоугольник через антимеридиан
+        return min_lat, min_lon, max_lat, max_lon
+
+    def validate_near(self, value):
+        latitude, longitude = _parse_floats(value, 2, 'near')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise serializers.ValidationError("near: координаты вне допустимого диапазона")
+        return latitude, longitude
+
+    def validate(self, data):
+        if 'bbox' in data and 'near' in data:
+            raise serializers.ValidationError("Укажите либо bbox, либо near")
+        if not ({'bbox', 'near', 'min_height', 'max_height'} & data.keys()):
+            raise serializers.ValidationError("Укажите bbox, near или диапазон высот")
+        return data
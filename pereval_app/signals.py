@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .data_processor import level_id_cache, user_id_cache
+from .models import Coords, Image, Level, Pereval, User
+from .response_cache import invalidate_pereval
+
+
+@receiver([post_save, post_delete], sender=Pereval)
+def invalidate_pereval_cache(sender, instance, **kwargs):
+    """Изменение перевала (в том числе статуса) сбрасывает его кэш"""
+    invalidate_pereval(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Image)
+def invalidate_image_cache(sender, instance, **kwargs):
+    invalidate_pereval(instance.pereval_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Coords)
+@receiver([post_save, post_delete], sender=Level)
+def invalidate_related_cache(sender, instance, **kwargs):
+    """Пользователь, координаты и уровень входят в ответ по каждому своему перевалу"""
+    field = {User: 'user', Coords: 'coords', Level: 'level'}[sender]
+    invalidate_pereval(*Pereval.objects.filter(**{field: instance.pk}).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def forget_user_id(sender, instance, **kwargs):
+    user_id_cache.discard_id(instance.pk)
+
+
+@receiver(post_delete, sender=Level)
+def forget_level_id(sender, instance, **kwargs):
+    level_id_cache.discard_id(instance.pk)
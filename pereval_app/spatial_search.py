@@ -0,0 +1,111 @@
+"""
+Поиск перевалов на карте: в прямоугольнике, k ближайших и по высоте.
+
+Прямоугольник переводится в набор префиксов геохеша (см. geo.cover_bbox),
+которые отбираются по индексу pereval_coords.geohash; точная проверка
+широты/долготы и расстояния выполняется тем же запросом.
+Если прямоугольник слишком велик для покрытия ячейками, поиск идет только
+по диапазонам широты и долготы.
+"""
+import math
+
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+
+from . import geo
+from .models import Pereval
+
+# Поля компактного ответа: клиент получает массивы значений в этом порядке
+COMPACT_FIELDS = ['id', 'latitude', 'longitude', 'height', 'title', 'status']
+
+NEAREST_START_RADIUS_KM = 10.0
+# Половина окружности Земли: дальше точек не бывает
+NEAREST_MAX_RADIUS_KM = math.pi * geo.EARTH_RADIUS_KM
+
+
+def _bbox_condition(min_lat, min_lon, max_lat, max_lon):
+    condition = Q()
+    for box in geo.split_antimeridian(min_lat, min_lon, max_lat, max_lon):
+        box_min_lat, box_min_lon, box_max_lat, box_max_lon = box
+        box_condition = Q(
+            coords__latitude__gte=box_min_lat, coords__latitude__lte=box_max_lat,
+            coords__longitude__gte=box_min_lon, coords__longitude__lte=box_max_lon,
+        )
+        cells = geo.cover_bbox(*box)
+        if cells:
+            cells_condition = Q()
+            for cell in cells:
+                cells_condition |= Q(coords__geohash__startswith=cell)
+            box_condition &= cells_condition
+        condition |= box_condition
+    return condition
+
+
+def _height_condition(min_height, max_height):
+    condition = Q()
+    if min_height is not None:
+        condition &= Q(coords__height__gte=min_height)
+    if max_height is not None:
+        condition &= Q(coords__height__lte=max_height)
+    return condition
+
+
+def _distance_km(latitude, longitude):
+    """Выражение для расстояния от точки до перевала, как в geo.haversine_km"""
+    phi1 = math.radians(latitude)
+    phi2 = Radians(Cast('coords__latitude', FloatField()))
+    d_lambda = Radians(Cast('coords__longitude', FloatField())) - Value(math.radians(longitude))
+    a = (Power(Sin((phi2 - Value(phi1)) / Value(2.0)), 2)
+         + Value(math.cos(phi1)) * Cos(phi2) * Power(Sin(d_lambda / Value(2.0)), 2))
+    return Value(2 * geo.EARTH_RADIUS_KM) * ASin(Least(Value(1.0), Sqrt(a)))
+
+
+def _rows(queryset):
+    return [
+        [pk, round(float(lat), 6), round(float(lon), 6), height, title, status]
+        for pk, lat, lon, height, title, status in queryset.values_list(
+            'id', 'coords__latitude', 'coords__longitude', 'coords__height', 'title', 'status'
+        )
+    ]
+
+
+def search_bbox(bbox=None, min_height=None, max_height=None, limit=1000):
+    """
+    Перевалы в прямоугольнике bbox = (min_lat, min_lon, max_lat, max_lon)
+    и/или в диапазоне высот. Строки в порядке COMPACT_FIELDS.
+    """
+    condition = _height_condition(min_height, max_height)
+    if bbox is not None:
+        condition &= _bbox_condition(*bbox)
+    return _rows(Pereval.objects.filter(condition).order_by('id')[:limit])
+
+
+def search_nearest(latitude, longitude, k=10, min_height=None, max_height=None,
+                   max_radius_km=NEAREST_MAX_RADIUS_KM):
+    """
+    k ближайших перевалов к точке. Строки в порядке COMPACT_FIELDS
+    с расстоянием в километрах в конце.
+
+    Радиус поиска удваивается, пока внутри круга не найдется k перевалов:
+    все, что лежит ближе найденных, гарантированно попало в выборку.
+    Фильтр по высоте, расстояние, сортировка и LIMIT k выполняются в БД,
+    поэтому каждый круг возвращает не больше k строк.
+    """
+    height_condition = _height_condition(min_height, max_height)
+    distance = _distance_km(latitude, longitude)
+    radius = NEAREST_START_RADIUS_KM
+    while True:
+        bbox = geo.bbox_around(latitude, longitude, radius)
+        queryset = (
+            Pereval.objects.filter(height_condition & _bbox_condition(*bbox))
+            .annotate(distance=distance).filter(distance__lte=radius)
+            .order_by('distance', 'id')
+            .values_list('id', 'coords__latitude', 'coords__longitude', 'coords__height', 'title', 'status', 'distance')
+        )[:k]
+        found = [
+            [pk, round(float(lat), 6), round(float(lon), 6), height, title, status, round(dist, 3)]
+            for pk, lat, lon, height, title, status, dist in queryset
+        ]
+        if len(found) >= k or radius >= max_radius_km:
+            return found
+        radius = min(radius * 2, max_radius_km)
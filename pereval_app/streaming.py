@@ -0,0 +1,340 @@
+"""
+Потоковый разбор тела POST /api/submitData/.
+
+Обычный путь (request.data) читает и разбирает весь JSON в памяти, а вместе
+с ним и все изображения в base64. Здесь тело читается блоками: скалярные
+поля собираются в обычный словарь, а строки images[].data по мере чтения
+декодируются из base64 и пишутся прямо в BlobStore. Вместо строки в
+результат попадает StoredImage, так что пиковое потребление памяти не
+зависит от размера и числа фотографий.
+"""
+import base64
+import binascii
+import codecs
+import json
+import re
+
+from .blob_store import StoredImage, get_blob_store, sniff_mime_type
+from .image_validation import MAX_HEADER_BYTES, ImageValidationError, check_image, get_limits, image_size
+
+READ_SIZE = 64 * 1024
+
+# Максимальная вложенность объектов и массивов: разбор рекурсивный
+MAX_DEPTH = 64
+
+# Максимальная длина префикса data:image/...;base64,
+MAX_DATA_URI_PREFIX = 256
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_NUMBER_CHARS = frozenset('+-0123456789.eE')
+_WHITESPACE = ' \t\n\r'
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_BASE64_WHITESPACE = str.maketrans('', '', ' \t\n\r')
+
+
+class StreamingParseError(ValueError):
+    """Тело запроса не является корректным JSON"""
+
+
+class Base64BlobSink:
+    """
+    Принимает строку base64 частями и пишет декодированные байты в BlobStore.
+
+    Поддерживает префикс data:image/...;base64, как и ImageSerializer, и
+    применяет те же ограничения на формат, размер и разрешение.
+    """
+
+    def __init__(self, store, limits=None):
+        self.writer = store.writer()
+        self.limits = limits or get_limits()
+        self.prefix = ''
+        self.prefix_done = False
+        self.pending = ''
+        self.header = b''
+        self.padded = False
+
+    def write(self, text):
+        if not self.prefix_done:
+            text = self._consume_prefix(text)
+            if not text:
+                return
+
+        text = self.pending + text.translate(_BASE64_WHITESPACE)
+        usable = len(text) - len(text) % 4
+        self.pending = text[usable:]
+        if usable:
+            self._decode(text[:usable])
+
+    def _consume_prefix(self, text):
+        self.prefix += text
+        if not self.prefix.startswith('data:'[:len(self.prefix)]):
+            # Обычный base64 без префикса
+            self.prefix_done = True
+            text, self.prefix = self.prefix, ''
+            return text
+        if ',' not in self.prefix:
+            if len(self.prefix) > MAX_DATA_URI_PREFIX:
+                raise ImageValidationError("Invalid data URI prefix")
+            return ''
+        _, _, text = self.prefix.partition(',')
+        self.prefix_done = True
+        self.prefix = ''
+        return text
+
+    def _decode(self, text):
+        if self.padded:
+            raise ImageValidationError("Invalid base64 image data: data after padding")
+        try:
+            data = base64.b64decode(text, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise ImageValidationError(f"Invalid base64 image data: {e}")
+        self.padded = text.endswith('=')
+        if len(self.header) < MAX_HEADER_BYTES:
+            self.header += data[:MAX_HEADER_BYTES - len(self.header)]
+        if self.writer.size + len(data) > self.limits['MAX_BYTES']:
+            raise ImageValidationError(f"Image is larger than {self.limits['MAX_BYTES']} bytes")
+        self.writer.write(data)
+
+    def close(self):
+        if not self.prefix_done:
+            # Строка короче префикса data: - разбираем ее как обычный base64
+            self.prefix_done = True
+            text, self.prefix = self.prefix, ''
+            self.write(text)
+        if self.pending:
+            raise ImageValidationError("Invalid base64 image data: incorrect padding")
+        if not self.writer.size:
+            raise ImageValidationError("Empty image data")
+        mime_type = sniff_mime_type(self.header)
+        check_image(mime_type, self.writer.size, image_size(mime_type, self.header), self.limits)
+        digest, size = self.writer.commit()
+        return StoredImage(digest, size, mime_type)
+
+    def abort(self):
+        self.writer.abort()
+
+
+class JSONStreamParser:
+    """
+    Рекурсивный разборщик JSON, читающий поток блоками.
+
+    string_sink(path) вызывается для каждой строки-значения; если он вернул
+    объект с методами write/close/abort, содержимое строки передается ему
+    по частям, а значением в результате становится то, что вернул close().
+    Документ глубже max_depth уровней отклоняется.
+    """
+
+    def __init__(self, stream, string_sink=None, read_size=READ_SIZE, max_depth=MAX_DEPTH):
+        self.stream = stream
+        self.string_sink = string_sink
+        self.read_size = read_size
+        self.max_depth = max_depth
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Дочитывает следующий блок; возвращает False в конце потока"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.read_size)
+        try:
+            text = self.decoder.decode(chunk or b'', final=not chunk)
+        except UnicodeDecodeError as e:
+            raise StreamingParseError(f"Invalid UTF-8: {e}")
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return bool(text) or not self.eof
+
+    def _peek(self):
+        while self.pos >= len(self.buf):
+            if not self._fill():
+                raise StreamingParseError("Unexpected end of JSON")
+        return self.buf[self.pos]
+
+    def _next(self):
+        char = self._peek()
+        self.pos += 1
+        return char
+
+    def _skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def _expect(self, literal):
+        for expected in literal:
+            if self._next() != expected:
+                raise StreamingParseError(f"Expected '{literal}'")
+
+    def parse(self):
+        value = self._parse_value(())
+        self._skip_whitespace()
+        if self.pos < len(self.buf):
+            raise StreamingParseError("Extra data after JSON document")
+        return value
+
+    def _parse_value(self, path):
+        self._skip_whitespace()
+        char = self._peek()
+        if char == '{':
+            return self._parse_object(path)
+        if char == '[':
+            return self._parse_array(path)
+        if char == '"':
+            self.pos += 1
+            sink = self.string_sink(path) if self.string_sink else None
+            if sink is None:
+                return self._parse_string()
+            try:
+                self._stream_string(sink.write)
+                return sink.close()
+            except BaseException:
+                sink.abort()
+                raise
+        if char == 't':
+            self._expect('true')
+            return True
+        if char == 'f':
+            self._expect('false')
+            return False
+        if char == 'n':
+            self._expect('null')
+            return None
+        if char in _NUMBER_CHARS:
+            return self._parse_number()
+        raise StreamingParseError(f"Unexpected character {char!r}")
+
+    def _check_depth(self, path):
+        if len(path) >= self.max_depth:
+            raise StreamingParseError(f"JSON is nested deeper than {self.max_depth} levels")
+
+    def _parse_object(self, path):
+        self._check_depth(path)
+        self.pos += 1
+        result = {}
+        self._skip_whitespace()
+        if self._peek() == '}':
+            self.pos += 1
+            return result
+        while True:
+            self._skip_whitespace()
+            if self._next() != '"':
+                raise StreamingParseError("Expected object key")
+            key = self._parse_string()
+            self._skip_whitespace()
+            if self._next() != ':':
+                raise StreamingParseError("Expected ':'")
+            result[key] = self._parse_value(path + (key,))
+            self._skip_whitespace()
+            char = self._next()
+            if char == '}':
+                return result
+            if char != ',':
+                raise StreamingParseError("Expected ',' or '}'")
+
+    def _parse_array(self, path):
+        self._check_depth(path)
+        self.pos += 1
+        result = []
+        self._skip_whitespace()
+        if self._peek() == ']':
+            self.pos += 1
+            return result
+        while True:
+            result.append(self._parse_value(path + (len(result),)))
+            self._skip_whitespace()
+            char = self._next()
+            if char == ']':
+                return result
+            if char != ',':
+                raise StreamingParseError("Expected ',' or ']'")
+
+    def _parse_number(self):
+        start = self.pos
+        token = ''
+        while True:
+            if self.pos >= len(self.buf):
+                token += self.buf[start:]
+                if not self._fill():
+                    break
+                start = self.pos
+                continue
+            if self.buf[self.pos] not in _NUMBER_CHARS:
+                token += self.buf[start:self.pos]
+                break
+            self.pos += 1
+        try:
+            return json.loads(token)
+        except ValueError:
+            raise StreamingParseError(f"Invalid number {token!r}")
+
+    def _parse_string(self):
+        parts = []
+        self._stream_string(parts.append)
+        return ''.join(parts)
+
+    def _stream_string(self, emit):
+        """Читает строку после открывающей кавычки, передавая части в emit"""
+        while True:
+            match = _STRING_SPECIAL.search(self.buf, self.pos)
+            if match is None:
+                if self.pos < len(self.buf):
+                    emit(self.buf[self.pos:])
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise StreamingParseError("Unterminated string")
+                continue
+
+            if match.start() > self.pos:
+                emit(self.buf[self.pos:match.start()])
+            self.pos = match.end()
+            if match.group() == '"':
+                return
+            emit(self._parse_escape())
+
+    def _parse_escape(self):
+        char = self._next()
+        if char in _ESCAPES:
+            return _ESCAPES[char]
+        if char != 'u':
+            raise StreamingParseError(f"Invalid escape '\\{char}'")
+        code = int(self._read_hex(), 16)
+        if 0xD800 <= code < 0xDC00:
+            self._expect('\\u')
+            low = int(self._read_hex(), 16)
+            if not 0xDC00 <= low < 0xE000:
+                raise StreamingParseError("Invalid surrogate pair")
+            code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+        return chr(code)
+
+    def _read_hex(self):
+        digits = ''.join(self._next() for _ in range(4))
+        try:
+            int(digits, 16)
+        except ValueError:
+            raise StreamingParseError(f"Invalid \\u escape {digits!r}")
+        return digits
+
+
+def _image_data_sink(path):
+    if len(path) == 3 and path[0] == 'images' and isinstance(path[1], int) and path[2] == 'data':
+        return Base64BlobSink(get_blob_store())
+    return None
+
+
+def parse_submit_stream(stream):
+    """
+    Разбирает тело submitData из потока.
+
+    Содержимое images[].data сохраняется в BlobStore и заменяется на StoredImage.
+    """
+    payload = JSONStreamParser(stream, string_sink=_image_data_sink).parse()
+    if not isinstance(payload, dict):
+        raise StreamingParseError("JSON object expected")
+    return payload
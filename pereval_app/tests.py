@@ -1,3 +1,1202 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import re
+import struct
+import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User as DjangoUser
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import geo
+from .async_processor import AsyncPerevalDataProcessor
+from .blob_store import BlobStore, get_blob_store, store_image
+from .bulk_io import (
+    CSV_FIELDS, PerevalImporter, RecordError, export_perevals, flatten_report, prepare_record, read_csv, read_ndjson,
+)
+from .data_processor import PerevalDataProcessor
+from .db_router import ReplicaSet, StickyPrimaryMiddleware, primary_pinned
+from .idempotency import CLAIMED, IN_PROGRESS, REPLAY, IdempotencyStore
+from .image_validation import ImageInfo, ImageValidationError, validate_image_base64
+from .ingest import DONE, FAILED, PROCESSING, QUEUED, IngestQueue, QueueFull
+from .metrics import Counter, Histogram, redact_payload
+from .models import Coords, Image, Level, Pereval, User
+from .pagination import KeysetPagination
+from .partitions import IMAGE_FOREIGN_KEY, MIN_SERVER_VERSION, PARTITIONED_TABLES, is_partitioned
+from .pg_driver import errors as pg_errors
+from .prepared import PreparedStatement, StatementRegistry, to_server_params
+from .repository import PerevalRepository, aware_datetime
+from .response_cache import ResponseCache, get_response_cache
+from .serializers import PerevalSerializer
+from .spatial_search import search_bbox, search_nearest
+from .streaming import JSONStreamParser, StreamingParseError
+from .thumbnails import DerivativeStore, PILImage
+from .views import parse_range
+
+# PNG 1x1
+PNG_BASE64 = 'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+
+NO_THUMBNAILS = {**settings.PEREVAL_THUMBNAILS, 'ENABLED': False}
+
+
+def make_report(title='Перевал', email='tourist@example.com'):
+    return {
+        'beauty_title': 'пер.',
+        'title': title,
+        'other_titles': '',
+        'connect': '',
+        'add_time': '2026-07-01 12:00:00',
+        'user': {'email': email, 'fam': 'Иванов', 'name': 'Иван', 'otc': 'Иванович', 'phone': '+79990000000'},
+        'coords': {'latitude': '45.384200', 'longitude': '7.152500', 'height': '1200'},
+        'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+        'images': [{'data': PNG_BASE64, 'title': 'Седловина'}],
+    }
+
+
+class TempBlobStoreMixin:
+    """Изображения пишутся во временный каталог, а не в MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        patcher = mock.patch('pereval_app.blob_store._store', BlobStore(media.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+def make_pereval(title='Перевал'):
+    user, _ = User.objects.get_or_create(email='owner@example.com', defaults={'fam': 'Ф', 'name': 'И', 'phone': '1'})
+    level, _ = Level.objects.get_or_create(winter='', summer='1А', autumn='', spring='')
+    coords = Coords.objects.create(latitude='45.000000', longitude='7.000000', height=1000)
+    return Pereval.objects.create(beauty_title='пер.', title=title, user=user, coords=coords, level=level)
+
+
+def png_header(width, height):
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', width, height) + b'\x08\x02\0\0\0'
+
+
+def jpeg_header(width, height, exif_bytes=0):
+    """JPEG с маркером SOF0 после блока APP1 заданного размера"""
+    app1 = b'\xff\xe1' + struct.pack('>H', exif_bytes + 2) + b'\0' * exif_bytes
+    sof = b'\xff\xc0' + struct.pack('>HBHH', 11, 8, height, width) + b'\x01\x11\0'
+    return b'\xff\xd8' + app1 + sof
+
+
+def b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+class ImageValidationTests(SimpleTestCase):
+    limits = {'MAX_BYTES': 10_000, 'MAX_PIXELS': 1_000_000, 'TYPES': ['image/jpeg', 'image/png']}
+
+    def validate(self, value):
+        return validate_image_base64(value, self.limits)
+
+    def test_png_header(self):
+        self.assertEqual(self.validate(PNG_BASE64), ImageInfo('image/png', len(base64.b64decode(PNG_BASE64)), 1, 1))
+        self.assertEqual(self.validate('data:image/png;base64,' + b64(png_header(640, 480))).width, 640)
+
+    def test_jpeg_size_after_long_exif(self):
+        # Маркер SOF дальше первого декодируемого блока заголовка
+        info = self.validate(b64(jpeg_header(800, 600, exif_bytes=2000)))
+        self.assertEqual((info.mime_type, info.width, info.height), ('image/jpeg', 800, 600))
+
+    def test_truncated_header(self):
+        for data in (png_header(640, 480)[:20], jpeg_header(800, 600, exif_bytes=2000)[:1000]):
+            with self.subTest(data=data[:4]), self.assertRaisesMessage(ImageValidationError, 'dimensions'):
+                self.validate(b64(data))
+
+    def test_corrupted_jpeg_header(self):
+        with self.assertRaisesMessage(ImageValidationError, 'Corrupted JPEG header'):
+            self.validate(b64(b'\xff\xd8\xff\xe0\x00\x04\x00\x00' + b'\x12' * 60))
+
+    def test_oversized_image(self):
+        with self.assertRaisesMessage(ImageValidationError, 'pixels'):
+            self.validate(b64(png_header(2000, 1000)))
+        with self.assertRaisesMessage(ImageValidationError, 'bytes'):
+            self.validate(b64(png_header(10, 10) + b'\0' * 10_000))
+        with self.assertRaisesMessage(ImageValidationError, 'Invalid image dimensions'):
+            self.validate(b64(png_header(0, 10)))
+
+    def test_invalid_base64(self):
+        for value in ('iVBO*w0K', 'iVBORw0', 'iV=BORw0', '=', 'ЖЖЖЖ'):
+            with self.subTest(value=value), self.assertRaisesMessage(ImageValidationError, 'Invalid base64'):
+                self.validate(value)
+
+    def test_unsupported_type(self):
+        with self.assertRaisesMessage(ImageValidationError, 'Unsupported image format'):
+            self.validate(b64(b'GIF89a' + struct.pack('<HH', 10, 10) + b'\0' * 10))
+
+
+class GeoTests(SimpleTestCase):
+    def test_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.encode(42.6, -5.6, 5), 'ezs42')
+        self.assertEqual(geo.encode(-90.0, -180.0, 3), '000')
+        self.assertEqual(geo.encode(90.0, 180.0, 3), 'zzz')
+
+    def test_cover_bbox_contains_every_point(self):
+        bbox = (45.1, 6.8, 45.6, 7.5)
+        cells = geo.cover_bbox(*bbox, max_cells=16)
+        self.assertTrue(0 < len(cells) <= 16)
+        self.assertEqual(len({len(cell) for cell in cells}), 1)
+        for lat in (45.1, 45.35, 45.6):
+            for lon in (6.8, 7.15, 7.5):
+                point = geo.encode(lat, lon)
+                self.assertTrue(any(point.startswith(cell) for cell in cells), (lat, lon))
+
+    def test_cover_bbox_too_large(self):
+        self.assertEqual(geo.cover_bbox(-90, -180, 90, 180, max_cells=16), [])
+
+    def test_bbox_around_antimeridian(self):
+        min_lat, min_lon, max_lat, max_lon = geo.bbox_around(0.0, 179.9, 50)
+        self.assertGreater(min_lon, max_lon)
+        boxes = geo.split_antimeridian(min_lat, min_lon, max_lat, max_lon)
+        self.assertEqual([(box[1], box[3]) for box in boxes], [(min_lon, 180.0), (-180.0, max_lon)])
+        # Круг у полюса охватывает все долготы
+        self.assertEqual(geo.bbox_around(89.9, 0.0, 50)[1::2], (-180.0, 180.0))
+
+    def test_haversine(self):
+        self.assertAlmostEqual(geo.haversine_km(45.0, 7.0, 46.0, 7.0), 111.195, places=2)
+        self.assertAlmostEqual(geo.haversine_km(0.0, 179.5, 0.0, -179.5), 111.195, places=2)
+
+
+class SpatialSearchTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(email='geo@example.com', fam='Ф', name='И', phone='1')
+        level = Level.objects.create(winter='', summer='1А', autumn='', spring='')
+        self.ids = {}
+        for title, lat, lon, height in (('Близкий', 45.01, 7.01, 1000), ('Дальний', 45.5, 7.5, 2500),
+                                         ('Чужой', -33.0, 151.0, 800), ('Восточный', 0.0, 179.95, 100),
+                                         ('Западный', 0.0, -179.95, 100)):
+            coords = Coords.objects.create(latitude=lat, longitude=lon, height=height)
+            pereval = Pereval.objects.create(beauty_title='пер.', title=title, user=user, coords=coords, level=level)
+            self.ids[title] = pereval.pk
+
+    def titles(self, rows):
+        return [row[4] for row in rows]
+
+    def test_bbox_and_height(self):
+        self.assertEqual(self.titles(search_bbox((44.9, 6.9, 45.6, 7.6))), ['Близкий', 'Дальний'])
+        self.assertEqual(self.titles(search_bbox((44.9, 6.9, 45.6, 7.6), min_height=2000)), ['Дальний'])
+        self.assertEqual(self.titles(search_bbox(max_height=100)), ['Восточный', 'Западный'])
+
+    def test_bbox_across_antimeridian(self):
+        self.assertEqual(self.titles(search_bbox((-1.0, 179.9, 1.0, -179.9))), ['Восточный', 'Западный'])
+
+    def test_nearest(self):
+        rows = search_nearest(45.0, 7.0, k=2)
+        self.assertEqual(self.titles(rows), ['Близкий', 'Дальний'])
+        self.assertAlmostEqual(rows[0][-1], geo.haversine_km(45.0, 7.0, 45.01, 7.01), places=2)
+        # Радиус растет до тех пор, пока не найдется k перевалов
+        self.assertEqual(self.titles(search_nearest(0.0, 179.99, k=2)), ['Восточный', 'Западный'])
+
+
+class FakeExecutor:
+    """Пул, задания которого завершаются по команде теста"""
+
+    def __init__(self, *args, broken=False, error=None, **kwargs):
+        self.broken = broken
+        self.error = error
+        self.futures = []
+        self.shut_down = False
+
+    def submit(self, func, *args):
+        if self.broken:
+            raise BrokenProcessPool("A child process terminated abruptly")
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+class DerivativeStoreTests(TempBlobStoreMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = DerivativeStore(directory.name, {'thumb': 200})
+        self.digest = store_image(PNG_BASE64).sha256
+
+    def executors(self, *executors):
+        return mock.patch('pereval_app.thumbnails.ProcessPoolExecutor', side_effect=executors)
+
+    def test_pool_broken_on_submit_is_replaced(self):
+        broken, fresh = FakeExecutor(broken=True), FakeExecutor()
+        with self.executors(broken, fresh):
+            future = self.store.schedule(self.digest, 'thumb')
+        self.assertTrue(broken.shut_down)
+        self.assertEqual(fresh.futures, [future])
+
+    def test_pool_broken_while_rendering_is_replaced(self):
+        first, second = FakeExecutor(), FakeExecutor()
+        with self.executors(first, second):
+            future = self.store.schedule(self.digest, 'thumb')
+            # Повторная постановка того же задания не создает второго
+            self.assertIs(self.store.schedule(self.digest, 'thumb'), future)
+            future.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+            self.assertTrue(first.shut_down)
+
+            retry = self.store.schedule(self.digest, 'thumb')
+        self.assertEqual(second.futures, [retry])
+        self.assertIsNot(retry, future)
+
+    def test_stale_failure_does_not_reset_new_pool(self):
+        first, second = FakeExecutor(), FakeExecutor()
+        with self.executors(first, second):
+            self.store.schedule(self.digest, 'thumb')
+            self.store._reset_executor(first)
+            self.store.schedule(self.digest, 'thumb')
+            # Запоздавшая ошибка задания старого пула
+            self.store._reset_executor(first)
+        self.assertFalse(second.shut_down)
+        self.assertIs(self.store._executor, second)
+
+    def test_failed_render_returns_none(self):
+        with self.executors(FakeExecutor(error=OSError("cannot identify image file"))):
+            self.assertIsNone(self.store.get(self.digest, 'thumb', timeout=0))
+        self.assertEqual(self.store._pending, {})
+
+    @skipUnless(PILImage, "Pillow is not installed")
+    def test_render_in_process_pool(self):
+        self.store.workers = 1
+        self.addCleanup(lambda: self.store._executor and self.store._executor.shutdown())
+        path = self.store.get(self.digest, 'thumb', timeout=60)
+        self.assertEqual(path, self.store.path(self.digest, 'thumb'))
+        with PILImage.open(path) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (1, 1)))
+
+
+# Строка значения в текстовом формате Prometheus: имя{метки} число
+SAMPLE_LINE = re.compile(
+    r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*"'
+    r'(,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*")*\})? (?P<value>\S+)$'
+)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_exposition(self):
+        histogram = Histogram('test_seconds', 'Test durations', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, stage='insert')
+        self.assertEqual(histogram.collect(), [
+            '# HELP test_seconds Test durations',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{stage="insert",le="0.1"} 2',
+            'test_seconds_bucket{stage="insert",le="1.0"} 3',
+            'test_seconds_bucket{stage="insert",le="+Inf"} 4',
+            'test_seconds_sum{stage="insert"} 2.65',
+            'test_seconds_count{stage="insert"} 4',
+        ])
+
+    def test_label_escaping(self):
+        counter = Counter('test_total', 'Test counter')
+        counter.inc(endpoint='a"b\\c\nd')
+        counter.inc(2, endpoint='a"b\\c\nd')
+        self.assertEqual(counter.collect()[-1], 'test_total{endpoint="a\\"b\\\\c\\nd"} 3')
+        self.assertRegex(counter.collect()[-1], SAMPLE_LINE)
+
+    def test_metrics_endpoint_format(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode('utf-8')
+        self.assertTrue(text.endswith('\n'))
+        declared = []
+        for line in text.splitlines():
+            if line.startswith('# TYPE '):
+                name = line.split()[2]
+                self.assertNotIn(name, declared)
+                declared.append(name)
+                continue
+            if line.startswith('# HELP '):
+                continue
+            match = SAMPLE_LINE.match(line)
+            self.assertIsNotNone(match, line)
+            float(match.group('value'))
+            self.assertTrue(any(match.group('name').startswith(name) for name in declared), line)
+        self.assertIn('pereval_submit_stage_seconds', declared)
+
+    def test_redact_payload(self):
+        text = redact_payload(make_report(), max_chars=10_000)
+        self.assertNotIn('tourist@example.com', text)
+        self.assertNotIn(PNG_BASE64, text)
+        self.assertIn("'email': '<19 chars>'", text)
+        self.assertTrue(redact_payload(make_report(), max_chars=20).endswith(' chars)'))
+
+
+class FakeConnection:
+    def __init__(self, autocommit=True):
+        self.autocommit = autocommit
+        self.statements = set()
+
+
+class FakeCursor:
+    """Курсор, который помнит подготовленные на соединении запросы, как сервер"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql.split(' (')[0])
+        words = sql.split()
+        if words[0] == 'PREPARE':
+            self.connection.statements.add(words[1])
+        elif words[0] == 'EXECUTE' and words[1] not in self.connection.statements:
+            raise pg_errors.InvalidSqlStatementName(f'prepared statement "{words[1]}" does not exist')
+
+
+class PreparedStatementTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = StatementRegistry()
+        self.registry.register('find', 'SELECT id FROM pereval WHERE id = %(id)s OR parent = %(id)s AND x = %(x)s',
+                               {'id': 'bigint'})
+
+    def test_server_params(self):
+        self.assertEqual(to_server_params('SELECT %(a)s, %(b)s, %(a)s, 5 %% 2'),
+                         ('SELECT $1, $2, $1, 5 % 2', ['a', 'b']))
+        self.assertEqual(to_server_params('SELECT %s, %s'), ('SELECT $1, $2', [0, 1]))
+
+    def test_statement_sql(self):
+        statement = PreparedStatement('levels', 'SELECT %s LIMIT %s', ['text', 'bigint'])
+        self.assertEqual(statement.prepare_sql, 'PREPARE levels (text, bigint) AS SELECT $1 LIMIT $2')
+        self.assertEqual(statement.execute_sql, 'EXECUTE levels (%s, %s)')
+        self.assertEqual(PreparedStatement('named', 'SELECT %(a)s', {'a': 'int'}).execute_sql,
+                         'EXECUTE named (%(a)s)')
+        with self.assertRaises(ValueError):
+            PreparedStatement('bad', 'SELECT %(a)s', {'b': 'int'})
+        with self.assertRaises(ValueError):
+            self.registry.register('find', 'SELECT 1')
+
+    def test_prepared_once_per_connection(self):
+        cursor = FakeCursor(FakeConnection())
+        for _ in range(2):
+            self.registry.execute(cursor, 'find', {'id': 1, 'x': 2})
+        self.assertEqual(cursor.executed, ['PREPARE find', 'EXECUTE find', 'EXECUTE find'])
+        self.registry.execute(FakeCursor(FakeConnection()), 'find', {'id': 1, 'x': 2})
+        stats = self.registry.stats()['find']
+        self.assertEqual((stats['prepares'], stats['executions']), (2, 3))
+
+    def test_invalidated_statement_is_prepared_again(self):
+        cursor = FakeCursor(FakeConnection())
+        self.registry.execute(cursor, 'find', {'id': 1, 'x': 2})
+        cursor.connection.statements.clear()  # DISCARD ALL
+        self.registry.execute(cursor, 'find', {'id': 1, 'x': 2})
+        self.assertEqual(cursor.executed, ['PREPARE find', 'EXECUTE find', 'EXECUTE find', 'PREPARE find',
+                                           'EXECUTE find'])
+
+    def test_invalidated_statement_in_transaction(self):
+        cursor = FakeCursor(FakeConnection(autocommit=False))
+        self.registry.execute(cursor, 'find', {'id': 1, 'x': 2})
+        cursor.connection.statements.clear()
+        # Транзакция уже прервана ошибкой: повтор невозможен, но запрос забыт
+        with self.assertRaises(pg_errors.InvalidSqlStatementName):
+            self.registry.execute(cursor, 'find', {'id': 1, 'x': 2})
+        self.registry.execute(cursor, 'find', {'id': 1, 'x': 2})
+        self.assertEqual(cursor.executed[-2:], ['PREPARE find', 'EXECUTE find'])
+
+    @override_settings(PEREVAL_PREPARED_STATEMENTS=False)
+    def test_disabled(self):
+        cursor = FakeCursor(FakeConnection())
+        self.registry.execute(cursor, 'find', {'id': 1, 'x': 2})
+        self.assertEqual(cursor.executed, ['SELECT id FROM pereval WHERE id = %(id)s OR parent = %(id)s AND x = %(x)s'])
+        self.assertEqual(self.registry.stats()['find']['executions'], 1)
+
+
+class BlobStoreTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.store = BlobStore(root.name)
+
+    def test_same_content_is_stored_once(self):
+        data = base64.b64decode(PNG_BASE64)
+        digest, size = self.store.put(data)
+        self.assertEqual((digest, size), (hashlib.sha256(data).hexdigest(), len(data)))
+        self.assertEqual(self.store.put_stream([data[:10], data[10:]]), (digest, size))
+        self.assertEqual(self.store.path(digest).relative_to(self.store.root).parts, (digest[:2], digest[2:4], digest))
+        self.assertEqual(self.store.read(digest), data)
+        blobs = [path for path in Path(self.store.root).rglob('*') if path.is_file()]
+        self.assertEqual(blobs, [self.store.path(digest)])
+
+    def test_aborted_writer_leaves_no_files(self):
+        writer = self.store.writer()
+        writer.write(b'partial')
+        writer.abort()
+        self.assertEqual([path for path in Path(self.store.root).rglob('*') if path.is_file()], [])
+
+    def test_store_image_decodes_data_uri(self):
+        with mock.patch('pereval_app.blob_store._store', self.store):
+            stored = store_image('data:image/png;base64,' + PNG_BASE64)
+            self.assertEqual(stored.mime_type, 'image/png')
+            self.assertEqual(store_image(stored), stored)
+            with self.assertRaises(ValueError):
+                store_image('data:image/png;base64,@@@')
+
+
+class MigrateImageBlobsTests(TempBlobStoreMixin, TestCase):
+    def test_moves_base64_into_store(self):
+        pereval = make_pereval()
+        first = Image.objects.create(pereval=pereval, title='1', data=PNG_BASE64)
+        second = Image.objects.create(pereval=pereval, title='2', data='data:image/png;base64,' + PNG_BASE64)
+        broken = Image.objects.create(pereval=pereval, title='3', data='@@@')
+
+        call_command('migrate_image_blobs', batch_size=1, stdout=io.StringIO(), stderr=io.StringIO())
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        broken.refresh_from_db()
+        data = base64.b64decode(PNG_BASE64)
+        self.assertEqual((first.sha256, first.size, first.mime_type, first.data),
+                         (hashlib.sha256(data).hexdigest(), len(data), 'image/png', None))
+        self.assertEqual(second.sha256, first.sha256)
+        self.assertEqual(get_blob_store().read(first.sha256), data)
+        self.assertEqual((broken.sha256, broken.data), ('', '@@@'))
+
+
+class CollectingSink:
+    def __init__(self):
+        self.parts = []
+        self.aborted = False
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def close(self):
+        return ''.join(self.parts).upper()
+
+    def abort(self):
+        self.aborted = True
+
+
+class JSONStreamParserTests(SimpleTestCase):
+    DOCUMENT = {
+        'title': 'Перевал "Дятлова"\n\t\\ / \U0001F3D4',
+        'numbers': [0, -1, 2.5, 1e3, -0.25e-2],
+        'flags': [True, False, None],
+        'nested': {'empty': {}, 'list': [], 'deep': [[{'a': 'б'}]]},
+    }
+
+    def parse(self, text, read_size=1, **kwargs):
+        return JSONStreamParser(io.BytesIO(text.encode('utf-8')), read_size=read_size, **kwargs).parse()
+
+    def test_matches_json_loads_for_any_block_size(self):
+        for text in (json.dumps(self.DOCUMENT), json.dumps(self.DOCUMENT, ensure_ascii=False, indent=2)):
+            for read_size in (1, 2, 3, 7, 64 * 1024):
+                with self.subTest(read_size=read_size, ascii=text.isascii()):
+                    self.assertEqual(self.parse(text, read_size), self.DOCUMENT)
+
+    def test_string_sink_receives_value_by_path(self):
+        sinks = {}
+
+        def string_sink(path):
+            if path == ('images', 0, 'data'):
+                return sinks.setdefault(path, CollectingSink())
+            return None
+
+        result = self.parse('{"images": [{"data": "abc\\u0064ef", "title": "t"}]}', string_sink=string_sink)
+        self.assertEqual(result, {'images': [{'data': 'ABCDEF', 'title': 't'}]})
+        self.assertGreater(len(sinks[('images', 0, 'data')].parts), 1)
+
+    def test_string_sink_is_aborted_on_error(self):
+        sink = CollectingSink()
+        with self.assertRaises(StreamingParseError):
+            self.parse('{"data": "abc', string_sink=lambda path: sink)
+        self.assertTrue(sink.aborted)
+
+    def test_invalid_documents(self):
+        for text in ('', '{', '{"a" 1}', '[1,]', '{"a": tru}', '"\\x"', '{} []', '\xff', '[1 2]'):
+            with self.subTest(text=text):
+                with self.assertRaises(StreamingParseError):
+                    self.parse(text)
+
+    def test_surrogate_pairs(self):
+        self.assertEqual(self.parse('"\\ud83c\\udfd4"'), '\U0001F3D4')
+        for text in ('"\\ud800\\u0041"', '"\\ud800\\ud800"', '"\\ud800x"'):
+            with self.subTest(text=text):
+                with self.assertRaises(StreamingParseError):
+                    self.parse(text)
+
+    def test_nesting_depth_is_limited(self):
+        self.assertEqual(self.parse('[' * 3 + ']' * 3, max_depth=3), [[[]]])
+        for text in ('[' * 4 + ']' * 4, '{"a": {"b": {"c": {}}}}'):
+            with self.subTest(text=text):
+                with self.assertRaises(StreamingParseError):
+                    self.parse(text, max_depth=3)
+        with self.assertRaises(StreamingParseError):
+            self.parse('[' * 100_000, read_size=64 * 1024)
+
+    def test_invalid_utf8(self):
+        with self.assertRaises(StreamingParseError):
+            JSONStreamParser(io.BytesIO(b'["\xff"]')).parse()
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = [
+            (None, 10, None),
+            ('', 10, None),
+            ('items=0-1', 10, None),
+            ('bytes=0-1,3-4', 10, None),
+            ('bytes=abc', 10, None),
+            ('bytes=x-1', 10, None),
+            ('bytes=5-2', 10, None),
+            ('bytes=0-', 10, (0, 9)),
+            ('bytes=2-4', 10, (2, 4)),
+            ('bytes=2-100', 10, (2, 9)),
+            ('bytes=-3', 10, (7, 9)),
+            ('bytes=-100', 10, (0, 9)),
+            ('bytes=-0', 10, 'unsatisfiable'),
+            ('bytes=10-', 10, 'unsatisfiable'),
+            ('bytes=0-', 0, 'unsatisfiable'),
+            ('bytes=-5', 0, 'unsatisfiable'),
+        ]
+        for header, length, expected in cases:
+            with self.subTest(header=header, length=length):
+                self.assertEqual(parse_range(header, length), expected)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(email='pager@example.com', fam='Ф', name='И', phone='1')
+        level = Level.objects.create(summer='1А')
+        base = timezone.now()
+        # Несколько записей с одинаковым add_time проверяют второе поле ключа
+        times = [base, base, base, base - timedelta(hours=1), base - timedelta(hours=2), base - timedelta(hours=2),
+                 base - timedelta(days=1)]
+        for index, add_time in enumerate(times):
+            coords = Coords.objects.create(latitude='45.000000', longitude='7.000000', height=1000 + index)
+            Pereval.objects.create(beauty_title='пер.', title=f'Перевал {index}', add_time=add_time,
+                                   user=user, coords=coords, level=level)
+
+    def paginate(self, query=''):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get(f'/api/submitData/{query}'))
+        page = paginator.paginate_queryset(Pereval.objects.all(), request)
+        return paginator, [pereval.id for pereval in page]
+
+    def test_pages_cover_all_records_in_order(self):
+        expected = list(Pereval.objects.order_by('-add_time', '-id').values_list('id', flat=True))
+        seen = []
+        paginator, ids = self.paginate('?limit=2')
+        seen.extend(ids)
+        while paginator.next_cursor:
+            self.assertLessEqual(len(ids), 2)
+            paginator, ids = self.paginate(f'?limit=2&cursor={paginator.next_cursor}')
+            seen.extend(ids)
+        self.assertEqual(seen, expected)
+
+    def test_next_link_only_when_more_records(self):
+        paginator, ids = self.paginate('?limit=100')
+        self.assertEqual(len(ids), Pereval.objects.count())
+        self.assertIsNone(paginator.get_next_link())
+        paginator, _ = self.paginate('?limit=3')
+        self.assertIn('cursor=', paginator.get_next_link())
+
+    def test_page_size_is_clamped(self):
+        paginator = KeysetPagination()
+        factory = APIRequestFactory()
+        for query, size in (('?limit=0', 1), ('?limit=1000', paginator.max_page_size), ('?limit=x', 20)):
+            with self.subTest(query=query):
+                self.assertEqual(paginator.get_page_size(Request(factory.get(f'/{query}'))), size)
+
+    def test_invalid_cursor(self):
+        for cursor in ('!!!', 'WyJ4IiwgMV0=', 'WyIyMDI2LTAxLTAxVDAwOjAwOjAwKzAwOjAwIiwgIjEiXQ=='):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(NotFound):
+                    self.paginate(f'?cursor={cursor}')
+
+
+class SubmitBulkTests(SimpleTestCase):
+    def post(self, body, content_type):
+        return APIClient().post('/api/submitData/bulk/', body, content_type=content_type)
+
+    def test_malformed_json_array(self):
+        response = self.post('[{"title": ', 'application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['results'], [])
+
+    @override_settings(PEREVAL_BULK={**settings.PEREVAL_BULK, 'MAX_REPORTS': 2})
+    def test_reports_over_limit_are_not_read(self):
+        body = '{}\n' * 2 + '{}\n' * 1000
+        with mock.patch('pereval_app.views.json.loads', wraps=json.loads) as loads:
+            response = self.post(body, 'application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, [400, 400, 413])
+        self.assertEqual(loads.call_count, 3)
+
+
+def make_record(**fields):
+    record = flatten_report(make_report())
+    record.update(fields)
+    return record
+
+
+class PrepareRecordTests(TempBlobStoreMixin, SimpleTestCase):
+    def test_valid_record(self):
+        row, images = prepare_record(make_record())
+        self.assertEqual(row[0], 'tourist@example.com')
+        self.assertEqual(row[-2:], ['2026-07-01T12:00:00+00:00', 'new'])
+        self.assertEqual([(title, stored.mime_type) for title, stored in images], [('Седловина', 'image/png')])
+
+    def test_invalid_records(self):
+        cases = [
+            make_record(email=''),
+            make_record(latitude='north'),
+            make_record(latitude='91'),
+            make_record(add_time='yesterday'),
+            make_record(status='x' * 300),
+            make_record(status='archived'),
+            make_record(title='x' * 256),
+            make_record(images={'data': PNG_BASE64}),
+            make_record(images=[{'data': '@@@'}]),
+            make_record(images=[{'sha256': '../../../etc/passwd'}]),
+            make_record(images=[{'title': 'без данных'}]),
+        ]
+        for record in cases:
+            with self.subTest(record={key: str(value)[:20] for key, value in record.items()}):
+                with self.assertRaises(RecordError):
+                    prepare_record(record)
+
+    def test_stored_image_takes_size_and_type_from_blob(self):
+        stored = store_image(PNG_BASE64)
+        _, images = prepare_record(make_record(images=[{'sha256': stored.sha256, 'size': 1, 'mime_type': 'text/html'}]))
+        self.assertEqual(images[0][1], stored)
+
+    def test_readers_report_bad_lines(self):
+        lines = [json.dumps(make_report()), '{broken', '[]', '']
+        records = list(read_ndjson(io.StringIO('\n'.join(lines))))
+        self.assertEqual([line_no for line_no, _ in records], [1, 2, 3])
+        self.assertIsInstance(records[0][1], dict)
+        self.assertIsInstance(records[1][1], RecordError)
+        self.assertIsInstance(records[2][1], RecordError)
+
+        csv_text = ','.join(CSV_FIELDS) + '\n' + ','.join('' for _ in CSV_FIELDS[:-1]) + ',[oops\n'
+        [(_, record)] = read_csv(io.StringIO(csv_text))
+        self.assertIsInstance(record, RecordError)
+
+
+@skipUnless(connection.vendor == 'postgresql', "COPY requires PostgreSQL")
+@override_settings(PEREVAL_THUMBNAILS=NO_THUMBNAILS)
+class ImportExportRoundTripTests(TempBlobStoreMixin, TransactionTestCase):
+    def test_export_then_import(self):
+        reports = [{**make_report(title=f'Перевал {index}'), 'status': 'accepted'} for index in range(3)]
+        source = io.StringIO(''.join(json.dumps(report, ensure_ascii=False) + '\n' for report in reports))
+        rejected = []
+        self.assertEqual(PerevalImporter(batch_size=2, reject=lambda *args: rejected.append(args)).run(
+            read_ndjson(source)), (3, 0))
+        self.assertEqual(rejected, [])
+
+        exported = io.StringIO()
+        self.assertEqual(export_perevals(exported, images='data'), 3)
+        Pereval.objects.all().delete()
+        exported.seek(0)
+        self.assertEqual(PerevalImporter().run(read_ndjson(exported)), (3, 0))
+
+        perevals = Pereval.objects.order_by('title')
+        self.assertEqual([pereval.title for pereval in perevals], [report['title'] for report in reports])
+        self.assertEqual({pereval.status for pereval in perevals}, {'accepted'})
+        images = Image.objects.all()
+        self.assertEqual(len(images), 3)
+        self.assertEqual(len({image.sha256 for image in images}), 1)
+        self.assertTrue(all(image.pereval_add_time == image.pereval.add_time for image in images))
+
+        csv_out = io.StringIO()
+        self.assertEqual(export_perevals(csv_out, fmt='csv'), 3)
+        csv_out.seek(0)
+        records = list(read_csv(csv_out))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(prepare_record(records[0][1])[0][0], 'tourist@example.com')
+
+
+def fake_async_pool():
+    """Пул, чьи соединения и курсоры - синхронные MagicMock внутри async with"""
+    pool = mock.MagicMock()
+    pool.connection.return_value.__aenter__.return_value = mock.MagicMock()
+    return pool
+
+
+class AsyncSubmitTests(TempBlobStoreMixin, SimpleTestCase):
+    def test_renditions_scheduled_after_insert(self):
+        processor = AsyncPerevalDataProcessor()
+        with mock.patch('pereval_app.async_processor.get_async_pool', mock.AsyncMock(return_value=fake_async_pool())), \
+                mock.patch.object(processor, '_execute_submit', mock.AsyncMock(return_value=7)), \
+                mock.patch('pereval_app.async_processor.schedule_renditions') as schedule:
+            result = asyncio.run(processor.submit_data(make_report()))
+        self.assertEqual(result['id'], 7)
+        digest = hashlib.sha256(base64.b64decode(PNG_BASE64)).hexdigest()
+        schedule.assert_called_once_with([digest])
+
+    def test_failed_insert_schedules_nothing(self):
+        processor = AsyncPerevalDataProcessor()
+        failing = mock.AsyncMock(side_effect=RuntimeError('db down'))
+        with mock.patch('pereval_app.async_processor.get_async_pool', mock.AsyncMock(return_value=fake_async_pool())), \
+                mock.patch.object(processor, '_execute_submit', failing), \
+                mock.patch('pereval_app.async_processor.schedule_renditions') as schedule:
+            result = asyncio.run(processor.submit_data(make_report()))
+        self.assertEqual(result['status'], 500)
+        schedule.assert_not_called()
+
+
+class IngestQueueTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.queue = IngestQueue(Path(directory.name) / 'queue.sqlite3', max_depth=3, max_attempts=2)
+
+    def state(self, tracking_id):
+        return self.queue.status(tracking_id)['state']
+
+    def test_claim_and_complete(self):
+        tracking_id = self.queue.enqueue({'title': 'Перевал'})
+        lease, items = self.queue.claim(10)
+        self.assertEqual([params for _, params in items], [{'title': 'Перевал', 'submission_key': tracking_id}])
+        self.assertEqual(self.state(tracking_id), PROCESSING)
+        self.assertEqual(self.queue.claim(10)[1], [])
+
+        self.queue.complete(lease, [(items[0][0], {'status': 200, 'id': 42})])
+        info = self.queue.status(tracking_id)
+        self.assertEqual((info['state'], info['id']), (DONE, 42))
+        self.assertEqual(self.queue.stats()['depth'], 0)
+
+    def test_server_error_is_retried_until_attempts_run_out(self):
+        tracking_id = self.queue.enqueue({})
+        for expected in (QUEUED, FAILED):
+            lease, items = self.queue.claim(10)
+            self.queue.complete(lease, [(items[0][0], {'status': 500, 'message': 'db down'})])
+            self.assertEqual(self.state(tracking_id), expected)
+
+    def test_client_error_is_final(self):
+        tracking_id = self.queue.enqueue({})
+        lease, items = self.queue.claim(10)
+        self.queue.complete(lease, [(items[0][0], {'status': 400, 'message': 'bad'})])
+        self.assertEqual(self.state(tracking_id), FAILED)
+
+    def test_expired_lease_is_reclaimed_and_stale_result_dropped(self):
+        tracking_id = self.queue.enqueue({})
+        self.queue.lease_seconds = -1
+        stale_lease, items = self.queue.claim(10)
+        lease, reclaimed = self.queue.claim(10)
+        self.assertEqual([row_id for row_id, _ in reclaimed], [items[0][0]])
+
+        self.queue.complete(stale_lease, [(items[0][0], {'status': 200, 'id': 1})])
+        self.assertEqual(self.state(tracking_id), PROCESSING)
+        self.queue.complete(lease, [(items[0][0], {'status': 200, 'id': 2})])
+        self.assertEqual(self.queue.status(tracking_id)['id'], 2)
+
+    def test_full_queue(self):
+        for _ in range(3):
+            self.queue.enqueue({})
+        with self.assertRaises(QueueFull):
+            self.queue.enqueue({})
+
+
+class IngestViewTests(TempBlobStoreMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'queue.sqlite3'
+        patcher = mock.patch('pereval_app.ingest._queue', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ingest(self, enabled):
+        return override_settings(PEREVAL_INGEST={'ENABLED': enabled, 'PATH': self.path})
+
+    def test_submit_is_accepted_into_queue(self):
+        client = APIClient()
+        with self.ingest(True):
+            response = client.post('/api/submitData/', make_report(), format='json')
+            self.assertEqual(response.status_code, 202)
+            tracking_id = response.json()['tracking_id']
+            self.assertEqual(response['Location'], f'/api/submitData/status/{tracking_id}/')
+
+            status_response = client.get(response['Location'])
+            self.assertEqual(status_response.json()['state'], QUEUED)
+            self.assertEqual(client.get('/api/ingest/stats/').json()['depth'], 1)
+
+    def test_disabled_ingest_does_not_create_queue(self):
+        client = APIClient()
+        with self.ingest(False):
+            self.assertEqual(client.get('/api/ingest/stats/').status_code, 404)
+            self.assertEqual(client.get('/api/submitData/status/abc/').status_code, 404)
+        self.assertFalse(self.path.exists())
+
+
+SHARED_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('pereval_app.response_cache._cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_invalidation_hides_entries_stored_under_old_generation(self):
+        cache = ResponseCache(1024)
+        _, generation = cache.lookup(1, 'full')
+        cache.invalidate(1)
+        # Ответ, прочитанный из БД до инвалидации, никому не выдается
+        cache.store(1, 'full', generation, b'old')
+        self.assertIsNone(cache.lookup(1, 'full')[0])
+
+        _, generation = cache.lookup(1, 'full')
+        cache.store(1, 'full', generation, b'new')
+        self.assertEqual(cache.lookup(1, 'full')[0].body, b'new')
+
+    def test_invalidation_is_seen_by_other_process_through_backend(self):
+        # Два экземпляра с одним backend - как два воркера с общим кэшем
+        first, second = ResponseCache(1024, 'shared'), ResponseCache(1024, 'shared')
+        _, generation = first.lookup(1, 'full')
+        first.store(1, 'full', generation, b'body')
+        self.assertEqual(second.lookup(1, 'full')[0].body, b'body')
+
+        second.invalidate(1)
+        self.assertIsNone(first.lookup(1, 'full')[0])
+
+    def test_disabled_without_shared_backend(self):
+        for options in ({}, {'BACKEND': 'shared'}):
+            with self.subTest(options=options), override_settings(PEREVAL_RESPONSE_CACHE=options), \
+                    mock.patch('pereval_app.response_cache._cache', None):
+                cache = get_response_cache()
+                self.assertFalse(cache.enabled)
+                cache.store(1, 'full', 0, b'body')
+                self.assertEqual(cache.lookup(1, 'full'), (None, 0))
+
+    def test_enabled_explicitly(self):
+        with override_settings(PEREVAL_RESPONSE_CACHE={'ENABLED': True}):
+            self.assertTrue(get_response_cache().enabled)
+
+
+class PerevalDetailCacheTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('pereval_app.response_cache._cache', ResponseCache(1024 * 1024))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pereval = make_pereval('Первый')
+        self.url = f'/api/submitData/{self.pereval.pk}/'
+
+    def test_etag_and_not_modified(self):
+        client = APIClient()
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_update_invalidates_cached_response(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+        self.pereval.title = 'Второй'
+        self.pereval.save()
+
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['title'], 'Второй')
+
+
+@skipUnless(connection.vendor == 'postgresql', "Partitioning requires PostgreSQL")
+class PartitionMigrationTests(TransactionTestCase):
+    def setUp(self):
+        if connection.pg_version < MIN_SERVER_VERSION:
+            self.skipTest("Partitioning requires PostgreSQL 15 or newer")
+        self.addCleanup(call_command, 'migrate', 'pereval_app', verbosity=0)
+
+    def partitioned(self):
+        with connection.cursor() as cursor:
+            return {table: is_partitioned(cursor, table) for table in PARTITIONED_TABLES}
+
+    def test_migrate_backward_and_forward(self):
+        pereval = make_pereval()
+        image = Image.objects.create(pereval=pereval, pereval_add_time=pereval.add_time, title='Фото', sha256='0' * 64)
+        self.assertEqual(self.partitioned(), {'pereval': True, 'pereval_image': True})
+
+        # convert_to_plain: строки и ссылки изображений сохраняются
+        call_command('migrate', 'pereval_app', '0009', verbosity=0)
+        self.assertEqual(self.partitioned(), {'pereval': False, 'pereval_image': False})
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pereval_id FROM pereval_image WHERE id = %s", [image.pk])
+            self.assertEqual(cursor.fetchone(), (pereval.pk,))
+
+        # convert_to_partitioned: pereval_add_time заполняется заново, составной ключ на месте
+        call_command('migrate', 'pereval_app', verbosity=0)
+        self.assertEqual(self.partitioned(), {'pereval': True, 'pereval_image': True})
+        self.assertEqual(Image.objects.get(pk=image.pk).pereval_add_time, pereval.add_time)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_constraint WHERE conname = %s", [IMAGE_FOREIGN_KEY])
+            self.assertEqual(cursor.fetchone()[0], 1)
+        # Последовательность продолжает нумерацию старой таблицы
+        self.assertGreater(make_pereval('Второй').pk, pereval.pk)
+
+
+@override_settings(PEREVAL_THUMBNAILS=NO_THUMBNAILS)
+class ConcurrentSubmitTests(TempBlobStoreMixin, TransactionTestCase):
+    """Первые отправки нового пользователя с новым уровнем, пришедшие одновременно"""
+
+    THREADS = 8
+
+    def test_parallel_first_submits_share_user_and_level(self):
+        reports = []
+        for index in range(self.THREADS):
+            serializer = PerevalSerializer(data=make_report(title=f'Перевал {index}', email='first@example.com'))
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            reports.append(serializer.validated_data)
+
+        barrier = threading.Barrier(self.THREADS)
+        results = [None] * self.THREADS
+
+        def submit(index):
+            try:
+                barrier.wait()
+                results[index] = PerevalDataProcessor().submit_data(reports[index])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=submit, args=(index,)) for index in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([result['status'] for result in results], [200] * self.THREADS)
+        self.assertEqual(len({result['id'] for result in results}), self.THREADS)
+        self.assertEqual(User.objects.filter(email='first@example.com').count(), 1)
+        self.assertEqual(Level.objects.filter(winter='', summer='1А', autumn='1А', spring='').count(), 1)
+        self.assertEqual(Pereval.objects.count(), self.THREADS)
+
+
+@override_settings(PEREVAL_THUMBNAILS=NO_THUMBNAILS)
+class IdempotencyTests(TempBlobStoreMixin, TransactionTestCase):
+    def post(self, report, key):
+        return APIClient().post('/api/submitData/', report, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_saved_response(self):
+        first = self.post(make_report(), 'replay-key')
+        second = self.post(make_report(), 'replay-key')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Pereval.objects.count(), 1)
+
+    def test_other_body_with_same_key(self):
+        self.post(make_report(), 'mismatch-key')
+        response = self.post(make_report(title='Другой'), 'mismatch-key')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Pereval.objects.count(), 1)
+
+    def test_in_progress_claim_returns_409(self):
+        report = make_report()
+        with mock.patch('pereval_app.views.request_fingerprint', return_value='a' * 64):
+            IdempotencyStore().claim('busy-key', 'a' * 64)
+            response = self.post(report, 'busy-key')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Pereval.objects.count(), 0)
+
+    def test_expired_lock_is_claimed_again(self):
+        store = IdempotencyStore(lock_seconds=0)
+        crashed = store.claim('crashed-key', 'a' * 64)
+        self.assertEqual(crashed.state, CLAIMED)
+        retry = store.claim('crashed-key', 'a' * 64)
+        self.assertEqual(retry.state, CLAIMED)
+
+        # Ответ упавшего обработчика больше не сохраняется
+        store.complete('crashed-key', 'a' * 64, crashed.lease, 500, {'status': 500})
+        store.complete('crashed-key', 'a' * 64, retry.lease, 200, {'status': 200})
+        claim = IdempotencyStore().claim('crashed-key', 'a' * 64)
+        self.assertEqual((claim.state, claim.status_code, claim.response), (REPLAY, 200, {'status': 200}))
+
+    def test_live_lock_blocks_claim(self):
+        store = IdempotencyStore()
+        self.assertEqual(store.claim('live-key', 'a' * 64).state, CLAIMED)
+        self.assertEqual(store.claim('live-key', 'a' * 64).state, IN_PROGRESS)
+
+
+class PerevalRepositoryTests(TempBlobStoreMixin, TestCase):
+    def params(self, title, email='tourist@example.com', submission_key=None):
+        report = make_report(title, email)
+        params = PerevalDataProcessor()._submit_params(report, report['user'])
+        return {**params, 'submission_key': submission_key}
+
+    def test_aware_datetime(self):
+        moment = aware_datetime('2026-07-01 12:00:00')
+        self.assertTrue(timezone.is_aware(moment))
+        self.assertEqual(moment, timezone.make_aware(datetime(2026, 7, 1, 12)))
+        self.assertEqual(aware_datetime('2026-07-01T12:00:00+00:00').utcoffset(), timedelta(0))
+        before = timezone.now()
+        self.assertGreaterEqual(aware_datetime(None), before)
+
+    def test_create_batch_shares_users_and_levels(self):
+        batch = [self.params('Первый'), self.params('Второй'), self.params('Третий', email='other@example.com')]
+        ids = PerevalRepository().create_batch(batch)
+        self.assertEqual([Pereval.objects.get(pk=pk).title for pk in ids], ['Первый', 'Второй', 'Третий'])
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Level.objects.count(), 1)
+        image = Image.objects.get(pereval_id=ids[0])
+        self.assertEqual(image.pereval_add_time, Pereval.objects.get(pk=ids[0]).add_time)
+
+    def test_create_batch_skips_submitted_keys(self):
+        key = '6f1c2f4e-8a4b-4c55-9f7e-1b2d3c4e5f60'
+        repository = PerevalRepository()
+        [first_id] = repository.create_batch([self.params('Первый', submission_key=key)])
+        ids = repository.create_batch([self.params('Новый'), self.params('Первый', submission_key=key)])
+        self.assertEqual(ids[1], first_id)
+        self.assertEqual(Pereval.objects.get(pk=ids[0]).title, 'Новый')
+        self.assertEqual(Pereval.objects.count(), 2)
+
+    def test_get_loads_images_with_one_extra_query(self):
+        [pereval_id] = PerevalRepository().create_batch([self.params('Первый')])
+        repository = PerevalRepository()
+        with self.assertNumQueries(2):
+            pereval = repository.get(pereval_id)
+            images = list(pereval.images.all())
+            self.assertEqual((pereval.user.email, pereval.level.summer), ('tourist@example.com', '1А'))
+        self.assertEqual(images[0].get_deferred_fields(), {'data', 'sha256', 'pereval_add_time'})
+        self.assertIsNone(repository.get(pereval_id + 1000))
+        self.assertEqual(repository.image_source(images[0].pk)['mime_type'], 'image/png')
+        self.assertEqual(repository.legacy_image_data([images[0].pk]), {images[0].pk: None})
+
+
+class PerevalListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        level = Level.objects.create(summer='1А')
+        for email in ('first@example.com', 'second@example.com'):
+            user = User.objects.create(email=email, fam='Ф', name='И', phone='1')
+            coords = Coords.objects.create(latitude='45.000000', longitude='7.000000', height=1000)
+            Pereval.objects.create(beauty_title='пер.', title=email, user=user, coords=coords, level=level)
+        cls.staff = DjangoUser.objects.create(username='moderator', is_staff=True)
+
+    def test_email_filter_is_required(self):
+        response = APIClient().get('/api/submitData/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_by_email(self):
+        response = APIClient().get('/api/submitData/', {'user__email': 'first@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['user']['email'] for item in response.json()['results']], ['first@example.com'])
+
+    def test_staff_lists_all(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        response = client.get('/api/submitData/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class ModerationPermissionTests(TestCase):
+    def test_anonymous_cannot_moderate(self):
+        client = APIClient()
+        with mock.patch.object(PerevalDataProcessor, 'claim_for_moderation') as claim, \
+                mock.patch.object(PerevalDataProcessor, 'set_moderation_status') as set_status:
+            self.assertEqual(client.post('/api/moderation/claim/', {'limit': 1}, format='json').status_code, 403)
+            self.assertEqual(client.post('/api/moderation/1/', {'status': 'accepted'}, format='json').status_code, 403)
+        claim.assert_not_called()
+        set_status.assert_not_called()
+
+    def test_staff_can_moderate(self):
+        client = APIClient()
+        client.force_authenticate(DjangoUser.objects.create(username='moderator', is_staff=True))
+        with mock.patch.object(PerevalDataProcessor, 'claim_for_moderation', return_value=[]), \
+                mock.patch.object(PerevalDataProcessor, 'set_moderation_status', return_value=True):
+            self.assertEqual(client.post('/api/moderation/claim/', {'limit': 1}, format='json').status_code, 200)
+            self.assertEqual(client.post('/api/moderation/1/', {'status': 'accepted'}, format='json').status_code, 200)
+
+
+class StickyPrimaryMiddlewareTests(SimpleTestCase):
+    def run_middleware(self, request, view_status=200):
+        pinned = []
+
+        def get_response(request):
+            pinned.append(primary_pinned())
+            return HttpResponse(status=view_status)
+
+        response = StickyPrimaryMiddleware(get_response)(request)
+        return pinned[0], response
+
+    def test_write_pins_and_sets_signed_cookie(self):
+        factory = RequestFactory()
+        pinned, response = self.run_middleware(factory.post('/api/submitData/'))
+        self.assertTrue(pinned)
+        cookie = response.cookies['pereval_primary'].value
+
+        request = factory.get('/api/submitData/1/')
+        request.COOKIES['pereval_primary'] = cookie
+        self.assertTrue(self.run_middleware(request)[0])
+        self.assertFalse(self.run_middleware(factory.get('/api/submitData/1/'))[0])
+
+    def test_failed_write_sets_no_cookie(self):
+        _, response = self.run_middleware(RequestFactory().post('/api/submitData/'), view_status=400)
+        self.assertNotIn('pereval_primary', response.cookies)
+
+    def test_unsigned_cookie_is_ignored(self):
+        request = RequestFactory().get('/api/submitData/1/')
+        request.COOKIES['pereval_primary'] = '99999999999'
+        self.assertFalse(self.run_middleware(request)[0])
+
+    def test_async_stack(self):
+        async def get_response(request):
+            return HttpResponse(str(primary_pinned()))
+
+        middleware = StickyPrimaryMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = asyncio.run(middleware(RequestFactory().post('/api/submitData/')))
+        self.assertEqual(response.content, b'True')
+        self.assertIn('pereval_primary', response.cookies)
+
+
+class ReplicaSetTests(SimpleTestCase):
+    def test_probe_runs_in_background(self):
+        chosen = threading.Event()
+        probed = threading.Event()
+
+        class DownReplicas(ReplicaSet):
+            def _probe(self, alias):
+                chosen.wait(5)
+                return None
+
+            def probe(self):
+                super().probe()
+                probed.set()
+
+        replicas = DownReplicas(['replica1'], probe_interval=60)
+        self.addCleanup(replicas.stop)
+        # Выбор не ждет проверку: до нее реплика считается доступной
+        self.assertEqual(replicas.choose(), 'replica1')
+        chosen.set()
+        self.assertTrue(probed.wait(5))
+        self.assertFalse(replicas.stats()['replica1']['healthy'])
+        self.assertIsNone(replicas.choose())
@@ -0,0 +1,220 @@
+"""
+Уменьшенные копии изображений (превью и средний размер).
+
+Копии строятся в пуле процессов (ProcessPoolExecutor), чтобы декодирование
+и масштабирование не занимали поток запроса и не упирались в GIL, и
+хранятся на диске в MEDIA_ROOT/derivatives/<размер>/ab/cd/<sha256>.jpg.
+После записи перевала задания ставятся в пул сразу; если копии еще нет
+при чтении, она строится по запросу с ожиданием не дольше WAIT_SECONDS.
+
+Pillow - необязательная зависимость: без него копии не строятся, и на
+месте копии отдается исходное изображение. Такой ответ не кэшируется:
+копия может появиться при следующем запросе.
+
+Если процесс пула упал (BrokenProcessPool), пул пересоздается.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+
+from django.conf import settings
+
+from .blob_store import get_blob_store
+
+try:
+    from PIL import Image as PILImage
+    from PIL import ImageOps
+except ImportError:
+    PILImage = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+RENDITION_MIME_TYPE = 'image/jpeg'
+
+DEFAULT_OPTIONS = {
+    'ENABLED': True,
+    # Имя размера -> наибольшая сторона в пикселях
+    'SIZES': {'thumb': 200, 'medium': 800},
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ON_UPLOAD': True,
+    'WAIT_SECONDS': 10,
+}
+
+
+def get_options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'PEREVAL_THUMBNAILS', {})}
+
+
+def render(source, target, max_side, quality):
+    """
+    Строит уменьшенную копию source в target (JPEG).
+
+    Выполняется в процессе пула, поэтому не обращается к настройкам Django.
+    """
+    with PILImage.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                image.save(tmp, 'JPEG', quality=quality, optimize=True)
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return str(target)
+
+
+class DerivativeStore:
+    """Уменьшенные копии изображений BlobStore и пул процессов для их построения"""
+
+    def __init__(self, root, sizes, quality=80, workers=2):
+        self.root = Path(root)
+        self.sizes = sizes
+        self.quality = quality
+        self.workers = workers
+        self._executor = None
+        self._pending = {}  # (sha256, размер) -> Future
+        # RLock: add_done_callback вызывает _finished сразу, если Future уже готов
+        self._lock = threading.RLock()
+
+    def path(self, digest, size):
+        return self.root / size / digest[:2] / digest[2:4] / f'{digest}.jpg'
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют соединения с БД и потоки сервера
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _reset_executor(self, broken):
+        """Отбрасывает сломанный пул; следующее задание создаст новый"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+            self._pending.clear()
+        logger.error("Rendering process pool is broken, starting a new one")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def schedule(self, digest, size):
+        """Ставит построение копии в пул; возвращает Future или None, если копия уже есть"""
+        target = self.path(digest, size)
+        if target.exists():
+            return None
+        key = (digest, size)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                source = get_blob_store().path(digest)
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(render, str(source), str(target), self.sizes[size], self.quality)
+                except BrokenProcessPool:
+                    self._reset_executor(executor)
+                    executor = self._get_executor()
+                    future = executor.submit(render, str(source), str(target), self.sizes[size], self.quality)
+                self._pending[key] = future
+                future.add_done_callback(lambda done: self._finished(key, done, executor))
+        return future
+
+    def _finished(self, key, future, executor):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Failed to render {key[1]} for image {key[0]}: {error}")
+            if isinstance(error, BrokenProcessPool):
+                self._reset_executor(executor)
+
+    def get(self, digest, size, timeout):
+        """Путь к копии; строит ее при необходимости. None, если копию получить не удалось"""
+        target = self.path(digest, size)
+        if target.exists():
+            return target
+        try:
+            future = self.schedule(digest, size)
+            if future is not None:
+                future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.warning(f"Rendering {size} for image {digest} takes longer than {timeout}s")
+            return None
+        except Exception as e:
+            logger.error(f"Failed to render {size} for image {digest}: {e}")
+            return None
+        return target if target.exists() else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_derivative_store():
+    """Хранилище копий в MEDIA_ROOT/derivatives или None, если копии отключены"""
+    global _store
+    options = get_options()
+    if PILImage is None or not options['ENABLED']:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DerivativeStore(
+                    Path(settings.MEDIA_ROOT) / 'derivatives',
+                    options['SIZES'],
+                    quality=options['QUALITY'],
+                    workers=options['WORKERS'],
+                )
+    return _store
+
+
+def rendition_sizes():
+    """Имена доступных размеров копий"""
+    return list(get_options()['SIZES'])
+
+
+def schedule_renditions(digests):
+    """Ставит в очередь построение всех копий новых изображений (если включено ON_UPLOAD)"""
+    store = get_derivative_store()
+    if store is None or not get_options()['ON_UPLOAD']:
+        return
+    for digest in digests:
+        if not digest:
+            continue
+        for size in store.sizes:
+            try:
+                store.schedule(digest, size)
+            except Exception as e:
+                logger.error(f"Cannot schedule {size} for image {digest}: {e}")
+
+
+def rendition_path(digest, size):
+    """Путь к копии размера size или None (тогда отдается исходное изображение)"""
+    store = get_derivative_store()
+    if store is None or not digest:
+        return None
+    return store.get(digest, size, get_options()['WAIT_SECONDS'])
+
+
+def read_rendition(digest, size):
+    """Байты копии размера size или None"""
+    path = rendition_path(digest, size)
+    if path is None:
+        return None
+    return path.read_bytes()
@@ -1,6 +1,18 @@
 from django.urls import path
-from .views import SubmitDataView
+from .views import (
+    AsyncSubmitDataView, ImageDataView, IngestStatsView, IngestStatusView, ModerationClaimView, ModerationStatusView,
+    PerevalDetailView, PerevalSearchView, SubmitBulkView, SubmitDataView,
+)
 
 urlpatterns = [
     path('submitData/', SubmitDataView.as_view(), name='submit-data'),
+    path('submitData/async/', AsyncSubmitDataView.as_view(), name='submit-data-async'),
+    path('submitData/bulk/', SubmitBulkView.as_view(), name='submit-data-bulk'),
+    path('submitData/status/<str:tracking_id>/', IngestStatusView.as_view(), name='submit-data-status'),
+    path('submitData/<int:pk>/', PerevalDetailView.as_view(), name='pereval-detail'),
+    path('images/<int:pk>/', ImageDataView.as_view(), name='image-data'),
+    path('perevals/search/', PerevalSearchView.as_view(), name='pereval-search'),
+    path('ingest/stats/', IngestStatsView.as_view(), name='ingest-stats'),
+    path('moderation/claim/', ModerationClaimView.as_view(), name='moderation-claim'),
+    path('moderation/<int:pk>/', ModerationStatusView.as_view(), name='moderation-status'),
 ]
\ No newline at end of file
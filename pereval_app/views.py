@@ -1,30 +1,222 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import generics, status
 import json
 import logging
+import os
 
-from .serializers import PerevalSerializer
+from .blob_store import DEFAULT_MIME_TYPE, decode_image, get_blob_store
+from .pagination import KeysetPagination
+from .repository import PerevalRepository
+from .serializers import (
+    ModerationClaimSerializer, ModerationStatusSerializer, PerevalListSerializer, PerevalSearchSerializer,
+    PerevalSerializer,
+)
+from .async_processor import AsyncPerevalDataProcessor
 from .data_processor import PerevalDataProcessor
+from .db_router import use_primary
+from .idempotency import (
+    IN_PROGRESS, MAX_KEY_LENGTH, MISMATCH, REPLAY, IdempotencyStore, request_fingerprint,
+)
+from .image_validation import ImageValidationError
+from .ingest import QueueFull, get_ingest_queue, ingest_enabled
+from .metrics import SUBMIT_RESULTS, redact_payload, render_prometheus, span
+from .response_cache import CachedResponse, get_response_cache, make_etag
+from .spatial_search import COMPACT_FIELDS, search_bbox, search_nearest
+from .streaming import StreamingParseError, parse_submit_stream
+from .thumbnails import RENDITION_MIME_TYPE, rendition_path, rendition_sizes
 
 logger = logging.getLogger(__name__)
 
 
-class SubmitDataView(APIView):
+class SubmitDataView(generics.ListAPIView):
     """
     API endpoint для добавления данных о перевале
-    POST /submitData/
+    POST /submitData/  (необязательный заголовок Idempotency-Key для безопасных повторов;
+    в режиме отложенной записи ответ 202 с tracking_id)
+
+    и списка перевалов пользователя (без содержимого изображений)
+    GET /submitData/?user__email=<email>&cursor=<курсор>&limit=<размер страницы>
+    GET /submitData/?status=pending (для модераторов)
+
+    Список содержит контакты пользователей, поэтому без user__email он
+    доступен только модераторам (is_staff)
     """
 
+    queryset = PerevalRepository().list_queryset()
+    serializer_class = PerevalListSerializer
+    pagination_class = KeysetPagination
+    filterset_fields = ['user__email', 'status']
+
+    def get(self, request, *args, **kwargs):
+        if not request.query_params.get('user__email') and not request.user.is_staff:
+            return Response({
+                "status": 400,
+                "message": "Не указан параметр user__email",
+                "id": None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return super().get(request, *args, **kwargs)
+
+    def _read_payload(self, request):
+        """
+        Тело запроса. Большие JSON-тела разбираются потоково: изображения
+        сразу пишутся в хранилище и не держатся в памяти целиком
+        """
+        threshold = settings.PEREVAL_STREAMING_THRESHOLD
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        content_type = request.content_type.split(';')[0].strip()
+        if threshold is not None and content_length >= threshold and content_type == 'application/json':
+            return parse_submit_stream(request.stream)
+        return request.data
+
     def post(self, request):
+        with span('total'):
+            response = self._post(request)
+        SUBMIT_RESULTS.inc(endpoint='submit', status=response.status_code)
+        return response
+
+    def _post(self, request):
+        try:
+            with span('parse'):
+                payload = self._read_payload(request)
+
+        except ImageValidationError as e:
+            logger.error(f"Invalid image in request: {e}")
+            return Response({
+                "status": 400,
+                "message": "Bad Request",
+                "id": None,
+                "errors": {"images": [str(e)]}
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        except (json.JSONDecodeError, StreamingParseError):
+            logger.error("Invalid JSON in request")
+            return Response({
+                "status": 400,
+                "message": "Invalid JSON format",
+                "id": None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            return Response({
+                "status": 500,
+                "message": "Internal server error",
+                "id": None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return self._submit(payload)
+        return self._submit_idempotent(key, payload)
+
+    def _submit_idempotent(self, key, payload):
+        """
+        Отправка с ключом идемпотентности: повтор запроса с тем же ключом
+        получает сохраненный ответ, а перевал не создается второй раз
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({
+                "status": 400,
+                "message": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters long",
+                "id": None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        store = IdempotencyStore()
+        request_hash = request_fingerprint(payload)
+        try:
+            claim = store.claim(key, request_hash)
+        except Exception as e:
+            logger.error(f"Idempotency key claim failed: {e}")
+            return Response({
+                "status": 500,
+                "message": "Internal server error",
+                "id": None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if claim.state == REPLAY:
+            response = Response(claim.response, status=claim.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        if claim.state == IN_PROGRESS:
+            return Response({
+                "status": 409,
+                "message": "Запрос с этим Idempotency-Key еще выполняется",
+                "id": None
+            }, status=status.HTTP_409_CONFLICT)
+        if claim.state == MISMATCH:
+            return Response({
+                "status": 422,
+                "message": "Idempotency-Key уже использован с другим телом запроса",
+                "id": None
+            }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        response = self._submit(payload)
+        try:
+            if response.status_code >= 500:
+                # Ошибку сервера не запоминаем: клиент повторит запрос с тем же ключом
+                store.release(key, request_hash, claim.lease)
+            else:
+                store.complete(key, request_hash, claim.lease, response.status_code, response.data)
+        except Exception as e:
+            logger.error(f"Failed to save idempotent response for key {key}: {e}")
+        return response
+
+    def _enqueue(self, data):
+        """
+        Режим отложенной записи (PEREVAL_INGEST['ENABLED']): отчет ставится
+        в очередь и записывается в БД командой drain_ingest
+        """
         try:
-            # Логируем входящий запрос
-            logger.info(f"Incoming request data: {request.data}")
+            params = PerevalDataProcessor()._submit_params(data, data['user'])
+        except ValueError as e:
+            return Response({
+                "status": 400,
+                "message": str(e),
+                "id": None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            tracking_id = get_ingest_queue().enqueue(params)
+        except QueueFull as e:
+            logger.warning(f"Rejecting submit: {e}")
+            response = Response({
+                "status": 503,
+                "message": "Очередь записи переполнена, повторите запрос позже",
+                "id": None
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '30'
+            return response
+
+        response = Response({
+            "status": 202,
+            "message": "Принято в обработку",
+            "id": None,
+            "tracking_id": tracking_id
+        }, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('submit-data-status', args=[tracking_id])
+        return response
+
+    def _submit(self, payload):
+        try:
+            # Логируем входящий запрос без изображений и контактов
+            logger.info(f"Incoming request data: {redact_payload(payload)}")
 
             # Валидация данных
-            serializer = PerevalSerializer(data=request.data)
+            serializer = PerevalSerializer(data=payload)
+            with span('validate'):
+                valid = serializer.is_valid()
 
-            if not serializer.is_valid():
+            if not valid:
                 logger.error(f"Validation errors: {serializer.errors}")
                 return Response({
                     "status": 400,
@@ -34,6 +226,8 @@ class SubmitDataView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
 
             # Обработка данных
+            if ingest_enabled():
+                return self._enqueue(serializer.validated_data)
             processor = PerevalDataProcessor()
             result = processor.submit_data(serializer.validated_data)
 
@@ -57,18 +251,508 @@ class SubmitDataView(APIView):
                     "id": None
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON in request")
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
             return Response({
+                "status": 500,
+                "message": "Internal server error",
+                "id": None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncSubmitDataView(View):
+    """
+    Асинхронный вариант API endpoint для добавления данных о перевале
+    POST /submitData/async/
+
+    Под ASGI ожидание БД не занимает поток (AsyncPerevalDataProcessor).
+    Формат запроса и ответа тот же, что у POST /submitData/
+    """
+
+    async def post(self, request):
+        with span('total'):
+            response = await self._post(request)
+        SUBMIT_RESULTS.inc(endpoint='async', status=response.status_code)
+        return response
+
+    async def _post(self, request):
+        try:
+            with span('parse'):
+                payload = json.loads(request.body)
+        except ValueError:
+            logger.error("Invalid JSON in request")
+            return JsonResponse({
                 "status": 400,
                 "message": "Invalid JSON format",
                 "id": None
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        serializer = PerevalSerializer(data=payload)
+        with span('validate'):
+            valid = serializer.is_valid()
+        if not valid:
+            logger.error(f"Validation errors: {serializer.errors}")
+            return JsonResponse({
+                "status": 400,
+                "message": "Bad Request",
+                "id": None,
+                "errors": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST, json_dumps_params={'ensure_ascii': False})
+
+        result = await AsyncPerevalDataProcessor().submit_data(serializer.validated_data)
+        return JsonResponse(result, status=result["status"], json_dumps_params={'ensure_ascii': False})
+
+
+class SubmitBulkView(APIView):
+    """
+    API endpoint для пакетной отправки перевалов (синхронизация офлайн-отчетов)
+    POST /submitData/bulk/
+
+    Тело - JSON-массив отчетов или NDJSON (application/x-ndjson, по отчету
+    в строке). Каждый отчет проверяется отдельно, ответ содержит результат
+    для каждого отчета в порядке их следования. Если тело обрывается
+    ошибкой разбора после части отчетов, ответ содержит результаты
+    прочитанных отчетов и запись с 400 на месте ошибки. Отчеты сверх
+    MAX_REPORTS не читаются: на месте первого из них - одна запись с 413
+    """
+
+    NDJSON_TYPES = ('application/x-ndjson', 'application/jsonlines')
+
+    def _reports(self, request):
+        """Отчеты из тела запроса; NDJSON читается построчно, не целиком"""
+        content_type = request.content_type.split(';')[0].strip()
+        if content_type in self.NDJSON_TYPES:
+            for line in iter(request.stream.readline, b''):
+                if line.strip():
+                    yield json.loads(line)
+            return
+        if not isinstance(request.data, list):
+            raise ValueError("JSON array expected")
+        yield from request.data
+
+    def post(self, request):
+        options = settings.PEREVAL_BULK
+        processor = PerevalDataProcessor()
+        results = []
+        batch = []
+
+        def flush():
+            for (index, _), result in zip(batch, processor.submit_batch([data for _, data in batch])):
+                results[index] = {"index": index, **result}
+            batch.clear()
+
+        try:
+            for index, report in enumerate(self._reports(request)):
+                if index >= options['MAX_REPORTS']:
+                    # Остаток тела не читается
+                    results.append({"index": index, "status": 413,
+                                    "message": "Превышено число отчетов в запросе", "id": None})
+                    break
+                serializer = PerevalSerializer(data=report)
+                with span('validate'):
+                    valid = serializer.is_valid()
+                if not valid:
+                    results.append({"index": index, "status": 400, "message": "Bad Request",
+                                    "id": None, "errors": serializer.errors})
+                    continue
+                results.append(None)
+                batch.append((index, serializer.validated_data))
+                if len(batch) >= options['BATCH_SIZE']:
+                    flush()
+            if batch:
+                flush()
+
+        except (json.JSONDecodeError, ValueError, ParseError) as e:
+            logger.error(f"Invalid bulk request body: {e}")
+            if not results:
+                return Response({
+                    "status": 400,
+                    "message": "Invalid JSON format",
+                    "results": []
+                }, status=status.HTTP_400_BAD_REQUEST)
+            # Часть отчетов уже записана: клиент должен знать, какие именно,
+            # чтобы не отправлять их повторно. Проверенные отчеты из
+            # незаписанного пакета записываются, на месте ошибки - запись с 400
+            try:
+                if batch:
+                    flush()
+            except Exception as flush_error:
+                logger.error(f"Unexpected error: {flush_error}")
+                return Response({
+                    "status": 500,
+                    "message": "Internal server error",
+                    "results": [result for result in results if result is not None]
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            results.append({"index": len(results), "status": 400,
+                            "message": "Invalid JSON format", "id": None})
+
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
             return Response({
                 "status": 500,
                 "message": "Internal server error",
-                "id": None
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+                "results": [result for result in results if result is not None]
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        for result in results:
+            SUBMIT_RESULTS.inc(endpoint='bulk', status=result["status"])
+        accepted = sum(1 for result in results if result["status"] == 200)
+        return Response({
+            "status": 200,
+            "message": f"Принято отчетов: {accepted} из {len(results)}",
+            "results": results
+        }, status=status.HTTP_200_OK)
+
+
+class IngestStatusView(APIView):
+    """
+    API endpoint для отслеживания отчета, принятого в режиме отложенной записи
+    GET /submitData/status/<tracking_id>/
+
+    state: queued, processing, done (id - номер перевала) или failed (error)
+    """
+
+    def get(self, request, tracking_id):
+        info = get_ingest_queue().status(tracking_id) if ingest_enabled() else None
+        if info is None:
+            return Response({
+                "status": 404,
+                "message": "Отчет не найден",
+                "tracking_id": tracking_id
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response({"status": 200, **info}, status=status.HTTP_200_OK)
+
+
+class IngestStatsView(APIView):
+    """
+    API endpoint с метриками очереди отложенной записи
+    GET /ingest/stats/
+    """
+
+    def get(self, request):
+        # Без отложенной записи очереди нет: файл SQLite не создается
+        if not ingest_enabled():
+            return Response({
+                "status": 404,
+                "message": "Отложенная запись отключена"
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response(get_ingest_queue().stats(), status=status.HTTP_200_OK)
+
+
+class MetricsView(View):
+    """
+    Метрики производительности в формате Prometheus
+    GET /metrics
+    """
+
+    def get(self, request):
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def etag_matches(request, etag):
+    """Проверка заголовка If-None-Match"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+class PerevalDetailView(APIView):
+    """
+    API endpoint для получения данных о перевале
+    GET /submitData/<id>/?size=thumb|medium|full
+    GET /submitData/<id>/?images=meta
+
+    size выбирает уменьшенные копии изображений (по умолчанию full -
+    исходные). images=meta вместо содержимого изображений возвращает их
+    метаданные и ссылки на GET /images/<id>/, так что размер ответа не
+    зависит от числа фотографий. Готовый JSON кэшируется отдельно для
+    каждого варианта и отдается с ETag; клиент может проверить
+    актуальность своей копии через If-None-Match и получить 304
+    """
+
+    def get(self, request, pk):
+        size = request.query_params.get('size', 'full')
+        image_mode = request.query_params.get('images', 'data')
+        if size != 'full' and size not in rendition_sizes():
+            return Response({
+                "status": 400,
+                "message": f"Unknown image size {size!r}",
+                "id": pk
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if image_mode not in ('data', 'meta'):
+            return Response({
+                "status": 400,
+                "message": f"Unknown images mode {image_mode!r}",
+                "id": pk
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        variant = 'meta' if image_mode == 'meta' else size
+        cache = get_response_cache()
+        cached, generation = cache.lookup(pk, variant)
+
+        fallback = False
+        if cached is None:
+            processor = PerevalDataProcessor()
+            # Ответ попадет в кэш и будет отдаваться до следующего изменения
+            # перевала: отставшая реплика закрепила бы в нем старые данные
+            with use_primary():
+                record = processor.get_pereval_by_id(pk, None if size == 'full' else size, image_mode)
+            if record is None:
+                return Response({
+                    "status": 404,
+                    "message": "Перевал не найден",
+                    "id": pk
+                }, status=status.HTTP_404_NOT_FOUND)
+            body = json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+            fallback = processor.rendition_fallback
+            if fallback:
+                # Вместо части копий - исходные изображения: ответ не кэшируется,
+                # следующий запрос получит копии, когда они будут готовы
+                cached = CachedResponse(body, make_etag(body))
+            else:
+                cached = cache.store(pk, variant, generation, body)
+
+        if etag_matches(request, cached.etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(cached.body, content_type='application/json')
+        response['ETag'] = cached.etag
+        response['Cache-Control'] = 'no-store' if fallback else 'no-cache'
+        return response
+
+
+def parse_range(header, length):
+    """
+    Разбирает заголовок Range для одного диапазона байт.
+
+    Возвращает (start, end) включительно, None - если заголовка нет или он
+    не поддерживается (отдается весь файл), или 'unsatisfiable'.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, sep, end = header[len('bytes='):].strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not start:
+            # bytes=-N: последние N байт
+            suffix = int(end)
+            if suffix <= 0 or length == 0:
+                # У пустого файла нет ни одного байта для диапазона
+                return 'unsatisfiable'
+            return max(length - suffix, 0), length - 1
+        start = int(start)
+        end = int(end) if end else None
+    except ValueError:
+        return None
+    if end is not None and end < start:
+        # Синтаксически неверный диапазон игнорируется (RFC 9110)
+        return None
+    if start >= length:
+        return 'unsatisfiable'
+    return start, length - 1 if end is None else min(end, length - 1)
+
+
+def iter_file(path, start, length, chunk_size=64 * 1024):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+class ImageDataView(APIView):
+    """
+    API endpoint с содержимым изображения
+    GET /images/<id>/?size=thumb|medium|full
+
+    Файл отдается потоком с Content-Length; поддерживаются Range (один
+    диапазон), ETag/If-None-Match и кэширование на стороне клиента
+    """
+
+    def get(self, request, pk):
+        size = request.query_params.get('size', 'full')
+        if size != 'full' and size not in rendition_sizes():
+            return Response({
+                "status": 400,
+                "message": f"Unknown image size {size!r}",
+                "id": pk
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        repository = PerevalRepository()
+        image = repository.image_source(pk)
+        if image is None:
+            return Response({
+                "status": 404,
+                "message": "Изображение не найдено",
+                "id": pk
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        digest = image['sha256']
+        if not digest:
+            # Старая запись с base64 в pereval_image.data
+            legacy = repository.legacy_image_data([pk]).get(pk)
+            try:
+                data, mime_type = decode_image(legacy or '')
+            except ValueError as e:
+                logger.warning(f"Image {pk} has unreadable legacy data: {e}")
+                return Response({
+                    "status": 404,
+                    "message": "Изображение не найдено",
+                    "id": pk
+                }, status=status.HTTP_404_NOT_FOUND)
+            response = HttpResponse(data, content_type=mime_type)
+            response['Cache-Control'] = 'private, max-age=3600'
+            return response
+
+        path = rendition_path(digest, size) if size != 'full' else None
+        # Копию получить не удалось - отдается исходное изображение
+        fallback = size != 'full' and path is None
+        if path is not None:
+            etag, mime_type = f'"{digest}-{size}"', RENDITION_MIME_TYPE
+        else:
+            path = get_blob_store().path(digest)
+            etag, mime_type = f'"{digest}"', image['mime_type'] or DEFAULT_MIME_TYPE
+
+        if etag_matches(request, etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            try:
+                length = os.path.getsize(path)
+            except OSError:
+                logger.error(f"Image {pk} is missing from the blob store ({digest})")
+                return Response({
+                    "status": 404,
+                    "message": "Изображение не найдено",
+                    "id": pk
+                }, status=status.HTTP_404_NOT_FOUND)
+
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), length)
+            if byte_range == 'unsatisfiable':
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{length}'
+                return response
+            start, end = byte_range or (0, length - 1)
+            response = StreamingHttpResponse(iter_file(path, start, end - start + 1), content_type=mime_type)
+            response['Content-Length'] = str(end - start + 1)
+            if byte_range is not None:
+                response.status_code = status.HTTP_206_PARTIAL_CONTENT
+                response['Content-Range'] = f'bytes {start}-{end}/{length}'
+        response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        if fallback:
+            # Исходное изображение вместо копии не должно остаться в кэшах по адресу копии
+            response['Cache-Control'] = 'no-store'
+        else:
+            # Изображения не меняются: id и содержимое связаны навсегда
+            response['Cache-Control'] = 'public, max-age=86400'
+        return response
+
+
+class PerevalSearchView(APIView):
+    """
+    API endpoint для поиска перевалов на карте
+    GET /perevals/search/?bbox=min_lon,min_lat,max_lon,max_lat&min_height=&max_height=&limit=
+    GET /perevals/search/?near=lat,lon&k=10
+
+    Ответ компактный: имена полей один раз в "fields", строки - массивами в "items"
+    """
+
+    def get(self, request):
+        serializer = PerevalSearchSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({
+                "status": 400,
+                "message": "Bad Request",
+                "errors": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        params = serializer.validated_data
+        heights = {'min_height': params.get('min_height'), 'max_height': params.get('max_height')}
+        if 'near' in params:
+            fields = COMPACT_FIELDS + ['distance_km']
+            items = search_nearest(*params['near'], k=params['k'], **heights)
+        else:
+            fields = COMPACT_FIELDS
+            items = search_bbox(params.get('bbox'), limit=params['limit'], **heights)
+        return Response({"fields": fields, "items": items}, status=status.HTTP_200_OK)
+
+
+class ModerationClaimView(APIView):
+    """
+    API endpoint для получения модератором пачки новых перевалов
+    POST /moderation/claim/  {"limit": 10}
+
+    Выданные перевалы переходят в статус pending и не выдаются другим модераторам.
+    Доступно только модераторам (is_staff)
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = ModerationClaimSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                "status": 400,
+                "message": "Bad Request",
+                "errors": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        perevals = PerevalDataProcessor().claim_for_moderation(serializer.validated_data['limit'])
+        if perevals is None:
+            return Response({
+                "status": 500,
+                "message": "Internal server error"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            "status": 200,
+            "message": f"Выдано перевалов: {len(perevals)}",
+            "perevals": perevals
+        }, status=status.HTTP_200_OK)
+
+
+class ModerationStatusView(APIView):
+    """
+    API endpoint для завершения модерации перевала
+    POST /moderation/<id>/  {"status": "accepted" | "rejected" | "new"}
+    Доступно только модераторам (is_staff)
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        serializer = ModerationStatusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                "status": 400,
+                "message": "Bad Request",
+                "id": pk,
+                "errors": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        updated = PerevalDataProcessor().set_moderation_status(pk, serializer.validated_data['status'])
+        if updated is None:
+            return Response({
+                "status": 500,
+                "message": "Internal server error",
+                "id": pk
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if not updated:
+            return Response({
+                "status": 409,
+                "message": "Перевал не находится на модерации",
+                "id": pk
+            }, status=status.HTTP_409_CONFLICT)
+
+        return Response({
+            "status": 200,
+            "message": "Статус обновлен",
+            "id": pk
+        }, status=status.HTTP_200_OK)
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'pereval_app',
     'rest_framework',
+    'django_filters',
 
 ]
 
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'pereval_app.db_router.StickyPrimaryMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -77,8 +79,8 @@ WSGI_APPLICATION = 'pereval_project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'pereval',
+        'ENGINE': 'pereval_app.db_backend',
+        'NAME': os.getenv('FSTR_DB_NAME', 'pereval'),
         'USER': os.getenv('FSTR_DB_LOGIN'),
         'PASSWORD': os.getenv('FSTR_DB_PASS'),
         'HOST': os.getenv('FSTR_DB_HOST'),
@@ -86,6 +88,44 @@ DATABASES = {
     }
 }
 
+# Общий пул соединений для ORM и PerevalDataProcessor (pereval_app.db_pool)
+DB_POOL = {
+    'MAX_SIZE': int(os.getenv('FSTR_DB_POOL_SIZE', '10')),
+    'TIMEOUT': float(os.getenv('FSTR_DB_POOL_TIMEOUT', '30')),
+    'CHECK_INTERVAL': float(os.getenv('FSTR_DB_POOL_CHECK_INTERVAL', '30')),
+}
+
+# Реплики для чтения (pereval_app.db_router): FSTR_DB_REPLICA_HOSTS - хосты
+# через запятую (host или host:port), остальные параметры как у default.
+# connect_timeout - чтобы недоступная реплика не задерживала надолго ни
+# проверку, ни чтение до исключения реплики
+for _number, _host in enumerate(filter(None, os.getenv('FSTR_DB_REPLICA_HOSTS', '').split(',')), 1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica{_number}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'OPTIONS': {
+            **DATABASES['default'].get('OPTIONS', {}),
+            'connect_timeout': int(os.getenv('FSTR_DB_REPLICA_CONNECT_TIMEOUT', '2')),
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['pereval_app.db_router.PrimaryReplicaRouter']
+
+# STRATEGY - round_robin или least_latency. Реплика, отставшая больше
+# MAX_LAG_SECONDS, не используется; после изменения данных клиент читает с
+# default еще STICKY_SECONDS секунд (cookie COOKIE)
+PEREVAL_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'STRATEGY': os.getenv('FSTR_DB_REPLICA_STRATEGY', 'round_robin'),
+    'PROBE_INTERVAL': 5.0,
+    'MAX_LAG_SECONDS': 10.0,
+    'STICKY_SECONDS': 10,
+    'COOKIE': 'pereval_primary',
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -93,6 +133,79 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# Тела POST /api/submitData/ не меньше этого размера (в байтах) разбираются
+# потоково, с записью изображений сразу в хранилище. None отключает режим.
+PEREVAL_STREAMING_THRESHOLD = 1024 * 1024
+
+# Кэш JSON-ответов GET /api/submitData/<id>/ (pereval_app.response_cache).
+# BACKEND - псевдоним из CACHES для общего между процессами кэша или None.
+# Без общего BACKEND инвалидация видна только своему процессу, и другие
+# процессы отдают устаревший ответ до TIMEOUT секунд, поэтому при
+# ENABLED: None кэш включается только с общим BACKEND (не LocMemCache).
+# ENABLED: True - включить и без него (один процесс), False - выключить.
+PEREVAL_RESPONSE_CACHE = {
+    'ENABLED': None,
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'BACKEND': None,
+    'TIMEOUT': 300,
+    'MAX_GENERATIONS': 100_000,
+}
+
+# Ограничения на загружаемые изображения (pereval_app.image_validation)
+PEREVAL_IMAGE_LIMITS = {
+    'MAX_BYTES': 20 * 1024 * 1024,
+    'MAX_PIXELS': 80_000_000,
+    'TYPES': ['image/jpeg', 'image/png', 'image/webp'],
+}
+
+# Уменьшенные копии изображений (pereval_app.thumbnails, нужен Pillow):
+# имя размера -> наибольшая сторона в пикселях. Копии лежат в MEDIA_ROOT/derivatives
+PEREVAL_THUMBNAILS = {
+    'ENABLED': True,
+    'SIZES': {'thumb': 200, 'medium': 800},
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ON_UPLOAD': True,
+    'WAIT_SECONDS': 10,
+}
+
+# Сколько секунд хранится ответ на запрос с заголовком Idempotency-Key
+PEREVAL_IDEMPOTENCY_TTL = 24 * 60 * 60
+# Сколько секунд ключ остается занятым запросом без ответа. Должно быть
+# больше времени обработки запроса, иначе медленный запрос выполнится дважды
+PEREVAL_IDEMPOTENCY_LOCK_SECONDS = 60
+
+# Сколько пар email -> id пользователя держать в памяти процесса
+PEREVAL_USER_CACHE_SIZE = 10_000
+# и наборов сезон -> id уровня сложности (справочник загружается целиком)
+PEREVAL_LEVEL_CACHE_SIZE = 10_000
+
+# Серверные prepared statements для запросов PerevalDataProcessor
+# (pereval_app.prepared); выключить за pgbouncer в режиме transaction
+PEREVAL_PREPARED_STATEMENTS = True
+
+# Максимальная длина тела отчета в логе (изображения и контакты скрываются)
+PEREVAL_LOG_PAYLOAD_CHARS = 2000
+
+# Отложенная запись (pereval_app.ingest): при ENABLED POST /api/submitData/
+# отвечает 202, а отчеты записывает в БД команда drain_ingest.
+# PATH - файл очереди SQLite на локальном диске (по умолчанию ingest/queue.sqlite3)
+PEREVAL_INGEST = {
+    'ENABLED': os.getenv('FSTR_INGEST_ENABLED', '') == '1',
+    'PATH': None,
+    'BATCH_SIZE': 50,
+    'MAX_DEPTH': 10_000,
+    'MAX_ATTEMPTS': 5,
+    'LEASE_SECONDS': 60,
+    'RETENTION_SECONDS': 7 * 24 * 60 * 60,
+}
+
+# POST /api/submitData/bulk/: отчетов в одной транзакции и всего в запросе
+PEREVAL_BULK = {
+    'BATCH_SIZE': 50,
+    'MAX_REPORTS': 1000,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
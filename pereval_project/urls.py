@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from pereval_app.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('pereval_app.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file